@@ -1,41 +1,29 @@
-import numpy as np
 import nicenquickplotlib as nq
-import uncertainties as unc
 
 import directories as DIRS
+from utils.results_catalog import results_catalog
 
-MEASUREMENTS_TO_COMPARE = [
-	'../RVD_measurements/181220C',
-	'../RVD_measurements/181221A',
-	'../RVD_measurements/181221B',
-	# ~ '../RVD_measurements/181226A',
-	'../RVD_measurements/181226B',
-	'../RVD_measurements/181226C',
-	'../RVD_measurements/181226D',
-	]
-LABELS = [
-	'181220C',
-	'181221A',
-	'181221B',
-	# ~ '181226A',
-	'181226B',
-	'181226C',
-	'181226C',
-	]
+CAMPAIGNS_TO_COMPARE = None # List of campaigns in the results catalog (see "DIRS.read_campaign", older ones are added with "import_campaigns.py"), None compares all of them.
+LABELS = None # One per campaign, by default the names of the campaigns.
 
+catalog = results_catalog(DIRS.RESULTS_CATALOG_FILE)
+campaigns = [campaign for campaign, _, _, _ in catalog.campaigns()] if CAMPAIGNS_TO_COMPARE is None else CAMPAIGNS_TO_COMPARE
+labels = campaigns if LABELS is None else LABELS
 freqs = []
 ratios = []
 phases = []
-for k in range(len(MEASUREMENTS_TO_COMPARE)):
-	data = np.genfromtxt(MEASUREMENTS_TO_COMPARE[k] + '/' + DIRS.TRANSFERENCE_RESULTS_DIR + '/' + 'transference_dataset1.csv')
-	data = data.transpose()
-	freqs.append(data[0])
-	ratios.append(unc.unumpy.uarray(data[1], data[2]))
-	data = np.genfromtxt(MEASUREMENTS_TO_COMPARE[k] + '/' + DIRS.TRANSFERENCE_RESULTS_DIR + '/' + 'transference_dataset2.csv')
-	data = data.transpose()
-	phases.append(unc.unumpy.uarray(data[1], data[2]))
+legend = []
+for k in range(len(campaigns)):
+	frequencies, T_abs, T_phi, _ = catalog.transference(campaigns[k])
+	if len(frequencies) == 0: # E.g. a campaign measured only in AC mode.
+		continue
+	freqs.append(frequencies)
+	ratios.append(T_abs.to_uarray())
+	phases.append(T_phi.to_uarray())
+	legend.append(labels[k])
+catalog.close()
 
-nq.plot(freqs, ratios, xscale='L', marker='.', legend=LABELS, xlabel='Frequency (Hz)', ylabel='Ratio')
-nq.plot(freqs, phases, xscale='L', marker='.', legend=LABELS, xlabel='Frequency (Hz)', ylabel='Phase (rad)')
+nq.plot(freqs, ratios, xscale='L', marker='.', legend=legend, xlabel='Frequency (Hz)', ylabel='Ratio')
+nq.plot(freqs, phases, xscale='L', marker='.', legend=legend, xlabel='Frequency (Hz)', ylabel='Phase (rad)')
 nq.save_all()
 nq.show()
@@ -1,32 +1,30 @@
-import numpy as np
 import nicenquickplotlib as nq
-import uncertainties as unc
 
-MEASUREMENTS_TO_COMPARE = [
-	# ~ '../RVD_measurements/AC_mode/20190103112716474009',
-	'../RVD_measurements/AC_mode/20190103114910874635',
-	'../RVD_measurements/AC_mode/20190103130458050521',
-	]
-LABELS = [
-	# ~ '190103A',
-	'190103B',
-	'190103C',
-	]
+import directories as DIRS
+from utils.results_catalog import results_catalog
 
+CAMPAIGNS_TO_COMPARE = None # List of campaigns in the results catalog (see "DIRS.read_campaign", older ones are added with "import_campaigns.py"), None compares all of them.
+LABELS = None # One per campaign, by default the names of the campaigns.
+
+catalog = results_catalog(DIRS.RESULTS_CATALOG_FILE)
+campaigns = [campaign for campaign, _, _, _ in catalog.campaigns()] if CAMPAIGNS_TO_COMPARE is None else CAMPAIGNS_TO_COMPARE
+labels = campaigns if LABELS is None else LABELS
 freqs = []
 ratios = []
-for k in range(len(MEASUREMENTS_TO_COMPARE)):
-	current_timestamp = MEASUREMENTS_TO_COMPARE[k]
-	current_timestamp = current_timestamp[current_timestamp.rfind('/')+1:]
-	data = np.genfromtxt(MEASUREMENTS_TO_COMPARE[k] + '/' + current_timestamp + '_' + 'transference_dataset1.csv')
-	data = data.transpose()
-	freqs.append(data[0])
-	ratios.append(unc.unumpy.uarray(data[1], data[2]))
+legend = []
+for k in range(len(campaigns)):
+	frequencies, T_abs, _, _ = catalog.transference(campaigns[k], mode='AC')
+	if len(frequencies) == 0: # The campaign has no AC mode measurements.
+		continue
+	freqs.append(frequencies)
+	ratios.append(T_abs.to_uarray())
+	legend.append(labels[k])
+catalog.close()
 
 nq.plot(freqs, ratios, 
 	xscale = 'L', 
 	marker = '.', 
-	legend = LABELS, 
+	legend = legend, 
 	xlabel = 'Frequency (Hz)', 
 	ylabel = 'Ratio',
 	title = 'AC mode trensferences comparison')
@@ -1,5 +1,7 @@
 import os
 
+from utils.timestamp import generate_timestamp
+
 # Main directory for the current measurement:
 CURRENT_MEASUREMENT_DIR = 'current_measurement'
 CURRENT_MEASUREMENT_PATH = CURRENT_MEASUREMENT_DIR + '/'
@@ -22,6 +24,13 @@ TRANSFERENCE_RESULTS_PATH = CURRENT_MEASUREMENT_PATH + TRANSFERENCE_RESULTS_DIR
 CONFIG_FILE_SUFFIX = '_config.txt'
 SAMPLES_FILE_SUFFIX = '_samples.txt'
 TRANSFERENCE_FILE_SUFFIX = '_transference.txt'
+BURST_FILE_SUFFIX = '_burst.bin' # See "utils/burst_file.py".
+
+JOB_QUEUE_FILE = CURRENT_MEASUREMENT_PATH + 'jobs.sqlite' # See "utils/job_queue.py".
+TRANSFERENCE_AGGREGATE_FILE = CURRENT_MEASUREMENT_PATH + 'transference_aggregate.npz' # See "utils/transference_aggregator.py".
+CAMPAIGN_FILE = CURRENT_MEASUREMENT_PATH + 'campaign.txt' # Identifier of the current measurement in the results catalog, see "read_campaign".
+
+RESULTS_CATALOG_FILE = 'results_catalog.sqlite' # Shared by all the campaigns, see "utils/results_catalog.py".
 
 correction_transference_file = 'Resultados/1806261156 - Voltimetros midiendo solo al generador (usar esta para calcular correccion sistematica)/Transference results/' + TRANSFERENCE_FILE_SUFFIX
 
@@ -40,5 +49,15 @@ def create_directories_structure():
 		os.makedirs(CURRENTLY_PROCESSING_DATA_PATH)
 		os.makedirs(PROCESSED_DATA_PATH)
 		os.makedirs(TRIGGER_PROBLEM_FIXED_DATA_PATH)
+	if not os.path.isfile(CAMPAIGN_FILE):
+		with open(CAMPAIGN_FILE, 'w') as ofile:
+			print(generate_timestamp(), file=ofile)
+
+def read_campaign():
+	"""Identifier of the campaign of CURRENT_MEASUREMENT_PATH. It is the
+	time at which the directory was created, unless CAMPAIGN_FILE is 
+	edited (e.g. to give it a meaningful name)."""
+	with open(CAMPAIGN_FILE) as ifile:
+		return ifile.read().strip()
 
 create_directories_structure()
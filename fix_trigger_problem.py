@@ -1,60 +1,37 @@
 import os
 import numpy as np
-import nicenquickplotlib as nq
 
 import directories as DIRS
-
-def shift_and_std(a, b):
-	a,b = shift_arrays(a,b)
-	return (a-b).std()
-
-def shift_arrays(a, b):
-	"""
-	a,b --> one dimension arrays
-	'a' is shifted left and 'b' is shifted right.
-	"""
-	return a[:-1], b[1:]
+import utils.trigger_alignment as trigger_alignment
+import utils.burst_file as burst_file
+from utils.job_queue import job_queue
+
+def fix_trigger_problem(current_timestamp):
+	"""Finds the lag between the voltmeters in the burst "current_timestamp"
+	of DIRS.UNPROCESSED_DATA_PATH, writes it in its header and moves it to
+	DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH."""
+	print('Fixing trigger problem for file with timestamp ' + current_timestamp)
+	burst_file_name = DIRS.UNPROCESSED_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX
+	samples = burst_file.burst(burst_file_name).samples(aligned=False)
+	config = burst_file.read_header(burst_file_name)['config']
+	max_lag = trigger_alignment.half_period(config['generator_frequency']/config['sampling_frequency']) # The fundamental for a multisine.
+	lag = trigger_alignment.estimate_lag(samples[0], samples[1], max_lag, subsample=True) # samples[0][n] corresponds to samples[1][n+lag].
+	print('Lag between voltmeters = {:.2f} samples (the remaining {:.2f} samples are not corrected)'.format(lag, lag - np.round(lag)))
+	burst_file.update_header(burst_file_name, trigger_lag=int(np.round(lag)), trigger_lag_fraction=lag - np.round(lag)) # The samples are aligned when they are read.
+	os.rename(burst_file_name, DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX)
 
 # ----------------------------------------------------------------------
-if not os.path.isdir(DIRS.UNPROCESSED_DATA_PATH):
-	print('No data to be fixed.')
-	exit()
-if len(os.listdir(DIRS.UNPROCESSED_DATA_PATH)) == 0:
-	print('No data to be fixed.')
-	exit()
-current_timestamp = os.listdir(DIRS.UNPROCESSED_DATA_PATH)[0] # This is the file to be fixed.
-current_timestamp = current_timestamp[:current_timestamp.find('_')]
-# Read data -------------------------------
-print('Fixing trigger problem for file with timestamp ' + current_timestamp)
-samples = np.genfromtxt(DIRS.UNPROCESSED_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX, skip_header=1)
-samples = np.transpose(samples)
-
-temp = [None]*len(samples)
-for k in range(len(samples)):
-	temp[k] = np.array(samples[k])
-samples = temp.copy()
-for k in range(len(temp)):
-	temp[k] = temp[k]/temp[k].max()
-
-previous_std = (temp[0] - temp[1]).std()
-while True:
-	if previous_std > shift_and_std(temp[0], temp[1]):
-		temp[0], temp[1] = shift_arrays(temp[0], temp[1])
-		previous_std = (temp[0] - temp[1]).std()
-		samples[0], samples[1] = shift_arrays(samples[0], samples[1])
-		continue
-	elif previous_std > shift_and_std(temp[1], temp[0]):
-		temp[1], temp[0] = shift_arrays(temp[1], temp[0])
-		previous_std = (temp[0] - temp[1]).std()
-		samples[1], samples[0] = shift_arrays(samples[1], samples[0])
-		continue
-	else:
-		break
-
-with open(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX, 'w') as ofile:
-	print('Samples1 (V)\tSamples2 (V)', file=ofile)
-	for k in range(len(samples[0])):
-		print(str(samples[0][k]) + '\t' + str(samples[1][k]), file=ofile)
-os.rename(DIRS.UNPROCESSED_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX, DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX)
-os.remove(DIRS.UNPROCESSED_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX)
-
+if __name__ == '__main__':
+	jobs = job_queue(DIRS.JOB_QUEUE_FILE)
+	jobs.sync_with_directory(DIRS.UNPROCESSED_DATA_PATH, 'fix_trigger', DIRS.BURST_FILE_SUFFIX)
+	job = jobs.claim('fix_trigger')
+	if job is None:
+		print('No data to be fixed.')
+		exit()
+	current_timestamp = job[0]
+	try:
+		fix_trigger_problem(current_timestamp)
+	except Exception as e:
+		jobs.failed(current_timestamp, repr(e))
+		raise
+	jobs.advance(current_timestamp)
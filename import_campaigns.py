@@ -0,0 +1,133 @@
+import os
+import numpy as np
+
+import utils.burst_file as burst_file
+import directories as DIRS
+from utils.results_catalog import results_catalog
+
+# Script parameters ----------------------------------------------------
+CAMPAIGN_DIRECTORIES = [ # Archived "current_measurement" directories.
+	'../RVD_measurements/181220C',
+	'../RVD_measurements/181221A',
+	'../RVD_measurements/181221B',
+	'../RVD_measurements/181226A',
+	'../RVD_measurements/181226B',
+	'../RVD_measurements/181226C',
+	'../RVD_measurements/181226D',
+]
+AC_MODE_DIRECTORIES = [ # Results of "measure_in_ac_mode.py" before the results catalog.
+	'../RVD_measurements/AC_mode/20190103112716474009',
+	'../RVD_measurements/AC_mode/20190103114910874635',
+	'../RVD_measurements/AC_mode/20190103130458050521',
+]
+
+def read_transference_file(file_name):
+	"""Returns a list with a dictionary for each row of a transference
+	file (see "utils/transference_io.py"), with the columns as keys.
+	Old files have no 'T_phi.s' column."""
+	with open(file_name) as ifile:
+		lines = [line.split('\t') for line in ifile.read().splitlines() if line.strip() != '']
+	return [dict(zip(lines[0], [float(value) for value in line])) for line in lines[1:]]
+
+def campaign_rows(directory, campaign):
+	"""Rows for the results catalog (see "results_catalog.add_many") with
+	the transference of each burst in the "processed_data" directory of
+	a campaign. The configuration is read from the burst file, or from
+	the config file of the bursts measured before "utils/burst_file.py"."""
+	processed_path = os.path.join(directory, DIRS.PROCESSED_DATA_DIR)
+	rows = []
+	for file_name in sorted(os.listdir(processed_path)) if os.path.isdir(processed_path) else []:
+		if not file_name.endswith(DIRS.TRANSFERENCE_FILE_SUFFIX):
+			continue
+		timestamp = file_name[:-len(DIRS.TRANSFERENCE_FILE_SUFFIX)]
+		if os.path.isfile(os.path.join(processed_path, timestamp + DIRS.BURST_FILE_SUFFIX)):
+			raw_file_name = timestamp + DIRS.BURST_FILE_SUFFIX
+			config = burst_file.read_header(os.path.join(processed_path, raw_file_name))['config']
+		elif os.path.isfile(os.path.join(processed_path, timestamp + DIRS.CONFIG_FILE_SUFFIX)):
+			raw_file_name = timestamp + DIRS.SAMPLES_FILE_SUFFIX
+			generator_frequency, sampling_frequency, generator_amplitude = np.genfromtxt(os.path.join(processed_path, timestamp + DIRS.CONFIG_FILE_SUFFIX), skip_header=1)[:3]
+			config = {'generator_frequency': generator_frequency, 'sampling_frequency': sampling_frequency, 'generator_amplitude': generator_amplitude}
+		else:
+			print('No configuration for ' + timestamp + ' in ' + processed_path + ', skipping it')
+			continue
+		for transference in read_transference_file(os.path.join(processed_path, file_name)):
+			rows.append(dict(
+				timestamp = timestamp,
+				campaign = campaign,
+				generator_frequency = transference.get('frequency', config['generator_frequency']), # Multisine bursts have one row per tone.
+				T_abs = transference['T_abs.n'],
+				T_abs_s = transference['T_abs.s'],
+				T_phi = transference.get('T_phi.n'),
+				T_phi_s = transference.get('T_phi.s'),
+				sampling_frequency = config['sampling_frequency'],
+				generator_amplitude = config.get('generator_amplitude'),
+				number_of_samples = config.get('number_of_samples'),
+				raw_path = DIRS.PROCESSED_DATA_DIR + '/' + raw_file_name,
+			))
+	return rows
+
+def aggregated_rows(directory, campaign):
+	"""Rows for the results catalog from the transference plotted by
+	"plot_transference.py" in the "transference_results" directory of a
+	campaign whose bursts are not available. Each frequency is added as
+	a single result (with the campaign as timestamp), so the number of
+	bursts is lost."""
+	results_path = os.path.join(directory, DIRS.TRANSFERENCE_RESULTS_DIR)
+	ratio = np.atleast_2d(np.genfromtxt(os.path.join(results_path, 'transference_dataset1.csv')))
+	phase = np.atleast_2d(np.genfromtxt(os.path.join(results_path, 'transference_dataset2.csv')))
+	return [dict(
+		timestamp = campaign,
+		campaign = campaign,
+		generator_frequency = ratio[k,0],
+		T_abs = ratio[k,1],
+		T_abs_s = ratio[k,2],
+		T_phi = phase[k,1],
+		T_phi_s = phase[k,2],
+	) for k in range(len(ratio))]
+
+def import_campaign(catalog, directory):
+	"""Adds the results of an archived campaign directory to "catalog" (a
+	"results_catalog"), replacing those already there. The campaign is
+	named as in its campaign file (see "DIRS.read_campaign") or, for old
+	directories without it, as the directory. Returns the campaign and
+	the number of results."""
+	campaign_file_name = os.path.join(directory, os.path.basename(DIRS.CAMPAIGN_FILE))
+	if os.path.isfile(campaign_file_name):
+		with open(campaign_file_name) as ifile:
+			campaign = ifile.read().strip()
+	else:
+		campaign = os.path.basename(os.path.normpath(directory))
+	rows = campaign_rows(directory, campaign)
+	if len(rows) == 0:
+		rows = aggregated_rows(directory, campaign)
+	catalog.add_many(rows)
+	return campaign, len(rows)
+
+def import_AC_mode_run(catalog, directory):
+	"""Adds the results of a run of "measure_in_ac_mode.py" saved by
+	"nq.save_all" in "directory" (named as the timestamp of the run) to
+	"catalog", as a campaign of its own. Returns the campaign and the
+	number of results."""
+	run_timestamp = os.path.basename(os.path.normpath(directory))
+	data = np.atleast_2d(np.genfromtxt(os.path.join(directory, run_timestamp + '_transference_dataset1.csv')))
+	catalog.add_many([dict(
+		timestamp = run_timestamp,
+		campaign = run_timestamp,
+		generator_frequency = data[k,0],
+		T_abs = data[k,1],
+		T_abs_s = data[k,2],
+		mode = 'AC',
+	) for k in range(len(data))])
+	return run_timestamp, len(data)
+
+# ----------------------------------------------------------------------
+if __name__ == '__main__':
+	catalog = results_catalog(DIRS.RESULTS_CATALOG_FILE)
+	for directories, import_directory in [(CAMPAIGN_DIRECTORIES, import_campaign), (AC_MODE_DIRECTORIES, import_AC_mode_run)]:
+		for directory in directories:
+			if not os.path.isdir(directory):
+				print('Directory ' + directory + ' not found, skipping it')
+				continue
+			campaign, number_of_results = import_directory(catalog, directory)
+			print('Imported ' + str(number_of_results) + ' results of ' + directory + ' as campaign "' + campaign + '"')
+	catalog.close()
@@ -1,4 +1,3 @@
-import visa
 import numpy as np
 import time as tm
 import uncertainties as unc
@@ -7,16 +6,27 @@ from uncertainties import unumpy as unp
 import nicenquickplotlib as nq # https://github.com/SengerM/nicenquickplotlib
 
 import utils.HP3458A as HP3458A
+import utils.gpib_batch as gpib_batch
 import utils.fitmodel as fitmodel
+import utils.timestamp
+import directories as DIRS
+from utils.results_catalog import results_catalog
+from utils.adaptive_sweep import adaptive_sweep
 
 # Script parameters ----------------------------------------------------
+SIMULATE_INSTRUMENTS = False # If True the instruments are simulated by "utils/simulated_instruments.py" (no bench needed).
 RESET_INSTRUMENTS = True
 # MEASURING PARAMS -----------------------------------------------------
 GENERATOR_FREQUENCIES = np.logspace(np.log10(40), np.log10(100000), 2)
 GENERATOR_AMPLITUDE = 10 # Peak voltage.
 DIVIDER_RATIO = 1/10
 N_READINGS_PER_FREQUENCY = 2
+ADAPTIVE_TIME_BUDGET = None # Seconds. If not None the sweep starts with a coarse grid between the extreme GENERATOR_FREQUENCIES and then adds points where the ratio changes the most, see "utils/adaptive_sweep.py".
 # Open instruments -----------------------------------------------------
+if SIMULATE_INSTRUMENTS is True:
+	import utils.simulated_instruments as visa
+else:
+	import visa
 print('Opening instruments...')
 rm = visa.ResourceManager()
 DMM = [None]*2
@@ -41,35 +51,52 @@ for dmm in DMM:
 	dmm.write('NRDGS ' + str(N_READINGS_PER_FREQUENCY))
 	dmm.write('TARM HOLD')
 # Measure --------------------------------------------------------------
-V_in = [None]*len(GENERATOR_FREQUENCIES)
-V_out = [None]*len(V_in)
-V_in_buffer = [None]*N_READINGS_PER_FREQUENCY
-V_out_buffer = [None]*N_READINGS_PER_FREQUENCY
-for k,freq in enumerate(GENERATOR_FREQUENCIES):
+def measure_frequency(freq):
+	"""Returns the N_READINGS_PER_FREQUENCY readings of each voltmeter
+	at "freq"."""
 	print('Measuring at ' + str(freq) + ' Hz')
-	FunGen.write('USE CHANA') # Select channel A to receive subsequent commands.
-	FunGen.write('TERM OFF') # Disconnect the output from all terminals.
-	FunGen.write('IMP 0') # Select 0 Ohm output impedance mode.
-	FunGen.write('ARANGE ON') # Enable autorange.
-	FunGen.write('APPLY ACV ' + str(GENERATOR_AMPLITUDE*2)) # Apply sine output with specified amplitude.
-	FunGen.write('FREQ ' + str(freq))
-	FunGen.write('DCOFF 0') # Generator offset.
+	with gpib_batch.command_batch(FunGen, 'HP3245A') as fungen: # Each batch is sent in one transaction, skipping the settings that did not change.
+		fungen.write('USE CHANA') # Select channel A to receive subsequent commands.
+		fungen.write('TERM OFF') # Disconnect the output from all terminals.
+		fungen.write('IMP 0') # Select 0 Ohm output impedance mode.
+		fungen.write('ARANGE ON') # Enable autorange.
+		fungen.write('APPLY ACV ' + str(GENERATOR_AMPLITUDE*2)) # Apply sine output with specified amplitude.
+		fungen.write('FREQ ' + str(freq))
+		fungen.write('DCOFF 0') # Generator offset.
 	for dmm in DMM:
-		dmm.write('TARM HOLD')
-		dmm.write('ACBAND ' + str(freq*(1-.1)) + ',' + str(freq*(1+.1)))
-		dmm.write('MEM LIFO') # ENABLE READING MEMORY.
-		dmm.write('MFORMAT ASCII')
-		dmm.write('OFORMAT ASCII')
-		dmm.write('TARM AUTO')
+		with gpib_batch.command_batch(dmm, 'HP3458A') as dmm_batch:
+			dmm_batch.write('TARM HOLD')
+			dmm_batch.write('ACBAND ' + str(freq*(1-.1)) + ',' + str(freq*(1+.1)))
+			dmm_batch.write('MEM LIFO') # ENABLE READING MEMORY.
+			dmm_batch.write('MFORMAT ASCII')
+			dmm_batch.write('OFORMAT ASCII')
+			dmm_batch.write('TARM AUTO')
 	tm.sleep(1)
-	FunGen.write('TERM FRONT') # Connect the output to the front panel terminal (i.e. enable output).
+	with gpib_batch.command_batch(FunGen, 'HP3245A') as fungen:
+		fungen.write('USE CHANA')
+		fungen.write('TERM FRONT') # Connect the output to the front panel terminal (i.e. enable output).
+	V_in_buffer = [None]*N_READINGS_PER_FREQUENCY
+	V_out_buffer = [None]*N_READINGS_PER_FREQUENCY
 	for j in range(N_READINGS_PER_FREQUENCY):
 		V_in_buffer[j] = float(DMM[0].query('RMEM ' + str(j)))
 		V_out_buffer[j] = float(DMM[1].query('RMEM ' + str(j)))
-	V_in[k] = np.array(V_in_buffer)
-	V_out[k] = np.array(V_out_buffer)
-	print('Vin = ' + str(V_in[k]))
-	print('V_out = ' + str(V_out[k]))
+	print('Vin = ' + str(V_in_buffer))
+	print('V_out = ' + str(V_out_buffer))
+	return np.array(V_in_buffer), np.array(V_out_buffer)
+
+SWEEP = None if ADAPTIVE_TIME_BUDGET is None else adaptive_sweep(min(GENERATOR_FREQUENCIES), max(GENERATOR_FREQUENCIES), ADAPTIVE_TIME_BUDGET)
+readings = {} # frequency: (V_in, V_out)
+frequencies = list(GENERATOR_FREQUENCIES) if SWEEP is None else SWEEP.next_frequencies()
+while len(frequencies) > 0: # Only one round unless the sweep is adaptive.
+	for freq in frequencies:
+		readings[freq] = measure_frequency(freq)
+		if SWEEP is not None:
+			ratio = unc.ufloat(readings[freq][1].mean(), readings[freq][1].std())/unc.ufloat(readings[freq][0].mean(), readings[freq][0].std())
+			SWEEP.add(freq, ratio.n, ratio.s) # The AC mode gives no phase.
+	frequencies = [] if SWEEP is None else SWEEP.next_frequencies()
+GENERATOR_FREQUENCIES = np.array(sorted(readings))
+V_in = [readings[freq][0] for freq in GENERATOR_FREQUENCIES]
+V_out = [readings[freq][1] for freq in GENERATOR_FREQUENCIES]
 # Close instruments ----------------------------------------------------
 print('Closing instruments...')
 for k in range(len(DMM)):
@@ -94,6 +121,21 @@ for k in range(len(V_in)):
 	vout_s[k] = V_out[k].std()
 input_value = unp.uarray(vin_n, vin_s)
 output_value = unp.uarray(vout_n, vout_s)
+catalog = results_catalog(DIRS.RESULTS_CATALOG_FILE) # See "compare_transferences_AC_mode.py".
+run_timestamp = utils.timestamp.generate_timestamp()
+catalog.add_many([ # All the frequencies of the run at once.
+	dict(
+		timestamp = run_timestamp,
+		campaign = DIRS.read_campaign(),
+		generator_frequency = GENERATOR_FREQUENCIES[k],
+		T_abs = ratio.n,
+		T_abs_s = ratio.s,
+		generator_amplitude = GENERATOR_AMPLITUDE,
+		number_of_samples = N_READINGS_PER_FREQUENCY,
+		mode = 'AC',
+	) for k, ratio in enumerate(output_value/input_value)
+])
+catalog.close()
 
 nq.plot(
 	x = GENERATOR_FREQUENCIES, 
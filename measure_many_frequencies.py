@@ -1,4 +1,4 @@
-import visa
+import os
 import numpy as np
 import time as tm
 import uncertainties as unc
@@ -7,19 +7,38 @@ from uncertainties import unumpy as unp
 import nicenquickplotlib as nq # https://github.com/SengerM/nicenquickplotlib
 
 import utils.HP3458A as HP3458A
+import utils.gpib_batch as gpib_batch
 import utils.fitmodel as fitmodel
+import utils.burst_file as burst_file
+import utils.sampling_planner as sampling_planner
+import utils.trigger_alignment as trigger_alignment
+import utils.multisine as multisine
+import utils.single_bin_dft as single_bin_dft
 import directories as DIRS
 import utils.timestamp
+from utils.instrument_session import instrument_session
+from utils.background_writer import background_writer
+from utils.job_queue import job_queue
+from utils.sine_fit import running_sine_fit
+from utils.adaptive_sweep import adaptive_sweep
+import utils.transference_io as transference_io
 
 # Script parameters ----------------------------------------------------
+SIMULATE_INSTRUMENTS = False # If True the instruments are simulated by "utils/simulated_instruments.py" (no bench needed).
 RESET_INSTRUMENTS = False
 # MEASURING PARAMS -----------------------------------------------------
 GENERATOR_FREQUENCIES = np.logspace(np.log10(40), np.log10(100000), 20)#[40, 100, 400, 1000, 4000, 10000, 40000, 100000]
 GENERATOR_FREQUENCIES = GENERATOR_FREQUENCIES[::-1] # This reverses the list. This makes the measurement and processing algorithm to go faster.
 SAMPLING_FREQUENCIES =  [i*10 for i in GENERATOR_FREQUENCIES]
-SAMPLES_PER_BURST = 10200 # Number of samples to be recorded.
+SAMPLES_PER_BURST = 10200 # Maximum number of samples to be recorded, see "utils/sampling_planner.py".
 GENERATOR_AMPLITUDE = 10 # Peak voltage.
 N_BURSTS = 1 # See note below.
+STREAMING_SAMPLES_PER_POINT = None # If not None each frequency is measured streaming this number of samples (any number, up to 16777215) that are processed while they are taken, see "measure_streaming".
+ADAPTIVE_TIME_BUDGET = None # Seconds. If not None the sweep starts with a coarse grid between the extreme GENERATOR_FREQUENCIES and then adds points where the transference changes the most, see "utils/adaptive_sweep.py".
+MULTISINE_HARMONICS = None # E.g. [1, 2, 5, 10, 20, 50, 100]. If not None each burst excites all these harmonics of the generator frequency at once, see "utils/multisine.py".
+MULTISINE_FUNDAMENTALS = [40, 1000] # Generator frequencies in multisine mode, GENERATOR_FREQUENCIES is not used.
+MULTISINE_ARRAY = 'MULTISINE' # Name of the arbitrary waveform array in the HP 3245A.
+BURST_DEADLINE_MARGIN = 5 # Seconds to wait for a burst after its expected duration before giving up.
 DIVIDER_RATIO = 7.4/10
 # Note on N_BURSTS:
 	# This is a "cavernicol" way to overcome a problem regarding with 
@@ -30,100 +49,258 @@ DIVIDER_RATIO = 7.4/10
 # ----------------------------------------------------------------------
 
 
-def measure_burst(FunGen=None, DMM=None, generator_frequency=100, generator_amplitude=1, generator_offset=0, sampling_frequency=1000, number_of_samples=1000, RVD_ratio=1, N_bursts=1, verbose=False):
-	""" This function assumes that FunGen is a HP 3245A and DMM is a list
-	containing two HP 3458A. The function configures the instruments and 
-	return the results of the measurement. 
-	
-	Note on the parameter N_bursts:
-		This is a "cavernicol" way to overcome a problem regarding with the fact
-		that the first "N" bursts taken by the voltmeteres are wrong, with "N" 
-		typically 1 or 2. I found no way to fix this problem so I decided to take 
-		N_BURSTS>2 and discard all exept the last one."""
-	# Configure function generator ------------
+def configure_DMM_for_burst(DMM, max_input, number_of_samples, memory='LIFO'):
+	"""Configures one HP 3458A to take "number_of_samples" samples, one
+	per EXTSYN event, of a signal not greater than "max_input" and arms it.
+	"memory" is the mode of the reading memory, 'FIFO' for streaming."""
+	with gpib_batch.command_batch(DMM, 'HP3458A') as dmm:
+		if gpib_batch.known_setting(DMM, 'PRESET') != 'PRESET DIG': # Otherwise the settings below are already in place from the previous burst.
+			dmm.write('PRESET DIG')
+		dmm.write('TARM HOLD')
+		dmm.write('DSDC ' + str(max_input))
+		dmm.write('MEM ' + memory) # ENABLE READING MEMORY.
+		dmm.write('MFORMAT SINT')
+		dmm.write('OFORMAT SINT') # Set the output format when reading the samples in memory.
+		dmm.write('NRDGS ' + str(number_of_samples) + ', 2') # '2' means 'EXTSYN'.
+		dmm.write('TRIG LEVEL')
+		dmm.write('SLOPE POS')
+		dmm.write('LEVEL 0')
+		dmm.write('TARM AUTO')
+
+def read_DMM_burst(DMM, number_of_samples):
+	"""Reads the last burst from one HP 3458A. Returns the integer codes,
+	the scale factor and the uncertainty coefficients (see 
+	"HP3458A.get_uncertainty")."""
+	codes, scale = HP3458A.read_binary_mem(DMM, number_of_samples, raw=True)
+	return codes, scale, HP3458A.get_uncertainty(DMM)
+
+def stream_DMM(DMM, number_of_samples, omega, deadline, sampling_frequency):
+	"""Reads the samples from one HP 3458A in FIFO mode while it keeps 
+	sampling (see "HP3458A.read_fifo_chunks") and fits a sine of angular
+	frequency "omega" (radians per sample) to them as they arrive, so 
+	any number of samples is processed in constant memory. Returns the
+	"running_sine_fit", the codes of the first chunk (to align the 
+	voltmeters), the scale factor and the uncertainty coefficients."""
+	fit = running_sine_fit(omega)
+	first_chunk = None
+	for first_sample, codes, scale in HP3458A.read_fifo_chunks(DMM, number_of_samples, deadline, sampling_frequency):
+		fit.update(np.arange(first_sample, first_sample + len(codes)), np.multiply(codes, scale, dtype=float))
+		if first_chunk is None:
+			first_chunk = codes.copy()
+	return fit, first_chunk, scale, HP3458A.get_uncertainty(DMM)
+
+def load_multisine(FunGen, harmonics):
+	"""Loads one period of the multisine with the given "harmonics" (see
+	"utils/multisine.py") in the arbitrary waveform array of the HP 3245A
+	"FunGen", to be used with "configure_generator"."""
+	values = multisine.waveform(harmonics)
+	FunGen.write('USE CHANA')
+	FunGen.write('REAL ' + MULTISINE_ARRAY + '(' + str(len(values)-1) + ')')
+	FunGen.write('FILL ' + MULTISINE_ARRAY + ' ' + ','.join('{:.6f}'.format(value) for value in values))
+	gpib_batch.forget(FunGen) # The channel was selected outside a "command_batch".
+
+def configure_generator(FunGen, generator_frequency=100, generator_amplitude=1, generator_offset=0, sampling_frequency=1000, verbose=False, waveform=None):
+	"""Configures channel A of the HP 3245A "FunGen" to generate the sine
+	and channel B to generate the sample clock, with its sync output 
+	disabled (see "acquire_burst"). The frequencies are set as given, 
+	see "utils/sampling_planner.py" to obtain them. If "waveform" is the
+	name of an array loaded with "load_multisine" it is generated instead
+	of the sine, with "generator_amplitude" as its peak value."""
 	if verbose:
-		print('Setting generator output to:\n\tWaveform: sine\n\tAmplitude: ' + str(generator_amplitude) + ' V (peak voltage)\n\tOffset: ' + str(generator_offset) +'\n\tFrequency: ' + str(generator_frequency) + ' Hz')
-	FunGen.write('SYNCOUT OFF') # Sync signal is output only from sync terminal in front panel.
-	FunGen.write('USE CHANA') # Select channel A to receive subsequent commands.
-	FunGen.write('TERM OFF') # Disconnect the output from all terminals.
-	FunGen.write('IMP 0') # Select 0 Ohm output impedance mode.
-	FunGen.write('ARANGE ON') # Enable autorange.
-	FunGen.write('APPLY ACV ' + str(generator_amplitude*2)) # Apply sine output with specified amplitude.
-	FunGen.write('FREQ ' + str(generator_frequency))
-	FunGen.write('DCOFF ' + str(generator_offset)) # Generator offset.
-	FunGen.write('TERM FRONT') # Connect the output to the front panel terminal (i.e. enable output).
-	# Configure trigger generator --------------------------------------
-	FunGen.write('USE CHANB') # Select channel B to receive subsequent commands.
-	FunGen.write('TERM OFF') # Disconnect the output from all terminals.
-	FunGen.write('SYNCOUT OFF') # The sync signal is output only from the front panel.
-	FunGen.write('ARANGE ON') # Enable autorange.
-	FunGen.write('APPLY ACV 1')
-	if sampling_frequency > HP3458A.MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE: # Subsampling mode...
-		if verbose:
-			print('Subsampling mode enabled')
-		aparent_sampling_frequency = 0
-		k = 0
-		while aparent_sampling_frequency < sampling_frequency:
-			k = k + 1
-			aparent_sampling_frequency = generator_frequency*k
-		l = 0
-		while sampling_frequency > HP3458A.MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE:
-			l = l + 1
-			sampling_frequency = generator_frequency/(l+1/k)
-		print('Sampling frequency = ' + str(sampling_frequency))
-		print('Aparent sampling frequency = ' + str(aparent_sampling_frequency))
-	else: # No subsampling mode case...
-		aparent_sampling_frequency = sampling_frequency
-	FunGen.write('FREQ ' + str(sampling_frequency))
-	FunGen.write('TERM FRONT') # Connect the output to the front panel terminal (i.e. enable output).
-	FunGen.write('PHSYNC') # Synchronize channels.
-	# Configure DMM ----------------------------------------------------
+		print('Setting generator output to:\n\tWaveform: ' + ('sine' if waveform is None else waveform) + '\n\tAmplitude: ' + str(generator_amplitude) + ' V (peak voltage)\n\tOffset: ' + str(generator_offset) +'\n\tFrequency: ' + str(generator_frequency) + ' Hz\n\tSampling frequency: ' + str(sampling_frequency) + ' Hz')
+	with gpib_batch.command_batch(FunGen, 'HP3245A') as fungen: # All the configuration is sent in one transaction, skipping the settings that did not change.
+		fungen.write('SYNCOUT OFF') # Sync signal is output only from sync terminal in front panel.
+		fungen.write('USE CHANA') # Select channel A to receive subsequent commands.
+		fungen.write('TERM OFF') # Disconnect the output from all terminals.
+		fungen.write('IMP 0') # Select 0 Ohm output impedance mode.
+		fungen.write('ARANGE ON') # Enable autorange.
+		if waveform is None:
+			fungen.write('APPLY ACV ' + str(generator_amplitude*2)) # Apply sine output with specified amplitude.
+		else:
+			fungen.write('APPLY WFV ' + str(generator_amplitude*2) + ',' + waveform) # Arbitrary waveform, peak to peak amplitude as for ACV.
+		fungen.write('FREQ ' + str(generator_frequency))
+		fungen.write('DCOFF ' + str(generator_offset)) # Generator offset.
+		fungen.write('TERM FRONT') # Connect the output to the front panel terminal (i.e. enable output).
+		# Configure trigger generator --------------------------------------
+		fungen.write('USE CHANB') # Select channel B to receive subsequent commands.
+		fungen.write('TERM OFF') # Disconnect the output from all terminals.
+		fungen.write('SYNCOUT OFF') # The sync signal is output only from the front panel.
+		fungen.write('ARANGE ON') # Enable autorange.
+		fungen.write('APPLY ACV 1')
+		fungen.write('FREQ ' + str(sampling_frequency))
+		fungen.write('TERM FRONT') # Connect the output to the front panel terminal (i.e. enable output).
+		fungen.write('PHSYNC') # Synchronize channels.
+
+def configure_DMMs(session, generator_amplitude=1, generator_offset=0, number_of_samples=1000, RVD_ratio=1, verbose=False, memory='LIFO'):
+	"""Configures and arms the voltmeters of "session" (input and output
+	of the divider) at the same time."""
 	if verbose:
 		print('Configuring DMMs...')
-	for k in range(len(DMM)):
-		DMM[k].write('PRESET DIG')
-		DMM[k].write('TARM HOLD')
-		if k == 0: # Input signal DMM.
-			DMM[k].write('DSDC ' + str(np.abs(generator_amplitude+generator_offset)))
-		elif k == 1: # Output signal DMM.
-			DMM[k].write('DSDC ' + str(np.abs((generator_amplitude+generator_offset)*RVD_ratio)))
-		DMM[k].write('MEM LIFO') # ENABLE READING MEMORY.
-		DMM[k].write('MFORMAT SINT')
-		DMM[k].write('OFORMAT SINT') # Set the output format when reading the samples in memory.
-		DMM[k].write('NRDGS ' + str(number_of_samples) + ', 2') # '2' means 'EXTSYN'.
-		DMM[k].write('TRIG LEVEL')
-		DMM[k].write('SLOPE POS')
-		DMM[k].write('LEVEL 0')
-		DMM[k].write('TARM AUTO')
-	tm.sleep(3/generator_frequency) # This is in order to ensure the TRIG event for each voltmeter has already occured.
+	max_input = np.abs(generator_amplitude+generator_offset)
+	session.map(configure_DMM_for_burst, [max_input, max_input*np.abs(RVD_ratio)], [number_of_samples]*len(session.instruments), [memory]*len(session.instruments))
+
+def start_sample_clock(FunGen):
+	"""Enables the sample clock of the voltmeters, they start sampling."""
+	with gpib_batch.command_batch(FunGen, 'HP3245A') as fungen:
+		fungen.write('USE CHANB') # Select channel B to receive subsequent commands.
+		fungen.write('SYNCOUT TB0') # Route SYNC signal to TB0 port in the rear panel. This signal is the one that generates the "sample event" for the voltmeters.
+
+def acquire_burst(FunGen, session, sampling_frequency=1000, number_of_samples=1000, N_bursts=1, verbose=False):
+	"""Starts the sample clock, waits until the voltmeters of "session" 
+	have taken all the samples and stops them. The samples are left in
+	the memory of the voltmeters (see "read_DMM_burst")."""
 	time_per_burst = number_of_samples/sampling_frequency
 	if verbose:
-		print('Measuring... ({:.2g}'.format(time_per_burst*N_BURSTS) + ' seconds)')
-	# Launch measurements ----------------------------------------------
-	FunGen.write('USE CHANB') # Select channel B to receive subsequent commands.
-	FunGen.write('SYNCOUT TB0') # Route SYNC signal to TB0 port in the rear panel. This signal is the one that generates the "sample event" for the voltmeters.
-	tm.sleep(time_per_burst*N_bursts) # Wait untill all burst have been taken.
+		print('Measuring... ({:.2g}'.format(time_per_burst*N_bursts) + ' seconds)')
+	start_sample_clock(FunGen)
+	if N_bursts > 1: # The reading memory is full after the first burst so we cannot know when the last one finishes.
+		tm.sleep(time_per_burst*N_bursts) # Wait untill all burst have been taken.
+	else:
+		deadline = tm.time() + time_per_burst + BURST_DEADLINE_MARGIN
+		session.map(
+			HP3458A.wait_for_readings,
+			[number_of_samples]*len(session.instruments),
+			[deadline]*len(session.instruments),
+			[sampling_frequency]*len(session.instruments),
+		)
 	if verbose:
 		print('Finishing measurements...')
-	for k in range(len(DMM)):
-		if verbose:
-			print('Finishing voltmenter ' + str(k+1) + '... (this should not elapse more than ' + str(int(time_per_burst)) + ' seconds)')
-		DMM[k].timeout = None
-		DMM[k].write('TARM HOLD') # Disable triggering
-		DMM[k].timeout = 5e3
-		if verbose:
-			print('Voltmenter ' + str(k+1) + ' finished')
-	# Read samples ----------------------------
-	samples = [None]*len(DMM)
-	for k in range(len(DMM)):
+	session.map(HP3458A.write, ['TARM HOLD']*len(session.instruments)) # Disable triggering
+
+def measure_sweep(FunGen, session, plans, save_burst, generator_amplitude=1, generator_offset=0, RVD_ratio=1, N_bursts=1, verbose=False, waveform=None):
+	"""Measures one burst for each "burst_plan" in "plans" (see 
+	"utils/sampling_planner.py"), so the frequencies and the number of
+	samples sample coherently. In subsampling mode the signal advances
+	more than one period between samples, which can be processed as it
+	is because the burst is coherent. Each burst finishes as soon as
+	both voltmeters have taken all the samples (see "acquire_burst").
+	While the samples of one burst are being read the generator is
+	already configured for the next one, so it has settled when the
+	voltmeters are ready. "save_burst(k, readouts)" is called with the result of 
+	"read_DMM_burst" for each voltmeter for the k-th plan and it should
+	return quickly (e.g. use a "background_writer"). "waveform" is passed
+	to "configure_generator"."""
+	configure_generator(FunGen, plans[0].generator_frequency, generator_amplitude, generator_offset, plans[0].sampling_frequency, verbose, waveform)
+	for k in range(len(plans)):
+		configure_DMMs(session, generator_amplitude, generator_offset, plans[k].number_of_samples, RVD_ratio, verbose)
+		tm.sleep(3/plans[k].generator_frequency) # This is in order to ensure the TRIG event for each voltmeter has already occured.
+		acquire_burst(FunGen, session, plans[k].sampling_frequency, plans[k].number_of_samples, N_bursts, verbose)
 		if verbose:
-			print('Reading ' + str(number_of_samples) + ' (of ' + str(DMM[k].query('MCOUNT?')) + ') samples from voltmeter ' + str(k+1))
-		samples[k] = HP3458A.read_binary_mem(DMM[k], number_of_samples)
-		uncertainty = HP3458A.get_uncertainty(DMM[k])
-		samples[k] = unp.uarray(samples[k], [s*uncertainty[0]+uncertainty[1] for s in np.abs(samples[k])])
-	return samples, aparent_sampling_frequency
+			print('Reading ' + str(plans[k].number_of_samples) + ' samples from each voltmeter...')
+		readouts = [session.submit(n, read_DMM_burst, plans[k].number_of_samples) for n in range(len(session.instruments))]
+		if k+1 < len(plans): # The generator is not used during the readout.
+			configure_generator(FunGen, plans[k+1].generator_frequency, generator_amplitude, generator_offset, plans[k+1].sampling_frequency, verbose, waveform)
+		save_burst(k, [readout.result() for readout in readouts])
+
+def measure_streaming(FunGen, session, plan, number_of_samples, generator_amplitude=1, generator_offset=0, RVD_ratio=1, verbose=False):
+	"""Measures "number_of_samples" samples at the frequencies of "plan"
+	(see "utils/sampling_planner.py", its number of samples is ignored)
+	with "stream_DMM", so the length of the record is not limited by the
+	reading memory of the voltmeters. Returns the result of "stream_DMM"
+	for each voltmeter."""
+	configure_generator(FunGen, plan.generator_frequency, generator_amplitude, generator_offset, plan.sampling_frequency, verbose)
+	configure_DMMs(session, generator_amplitude, generator_offset, number_of_samples, RVD_ratio, verbose, memory='FIFO')
+	tm.sleep(3/plan.generator_frequency) # This is in order to ensure the TRIG event for each voltmeter has already occured.
+	omega = 2*np.pi*plan.generator_frequency/plan.sampling_frequency
+	if verbose:
+		print('Measuring and processing ' + str(number_of_samples) + ' samples... ({:.2g}'.format(number_of_samples/plan.sampling_frequency) + ' seconds)')
+	start_sample_clock(FunGen)
+	deadline = tm.time() + number_of_samples/plan.sampling_frequency + BURST_DEADLINE_MARGIN
+	n_DMMs = len(session.instruments)
+	results = session.map(stream_DMM, [number_of_samples]*n_DMMs, [omega]*n_DMMs, [deadline]*n_DMMs, [plan.sampling_frequency]*n_DMMs)
+	session.map(HP3458A.write, ['TARM HOLD']*n_DMMs) # Disable triggering
+	return results
+
+def streaming_transference(results, omega):
+	"""Transference from the results of "stream_DMM" for both voltmeters
+	(as "ufloat" amplitude, phase and its uncertainty) and the lag 
+	between them, estimated from the first chunks as 
+	"fix_trigger_problem.py" does. The lag is corrected in the phase."""
+	lag = trigger_alignment.estimate_lag(results[0][1], results[1][1], trigger_alignment.half_period(omega/(2*np.pi))) # Sample n of DMM[0] corresponds to sample n+lag of DMM[1].
+	(V_p1, phi1, _), cov1 = results[0][0].result()
+	(V_p2, phi2, _), cov2 = results[1][0].result()
+	T_abs = unc.ufloat(V_p2/V_p1, V_p2/V_p1*np.sqrt(cov1[0,0]/V_p1**2 + cov2[0,0]/V_p2**2))
+	T_phi = np.angle(np.exp(1j*(phi2 + omega*lag - phi1)))
+	return T_abs, T_phi, np.sqrt(cov1[1,1] + cov2[1,1]), lag
+
+def quick_look_transference(plan, readouts):
+	"""Transference (ratio, its uncertainty, phase and its uncertainty)
+	of a burst from the result of "read_DMM_burst" for each voltmeter, 
+	with "single_bin_dft" which is fast enough to choose the next points
+	of an "adaptive_sweep" while measuring. The lag is corrected in the
+	phase, as in "streaming_transference"."""
+	samples = [np.multiply(codes, scale, dtype=float) for codes, scale, _ in readouts]
+	frequency = plan.generator_frequency/plan.sampling_frequency
+	lag = trigger_alignment.estimate_lag(samples[0], samples[1], trigger_alignment.half_period(frequency))
+	ratio, ratio_s, T_phi, T_phi_s = single_bin_dft.transference(samples[0], samples[1], frequency)
+	return ratio, ratio_s, np.angle(np.exp(1j*(T_phi + 2*np.pi*frequency*lag))), T_phi_s
+
+def save_streaming_result(timestamp, plan, generator_amplitude, number_of_samples, results):
+	"""Saves the transference of a "measure_streaming" in 
+	DIRS.PROCESSED_DATA_PATH, together with a burst file with the first
+	chunk of samples for reference."""
+	T_abs, T_phi, T_phi_s, lag = streaming_transference(results, 2*np.pi*plan.generator_frequency/plan.sampling_frequency)
+	temporary_file_name = DIRS.CURRENT_MEASUREMENT_PATH + timestamp + DIRS.BURST_FILE_SUFFIX
+	config = dict(plan._asdict())
+	config['number_of_samples'] = number_of_samples
+	config['generator_amplitude'] = generator_amplitude
+	config['streaming'] = True
+	length = min(len(result[1]) for result in results)
+	burst_file.write(
+		temporary_file_name,
+		codes = [result[1][:length] for result in results],
+		scales = [result[2] for result in results],
+		uncertainties = [result[3] for result in results],
+		config = config,
+		trigger_lag = int(lag),
+	)
+	transference_io.save_transference(DIRS.PROCESSED_DATA_PATH + timestamp + DIRS.TRANSFERENCE_FILE_SUFFIX, T_abs, T_phi, T_phi_s)
+	transference_io.catalog_transference(DIRS.RESULTS_CATALOG_FILE, timestamp, DIRS.read_campaign(), config, T_abs, T_phi, T_phi_s, raw_path=DIRS.PROCESSED_DATA_DIR + '/' + timestamp + DIRS.BURST_FILE_SUFFIX)
+	os.replace(temporary_file_name, DIRS.PROCESSED_DATA_PATH + timestamp + DIRS.BURST_FILE_SUFFIX)
+
+def save_burst_file(timestamp, plan, generator_amplitude, readouts, multisine_harmonics=None):
+	"""Writes the burst file (see "utils/burst_file.py"). It is written 
+	with a temporary name and then moved, so the processing scripts 
+	never find half written files. "multisine_harmonics" are those of 
+	the waveform, if it was a multisine."""
+	temporary_file_name = DIRS.CURRENT_MEASUREMENT_PATH + timestamp + DIRS.BURST_FILE_SUFFIX
+	config = dict(plan._asdict()) # 'generator_frequency', 'sampling_frequency', 'number_of_samples', 'periods' and 'subsampling'.
+	config['generator_amplitude'] = generator_amplitude
+	if multisine_harmonics is not None:
+		config['multisine_harmonics'] = [int(h) for h in multisine_harmonics]
+	burst_file.write(
+		temporary_file_name,
+		codes = [readout[0] for readout in readouts],
+		scales = [readout[1] for readout in readouts],
+		uncertainties = [readout[2] for readout in readouts],
+		config = config,
+	)
+	os.replace(temporary_file_name, DIRS.UNPROCESSED_DATA_PATH + timestamp + DIRS.BURST_FILE_SUFFIX)
+	jobs = job_queue(DIRS.JOB_QUEUE_FILE)
+	jobs.add(timestamp)
+	jobs.close()
 
+# Plan the sweep -------------------------------------------------------
+SWEEP = None if ADAPTIVE_TIME_BUDGET is None else adaptive_sweep(min(GENERATOR_FREQUENCIES), max(GENERATOR_FREQUENCIES), ADAPTIVE_TIME_BUDGET)
+if MULTISINE_HARMONICS is None and SWEEP is None:
+	PLANS = sampling_planner.plan_sweep(GENERATOR_FREQUENCIES, SAMPLING_FREQUENCIES, SAMPLES_PER_BURST)
+elif MULTISINE_HARMONICS is None: # The coarse grid, the following points are planned as they are chosen.
+	GENERATOR_FREQUENCIES = sorted(SWEEP.next_frequencies(), reverse=True)
+	PLANS = sampling_planner.plan_sweep(GENERATOR_FREQUENCIES, [i*10 for i in GENERATOR_FREQUENCIES], SAMPLES_PER_BURST)
+else:
+	if STREAMING_SAMPLES_PER_POINT is not None or SWEEP is not None:
+		raise ValueError('The multisine mode cannot be used with streaming nor with an adaptive sweep')
+	GENERATOR_FREQUENCIES = MULTISINE_FUNDAMENTALS
+	PLANS = sampling_planner.plan_sweep(MULTISINE_FUNDAMENTALS, [10*f*max(MULTISINE_HARMONICS) for f in MULTISINE_FUNDAMENTALS], SAMPLES_PER_BURST)
+	for plan in PLANS:
+		multisine.tone_bins(MULTISINE_HARMONICS, plan.periods, plan.number_of_samples) # Raises if the tones cannot be separated.
+for plan in PLANS:
+	print('{:.6g} Hz: {} periods in {} samples at {:.6g} Sa/s'.format(plan.generator_frequency, plan.periods, plan.number_of_samples, plan.sampling_frequency) + (' (subsampling)' if plan.subsampling else ''))
 # Open instruments -----------------------------------------------------
+if SIMULATE_INSTRUMENTS is True:
+	import utils.simulated_instruments as visa
+else:
+	import visa
 print('Opening instruments...')
 rm = visa.ResourceManager()
 DMM = [None]*2
@@ -138,17 +315,48 @@ if RESET_INSTRUMENTS is True:
 for k in range(len(DMM)):
 	DMM[k].read_termination = HP3458A.read_termination
 FunGen.read_termination = HP3458A.read_termination
+if MULTISINE_HARMONICS is not None:
+	load_multisine(FunGen, MULTISINE_HARMONICS)
+session = instrument_session(DMM) # To configure and read both voltmeters at the same time.
 # Measure --------------------------------------------------------------
-for k in range(len(GENERATOR_FREQUENCIES)):
-	timestamp = utils.timestamp.generate_timestamp()
-	samples, sampling_frequency = measure_burst(FunGen=FunGen, DMM=DMM, generator_frequency=GENERATOR_FREQUENCIES[k], generator_amplitude=GENERATOR_AMPLITUDE, sampling_frequency=SAMPLING_FREQUENCIES[k], number_of_samples=SAMPLES_PER_BURST, verbose=True)
-	with open(DIRS.UNPROCESSED_DATA_PATH + timestamp + DIRS.CONFIG_FILE_SUFFIX, 'w') as ofile:
-		print('Generator frequency (Hz)\tSampling frequency (Hz)\tGenerator amplitude (V)', file=ofile)
-		print(str(GENERATOR_FREQUENCIES[k]) + '\t' + str(sampling_frequency) + '\t' + str(GENERATOR_AMPLITUDE), file=ofile)
-	with open(DIRS.UNPROCESSED_DATA_PATH + timestamp + DIRS.SAMPLES_FILE_SUFFIX, 'w') as ofile:
-		print('Samples1 (V)\tSamples2 (V)', file=ofile)
-		for k in range(len(samples[0])):
-			print(str(samples[0][k].n) + '\t' + str(samples[1][k].n), file=ofile)
+sweep_start_time = tm.time()
+measured_frequencies = 0
+with background_writer() as writer: # Files are written while the next burst is measured.
+	while len(PLANS) > 0: # Only one round unless the sweep is adaptive.
+		quick_looks = [None]*len(PLANS) # For the adaptive sweep.
+		if STREAMING_SAMPLES_PER_POINT is None:
+			def save_burst(k, readouts):
+				writer.submit(save_burst_file, utils.timestamp.generate_timestamp(), PLANS[k], GENERATOR_AMPLITUDE, readouts, MULTISINE_HARMONICS)
+				if SWEEP is not None:
+					quick_looks[k] = quick_look_transference(PLANS[k], readouts)
+			measure_sweep(
+				FunGen = FunGen,
+				session = session,
+				plans = PLANS,
+				save_burst = save_burst,
+				generator_amplitude = GENERATOR_AMPLITUDE,
+				verbose = True,
+				waveform = None if MULTISINE_HARMONICS is None else MULTISINE_ARRAY,
+			)
+		else: # The results are already processed, they do not go through the job queue.
+			for k, plan in enumerate(PLANS):
+				results = measure_streaming(FunGen, session, plan, STREAMING_SAMPLES_PER_POINT, GENERATOR_AMPLITUDE, verbose=True)
+				writer.submit(save_streaming_result, utils.timestamp.generate_timestamp(), plan, GENERATOR_AMPLITUDE, STREAMING_SAMPLES_PER_POINT, results)
+				if SWEEP is not None:
+					T_abs, T_phi, T_phi_s, _ = streaming_transference(results, 2*np.pi*plan.generator_frequency/plan.sampling_frequency)
+					quick_looks[k] = (T_abs.n, T_abs.s, T_phi, T_phi_s)
+		measured_frequencies += len(PLANS)
+		if SWEEP is None:
+			break
+		for plan, quick_look in zip(PLANS, quick_looks):
+			SWEEP.add(plan.generator_frequency, *quick_look)
+		next_frequencies = sorted(SWEEP.next_frequencies(), reverse=True) # Decreasing, as GENERATOR_FREQUENCIES.
+		PLANS = sampling_planner.plan_sweep(next_frequencies, [i*10 for i in next_frequencies], SAMPLES_PER_BURST)
+		if len(PLANS) > 0:
+			print('Adding ' + ', '.join('{:.6g}'.format(plan.generator_frequency) for plan in PLANS) + ' Hz to the sweep')
+print('Sweep of ' + str(measured_frequencies) + ' frequencies finished in {:.1f} seconds'.format(tm.time()-sweep_start_time))
+print(session.io_time_report())
+session.close()
 # Close instruments ----------------------------------------------------
 print('Closing instruments...')
 for k in range(len(DMM)):
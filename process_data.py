@@ -2,57 +2,101 @@ import uncertainties as unc
 from uncertainties import unumpy as unp
 import numpy as np
 import os
-import nicenquickplotlib as nq # https://github.com/SengerM/nicenquickplotlib
 
 import utils.fitmodel as fitmodel
 import utils.lock_in_process
+import utils.burst_file as burst_file
+from utils.job_queue import job_queue
+import utils.transference_io as transference_io
 import directories as DIRS
 import utils.my_uncertainties_utils as munc
+import utils.single_bin_dft as single_bin_dft
+import utils.multisine as multisine
+import render_plots
+
+# Script parameters ----------------------------------------------------
+TRANSFERENCE_ESTIMATOR = 'sine_fit' # 'sine_fit' (sine fits and lock-in) or 'single_bin_dft' (fastest).
+RENDER_PLOTS = False # If False the plots of the fits are not made while processing (they are much slower than the processing), use "render_plots.py".
+
+def sine_fit_transference(samples, generator_frequency, sampling_frequency):
+	"""Amplitude ratio (as "ufloat") from sine fits of both signals and 
+	phase with its uncertainty from the lock-in. Also returns the fits
+	as they are stored in the burst header for "render_plots.py"."""
+	# Discrete time signal model -------------
+	discrete_time_model = [None]*2
+	for k in range(2):
+		discrete_time_model[k] = fitmodel.sine_fitmodel(2*np.pi*generator_frequency/sampling_frequency, 'DT' + str(k+1), r'$V_p \sin \left(\frac{\omega}{f_s} n + \phi \right) + V_{os}$')
+		discrete_time_model[k].set_data(np.arange(len(samples[k])), samples[k])
+		discrete_time_model[k].fit()
+	fit = {'params': [], 'covariances': []}
+	for model in discrete_time_model:
+		params = [model.param_val(k) for k in range(len(model.str_params))]
+		fit['params'].append([param.n for param in params])
+		fit['covariances'].append(np.array(unc.covariance_matrix(params)).tolist())
+	# Transference calculation ---------------
+	T_abs = discrete_time_model[1].param_val(0)/discrete_time_model[0].param_val(0)
+	_, _, T_phi, T_phi_s = utils.lock_in_process.lock_in_process_batch(samples[0], samples[1])
+	return T_abs, T_phi, T_phi_s, fit
+
+def multisine_transference(samples, config, lag=0):
+	"""Transference at each tone of a multisine burst (see 
+	"utils/multisine.py"). Returns the frequencies of the tones and the
+	amplitude ratios (as "uarray"), phases and phase uncertainties."""
+	harmonics = np.array(config['multisine_harmonics'])
+	ratio, ratio_s, T_phi, T_phi_s = multisine.transference(samples[0], samples[1], harmonics, config['periods'], lag)
+	return config['generator_frequency']*harmonics, unp.uarray(ratio, ratio_s), T_phi, T_phi_s
+
+def process_data(current_timestamp):
+	"""Analyzes the burst "current_timestamp" of 
+	DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH and saves the results in 
+	DIRS.PROCESSED_DATA_PATH."""
+	print('Moving timestamp "' + current_timestamp + '" to "' + DIRS.CURRENTLY_PROCESSING_DATA_PATH + '"')
+	if not os.path.isfile(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX): # Otherwise it is there since a failed attempt.
+		os.rename(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX, DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX)
+	# Read data -------------------------------
+	print('Processing file with timestamp ' + current_timestamp)
+	burst = burst_file.burst(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX)
+	config = burst.config
+	multisine_burst = 'multisine_harmonics' in config
+	samples = burst.samples(aligned=not multisine_burst) # Aligned according to the trigger lag found by "fix_trigger_problem.py", except a multisine whose lag is corrected in the phase.
+	trigger_lag = burst.header.get('trigger_lag') or 0
+	generator_frequency = config['generator_frequency']
+	sampling_frequency = config['sampling_frequency']
+	generator_amplitude = config['generator_amplitude']
+	del burst # Closes the file, otherwise it cannot be moved in Windows.
+	frequencies = None # Only for multisine bursts, see "transference_io.save_transference".
+	if multisine_burst:
+		frequencies, T_abs, T_phi, T_phi_s = multisine_transference(samples, config, trigger_lag)
+	elif TRANSFERENCE_ESTIMATOR == 'single_bin_dft':
+		T_abs, T_abs_s, T_phi, T_phi_s = single_bin_dft.transference(samples[0], samples[1], generator_frequency/sampling_frequency)
+		T_abs = unc.ufloat(T_abs, T_abs_s)
+	elif TRANSFERENCE_ESTIMATOR == 'sine_fit':
+		T_abs, T_phi, T_phi_s, fit = sine_fit_transference(samples, generator_frequency, sampling_frequency)
+		burst_file.update_header(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX, fit=fit)
+	else:
+		raise ValueError('Unknown TRANSFERENCE_ESTIMATOR "' + str(TRANSFERENCE_ESTIMATOR) + '"')
+	# Save data ------------------------------
+	# Before moving the burst, so every burst in DIRS.PROCESSED_DATA_PATH has its results (if writing them fails the job is retried from DIRS.CURRENTLY_PROCESSING_DATA_PATH).
+	transference_io.save_transference(DIRS.PROCESSED_DATA_PATH + current_timestamp + DIRS.TRANSFERENCE_FILE_SUFFIX, T_abs, T_phi, T_phi_s, frequencies)
+	transference_io.catalog_transference(DIRS.RESULTS_CATALOG_FILE, current_timestamp, DIRS.read_campaign(), config, T_abs, T_phi, T_phi_s, frequencies, raw_path=DIRS.PROCESSED_DATA_DIR + '/' + current_timestamp + DIRS.BURST_FILE_SUFFIX)
+	os.rename(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX, DIRS.PROCESSED_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX)
+	if RENDER_PLOTS:
+		render_plots.render_burst_plots(current_timestamp)
+	print('Analysis completed.')
+	print('Original data and results can be found in "' + DIRS.PROCESSED_DATA_PATH + '"')
 
 # -----------------------------------------
-if not os.path.isdir(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH):
-	print('No data to be analized.')
-	exit()
-if len(os.listdir(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH)) == 0:
-	print('No data to be analized.')
-	exit()
-current_timestamp = os.listdir(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH)[0] # This is the file to be analyzed.
-current_timestamp = current_timestamp[:current_timestamp.find('_')]
-print('Moving timestamp "' + current_timestamp + '" to "' + DIRS.CURRENTLY_PROCESSING_DATA_PATH + '"')
-os.rename(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX, DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX)
-os.rename(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX, DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX)
-# Read data -------------------------------
-print('Processing file with timestamp ' + current_timestamp)
-samples = np.genfromtxt(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX, skip_header=1)
-samples = np.transpose(samples)
-generator_frequency = np.genfromtxt(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX, skip_header=1)[0]
-sampling_frequency = np.genfromtxt(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX, skip_header=1)[1]
-generator_amplitude = np.genfromtxt(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX, skip_header=1)[2]
-# Discrete time signal model -------------
-def discrete_time_modeling_function(n, p):
-	Vp = p[0]
-	phi = p[1]
-	Vos = p[2]
-	return Vp*unp.sin(2*np.pi*generator_frequency/sampling_frequency*n + phi) + Vos
-discrete_time_model = [None]*2
-for k in range(2):
-	discrete_time_model[k] = fitmodel.fitmodel(discrete_time_modeling_function, r'$V_p \sin \left(\frac{\omega}{f_s} n + \phi \right) + V_{os}$', [r'$V_p$', r'$\phi$', r'$V_{os}$', ], 'DT' + str(k+1))
-	discrete_time_model[k].set_data(np.arange(len(samples[k])), samples[k])
-	discrete_time_model[k].fit([generator_amplitude, 0, 0])
-# PLOT ------------------------------------
-for k in range(2):
-	fig = discrete_time_model[k].plot_model_vs_data(xlabel='Sample number', ylabel='Voltage (V)', nicebox=True, marker='.')
-	fig.axes[-1].set_xlim([0, 10*sampling_frequency/2/np.pi/generator_frequency])
-# Transference calculation ---------------
-T_abs = discrete_time_model[1].param_val(0)/discrete_time_model[0].param_val(0)
-T_phi = utils.lock_in_process.lock_in_process(samples[0], samples[1])
-T_abs = np.abs(T_abs) # This is because sometimes the fitting algorithm converges to a negative amplitude.
-# Save data ------------------------------
-os.rename(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX, DIRS.PROCESSED_DATA_PATH + current_timestamp + DIRS.CONFIG_FILE_SUFFIX)
-os.rename(DIRS.CURRENTLY_PROCESSING_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX, DIRS.PROCESSED_DATA_PATH + current_timestamp + DIRS.SAMPLES_FILE_SUFFIX)
-nq.save_all(mkdir=DIRS.PROCESSED_DATA_PATH + current_timestamp + 'plots')
-with open(DIRS.PROCESSED_DATA_PATH + current_timestamp + DIRS.TRANSFERENCE_FILE_SUFFIX, 'w') as ofile:
-	print('T_abs.n\tT_abs.s\tT_phi.n', file=ofile)
-	print(str(T_abs.n) + '\t' + str(T_abs.s) + '\t' + str(T_phi), file=ofile)
-print('Analysis completed.')
-print('Original data and results can be found in "' + DIRS.PROCESSED_DATA_PATH + '"')
+if __name__ == '__main__':
+	jobs = job_queue(DIRS.JOB_QUEUE_FILE)
+	jobs.sync_with_directory(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH, 'process', DIRS.BURST_FILE_SUFFIX)
+	job = jobs.claim('process')
+	if job is None:
+		print('No data to be analized.')
+		exit()
+	current_timestamp = job[0]
+	try:
+		process_data(current_timestamp)
+	except Exception as e:
+		jobs.failed(current_timestamp, repr(e))
+		raise
+	jobs.advance(current_timestamp)
@@ -0,0 +1,74 @@
+import os
+import sys
+import numpy as np
+import nicenquickplotlib as nq # https://github.com/SengerM/nicenquickplotlib
+import matplotlib.pyplot as plt
+
+import utils.fitmodel as fitmodel
+import utils.burst_file as burst_file
+from utils.plot_decimation import min_max_indices
+from utils.sine_fit import sine_fit
+import directories as DIRS
+
+# Script parameters ----------------------------------------------------
+MAX_POINTS_PER_PLOT = 2000 # The whole burst is plotted with min/max decimation, see "utils/plot_decimation.py".
+PERIODS_TO_ZOOM = 10 # The beginning of the burst is also plotted with all the samples.
+
+def plots_path(current_timestamp):
+	return DIRS.PROCESSED_DATA_PATH + current_timestamp + 'plots'
+
+def render_burst_plots(current_timestamp):
+	"""Plots the sine fits of the burst "current_timestamp" of
+	DIRS.PROCESSED_DATA_PATH and saves the figures in "plots_path".
+	The fits are taken from the 'fit' entry of the header (written by
+	"process_data.py"), or done again if it is not there. Multisine
+	bursts are plotted without fit."""
+	burst = burst_file.burst(DIRS.PROCESSED_DATA_PATH + current_timestamp + DIRS.BURST_FILE_SUFFIX)
+	samples = burst.samples()
+	generator_frequency = burst.config['generator_frequency']
+	sampling_frequency = burst.config['sampling_frequency']
+	fit = burst.header.get('fit')
+	multisine_burst = 'multisine_harmonics' in burst.config
+	del burst # Closes the file.
+	if multisine_burst:
+		for k in range(2):
+			n = min_max_indices(samples[k], MAX_POINTS_PER_PLOT)
+			nq.plot(n, samples[k][n], xlabel='Sample number', ylabel='Voltage (V)', marker='.', title='DT' + str(k+1))
+		nq.save_all(mkdir=plots_path(current_timestamp))
+		plt.close('all')
+		return
+	omega = 2*np.pi*generator_frequency/sampling_frequency
+	samples_to_zoom = int(np.ceil(PERIODS_TO_ZOOM*sampling_frequency/generator_frequency))
+	for k in range(2):
+		n = np.arange(len(samples[k]))
+		if fit is None:
+			params, covariance = sine_fit(n, samples[k], omega)
+		else:
+			params, covariance = fit['params'][k], fit['covariances'][k]
+		model = fitmodel.sine_fitmodel(omega, 'DT' + str(k+1), r'$V_p \sin \left(\frac{\omega}{f_s} n + \phi \right) + V_{os}$')
+		model.set_data(n, samples[k])
+		model.set_params(params, covariance)
+		model.plot_model_vs_data(xlabel='Sample number', ylabel='Voltage (V)', nicebox=True, marker='.', max_points=MAX_POINTS_PER_PLOT)
+		model.set_data(n[:samples_to_zoom], samples[k][:samples_to_zoom])
+		model.set_params(params, covariance)
+		model.plot_model_vs_data(xlabel='Sample number', ylabel='Voltage (V)', nicebox=True, marker='.')
+	nq.save_all(mkdir=plots_path(current_timestamp))
+	plt.close('all') # Otherwise the figures pile up when this runs for many bursts.
+
+def bursts_to_render():
+	"""Timestamps of the bursts of DIRS.PROCESSED_DATA_PATH that have no
+	plots yet."""
+	return sorted(
+		file_name[:-len(DIRS.BURST_FILE_SUFFIX)] for file_name in os.listdir(DIRS.PROCESSED_DATA_PATH)
+		if file_name.endswith(DIRS.BURST_FILE_SUFFIX) and not os.path.isdir(plots_path(file_name[:-len(DIRS.BURST_FILE_SUFFIX)]))
+	)
+
+# ----------------------------------------------------------------------
+if __name__ == '__main__': # Renders the given timestamps, or all the bursts without plots.
+	for current_timestamp in (sys.argv[1:] if len(sys.argv) > 1 else bursts_to_render()):
+		print('Rendering plots of ' + current_timestamp)
+		try:
+			render_burst_plots(current_timestamp)
+		except Exception as e: # The other bursts are rendered anyway.
+			print('Could not render the plots of ' + current_timestamp + ': ' + repr(e))
+			plt.close('all')
@@ -1,15 +1,49 @@
 import threading
 import os
+import sys
+import subprocess
 from time import sleep
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import directories as DIRS
+from fix_trigger_problem import fix_trigger_problem
+from process_data import process_data as process_burst_data
+from utils.job_queue import job_queue
+from utils.transference_aggregator import transference_aggregator
+from utils.results_catalog import results_catalog
+from plot_transference import update_aggregate
 
 N_SIMULTANEOUS_PROCESSING_THREADS = 4
 N_MEASUREMENT_RUNS = 20
+QUEUE_POLLING_TIME = .05 # Seconds between checks for new bursts when all the workers are idle.
+RENDER_PLOTS = True # Plot the processed bursts in a low priority process (see "render_plots.py") while the next ones are processed.
 
-def process():
-	print('Calling "process_data.py"')
-	os.system("python process_data.py")
+def process(current_timestamp, stage):
+	"""Runs in the processes of the pool, which are started once and
+	reused for all the bursts. Does all the stages of the burst starting
+	from "stage" and keeps its state in the job queue."""
+	jobs = job_queue(DIRS.JOB_QUEUE_FILE)
+	try:
+		if stage == 'fix_trigger':
+			fix_trigger_problem(current_timestamp)
+			jobs.advance(current_timestamp, keep_claimed=True)
+		process_burst_data(current_timestamp)
+		jobs.advance(current_timestamp)
+	except Exception as e:
+		jobs.failed(current_timestamp, repr(e))
+		raise
+	finally:
+		jobs.close()
+	return current_timestamp
+
+def start_low_priority(command):
+	"""Starts "command" in a process with the lowest priority, so it only 
+	uses the CPU time the measurement and the processing leave idle."""
+	if os.name == 'nt':
+		return subprocess.Popen(command, creationflags=subprocess.IDLE_PRIORITY_CLASS)
+	process = subprocess.Popen(command) # Not "preexec_fn", which is not safe with the measuring thread running.
+	os.setpriority(os.PRIO_PROCESS, process.pid, 19)
+	return process
 
 def measure(n_runs=1):
 	if not isinstance(n_runs, int) or n_runs < 1:
@@ -22,42 +56,56 @@ def measure(n_runs=1):
 	print('Thread: ' + threading.current_thread().getName() + ' --> Measurements finished!')
 
 def process_data(measuring_thread):
-	processing_threads = []
-	while measuring_thread.isAlive() is True or len(os.listdir(DIRS.UNPROCESSED_DATA_PATH)) > 0:
-		if len(os.listdir(DIRS.UNPROCESSED_DATA_PATH)) > 0: # This means there is data awaiting to be processed.
-			if len(processing_threads) < N_SIMULTANEOUS_PROCESSING_THREADS:
-				print('Calling "fix_trigger_problem.py"')
-				os.system("python fix_trigger_problem.py")
-				processing_threads.append(threading.Thread(target=process))
-				processing_threads[-1].start()
-			else:
-				for k in range(len(processing_threads)):
-					if processing_threads[k].isAlive() is False: # This means that this thread is available to process new data.
-						print('Calling "fix_trigger_problem.py"')
-						os.system("python fix_trigger_problem.py")
-						processing_threads[k] = threading.Thread(target=process)
-						processing_threads[k].start()
-					sleep(1) # This is to avoid two threads tying to process the same data.
-		sleep(1)
-	while True: # Check that all data has been processed.
-		for k in range(len(processing_threads)):
-			if processing_threads[k].isAlive() is False:
-				processing_threads.pop(k)
-		if len(processing_threads) == 0:
-			print('Thread: ' + threading.current_thread().getName() + ' --> Processing finished')
-			return
+	jobs = job_queue(DIRS.JOB_QUEUE_FILE)
+	jobs.requeue_claimed() # Bursts that were being processed when a previous run was interrupted.
+	jobs.sync_with_directory(DIRS.UNPROCESSED_DATA_PATH, 'fix_trigger', DIRS.BURST_FILE_SUFFIX) # Bursts not added by "measure_many_frequencies.py".
+	jobs.sync_with_directory(DIRS.TRIGGER_PROBLEM_FIXED_DATA_PATH, 'process', DIRS.BURST_FILE_SUFFIX)
+	aggregator = transference_aggregator.load(DIRS.TRANSFERENCE_AGGREGATE_FILE) # Kept up to date while measuring, so "plot_transference.py" only has to plot.
+	catalog = results_catalog(DIRS.RESULTS_CATALOG_FILE)
+	processing_jobs = {} # Future --> timestamp
+	renderer = None # Process running "render_plots.py".
+	with ProcessPoolExecutor(max_workers=N_SIMULTANEOUS_PROCESSING_THREADS) as pool:
+		while True:
+			measuring = measuring_thread.is_alive() # Read it before claiming so no burst is missed.
+			job = jobs.claim() if len(processing_jobs) < N_SIMULTANEOUS_PROCESSING_THREADS else None
+			if job is not None:
+				processing_jobs[pool.submit(process, *job)] = job[0]
+				continue
+			if not measuring and len(processing_jobs) == 0 and jobs.count() == 0:
+				break
+			if len(processing_jobs) == 0:
+				sleep(QUEUE_POLLING_TIME)
+				continue
+			finished_jobs, _ = wait(processing_jobs, timeout=QUEUE_POLLING_TIME, return_when=FIRST_COMPLETED)
+			for job in finished_jobs:
+				if job.exception() is not None:
+					print('Thread: ' + threading.current_thread().getName() + ' --> Processing of ' + processing_jobs[job] + ' failed: ' + repr(job.exception()))
+				processing_jobs.pop(job)
+			if len(finished_jobs) > 0 and update_aggregate(aggregator, catalog) > 0:
+				aggregator.save(DIRS.TRANSFERENCE_AGGREGATE_FILE)
+			if RENDER_PLOTS and len(finished_jobs) > 0 and (renderer is None or renderer.poll() is not None):
+				renderer = start_low_priority([sys.executable, 'render_plots.py']) # It renders all the bursts processed until now.
+	if RENDER_PLOTS:
+		if renderer is not None:
+			renderer.wait()
+		start_low_priority([sys.executable, 'render_plots.py']).wait() # The bursts processed after it started.
+	for timestamp, stage, error in jobs.failures():
+		print('Thread: ' + threading.current_thread().getName() + ' --> Could not process ' + timestamp + ' (' + stage + '): ' + error)
+	jobs.close()
+	catalog.close()
+	print('Thread: ' + threading.current_thread().getName() + ' --> Processing finished')
 # ----------------------------------------------------------------------
 
-measuring_thread = threading.Thread(target=measure, name='measuring', args=(N_MEASUREMENT_RUNS,))
-data_processing_thread = threading.Thread(target=process_data, name='data processing', args=(measuring_thread,))
+if __name__ == '__main__': # The processes of the pool import this file.
+	measuring_thread = threading.Thread(target=measure, name='measuring', args=(N_MEASUREMENT_RUNS,))
+	data_processing_thread = threading.Thread(target=process_data, name='data processing', args=(measuring_thread,))
 
-measuring_thread.start()
-data_processing_thread.start()
-print('Measuring and processing data...')
-while data_processing_thread.isAlive() is True:
-	sleep(1)
-print('Processing transference data...')
-os.system("python plot_transference.py")
+	measuring_thread.start()
+	data_processing_thread.start()
+	print('Measuring and processing data...')
+	data_processing_thread.join()
+	print('Processing transference data...')
+	os.system("python plot_transference.py")
 
-# ~ sleep(1000)
-# ~ os.system('shutdown -s')
+	# ~ sleep(1000)
+	# ~ os.system('shutdown -s')
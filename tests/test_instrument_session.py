@@ -0,0 +1,38 @@
+import time
+
+from utils.instrument_session import instrument_session
+
+class fake_instrument:
+	def __init__(self, resource_name):
+		self.resource_name = resource_name
+		self.commands = []
+	
+	def write(self, command):
+		time.sleep(0.01)
+		self.commands.append(command)
+	
+	def query(self, command):
+		self.write(command) # Must not be counted twice.
+		time.sleep(0.01)
+		return '0'
+
+def wait_and_query(instrument, command):
+	time.sleep(0.1) # E.g. waiting for the readings, this is not I/O.
+	return instrument.query(command)
+
+def test_io_time_counts_only_the_visa_calls():
+	instruments = [fake_instrument('GPIB0::21::INSTR'), fake_instrument('GPIB0::22::INSTR')]
+	with instrument_session(instruments) as session:
+		assert session.map(wait_and_query, ['MCOUNT?']*2) == ['0', '0']
+		for name in session.names:
+			assert 0.02 <= session.io_time[name] < 0.05
+			assert session.busy_time[name] >= 0.12
+	assert 'write' not in vars(instruments[0]) # The methods are not timed after closing.
+	assert instruments[0].commands == ['MCOUNT?']
+
+def test_operations_on_different_instruments_overlap():
+	instruments = [fake_instrument('GPIB0::21::INSTR'), fake_instrument('GPIB0::22::INSTR')]
+	with instrument_session(instruments) as session:
+		start_time = time.time()
+		session.map(wait_and_query, ['MCOUNT?']*2)
+		assert time.time() - start_time < 0.2
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.job_queue import job_queue, STAGES
+
+def test_bursts_go_through_all_the_stages(tmp_path):
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'))
+	jobs.add('0002')
+	jobs.add('0001')
+	jobs.add('0001', 'process') # Already in the queue, not changed.
+	assert jobs.count() == 2
+	done = []
+	while True:
+		job = jobs.claim()
+		if job is None:
+			break
+		done.append(job)
+		jobs.advance(job[0])
+	assert done == [('0001', 'fix_trigger'), ('0001', 'process'), ('0002', 'fix_trigger'), ('0002', 'process')] # The oldest burst first.
+	assert jobs.count() == 0 and jobs.count('done') == 2
+	jobs.close()
+
+def test_claim_of_one_stage(tmp_path):
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'))
+	jobs.add('0001')
+	jobs.add('0002', STAGES[-1])
+	assert jobs.claim(STAGES[-1]) == ('0002', STAGES[-1])
+	assert jobs.claim(STAGES[-1]) is None
+	jobs.close()
+
+def test_advance_keeping_the_claim(tmp_path):
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'))
+	jobs.add('0001')
+	timestamp, _ = jobs.claim()
+	jobs.advance(timestamp, keep_claimed=True)
+	assert jobs.claim() is None # Nobody else can take it.
+	assert jobs.count('claimed') == 1
+	jobs.advance(timestamp)
+	assert jobs.count('done') == 1
+	jobs.close()
+
+def test_failed_bursts_are_retried_up_to_max_attempts(tmp_path):
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'), max_attempts=2)
+	jobs.add('0001')
+	for _ in range(2):
+		timestamp, stage = jobs.claim()
+		jobs.failed(timestamp, ValueError('bad burst'))
+	assert jobs.claim() is None
+	assert jobs.count() == 0
+	assert jobs.failures() == [('0001', 'fix_trigger', 'bad burst')]
+	jobs.close()
+
+def test_requeue_claimed(tmp_path):
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'))
+	jobs.add('0001')
+	jobs.claim()
+	jobs.close() # The worker died.
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'))
+	assert jobs.claim() is None
+	jobs.requeue_claimed()
+	assert jobs.claim() == ('0001', 'fix_trigger')
+	jobs.close()
+
+def test_sync_with_directory(tmp_path):
+	(tmp_path/'bursts').mkdir()
+	for file_name in ['0001.burst', '0002.burst', '0003.txt']:
+		(tmp_path/'bursts'/file_name).write_bytes(b'')
+	jobs = job_queue(str(tmp_path/'jobs.sqlite'))
+	jobs.sync_with_directory(str(tmp_path/'bursts'), 'process', '.burst')
+	assert jobs.count() == 2
+	assert jobs.claim() == ('0001', 'process')
+	jobs.close()
+
+def test_a_burst_is_never_given_to_two_workers(tmp_path):
+	file_name = str(tmp_path/'jobs.sqlite')
+	jobs = job_queue(file_name)
+	for k in range(200):
+		jobs.add('{:04d}'.format(k))
+	def worker(_):
+		worker_jobs = job_queue(file_name)
+		claimed = []
+		while True:
+			job = worker_jobs.claim()
+			if job is None:
+				break
+			claimed.append(job[0])
+		worker_jobs.close()
+		return claimed
+	with ThreadPoolExecutor(max_workers=4) as pool:
+		claimed = sum(pool.map(worker, range(4)), [])
+	assert sorted(claimed) == ['{:04d}'.format(k) for k in range(200)]
+	jobs.close()
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from utils.lock_in_process import lock_in_process_batch
+
+FREQUENCY = 0.05 # Cycles per sample, 50 whole periods in 1000 samples.
+
+def bursts(n_bursts, ratio=0.74, phi=0.3, noise_rms=1e-3, n_samples=1000, seed=0):
+	rng = np.random.default_rng(seed)
+	n = np.arange(n_samples)
+	S1 = np.sin(2*np.pi*FREQUENCY*n) + 0.1 + rng.normal(0, noise_rms, (n_bursts, n_samples))
+	S2 = ratio*np.sin(2*np.pi*FREQUENCY*n + phi) - 0.2 + rng.normal(0, noise_rms, (n_bursts, n_samples))
+	return S1, S2
+
+def test_recovers_known_ratio_and_phase():
+	S1, S2 = bursts(1, noise_rms=0)
+	ratio, ratio_std, phi, phi_std = lock_in_process_batch(S1[0], S2[0])
+	assert abs(ratio - 0.74) < 1e-10
+	assert abs(phi - 0.3) < 1e-10
+	assert ratio_std < 1e-10 and phi_std < 1e-10
+
+def test_batch_is_the_same_as_one_by_one():
+	S1, S2 = bursts(5)
+	batch = lock_in_process_batch(S1, S2)
+	for k in range(len(S1)):
+		np.testing.assert_allclose([result[k] for result in batch], lock_in_process_batch(S1[k], S2[k]), rtol=1e-12)
+
+def test_noise_and_the_jackknife():
+	S1, S2 = bursts(400, noise_rms=1e-2)
+	ratio, ratio_std, phi, phi_std = lock_in_process_batch(S1, S2)
+	expected_ratio = 0.74/(1 + 2*1e-2**2) # The noise of S1 adds to its power (of the analytic signal, amplitude squared).
+	assert abs(ratio.mean() - expected_ratio) < 3*ratio.std()/np.sqrt(len(ratio))
+	assert abs(phi.mean() - 0.3) < 3*phi.std()/np.sqrt(len(phi))
+	assert 0.7 < np.median(ratio_std)/ratio.std() < 1.4
+	assert 0.7 < np.median(phi_std)/phi.std() < 1.4
+
+def test_invalid_input():
+	S1, S2 = bursts(2)
+	with pytest.raises(ValueError):
+		lock_in_process_batch(S1, S2[:,:-1])
+	with pytest.raises(ValueError):
+		lock_in_process_batch(S1[:,:50], S2[:,:50])
+	with pytest.raises(ValueError):
+		lock_in_process_batch(S1, S2, n_blocks=1)
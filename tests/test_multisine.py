@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from utils import multisine
+
+HARMONICS = [1, 2, 5, 10, 20, 50]
+PERIODS, NUMBER_OF_SAMPLES = 13, 4096 # Coherent, 13 and 4096 are coprime.
+
+def burst(harmonics, amplitudes, phases, noise_rms=0, seed=0):
+	n = np.arange(NUMBER_OF_SAMPLES)
+	signal = np.sum([a*np.sin(2*np.pi*h*PERIODS*n/NUMBER_OF_SAMPLES + p) for h, a, p in zip(harmonics, amplitudes, phases)], axis=0)
+	return signal + 0.1 + np.random.default_rng(seed).normal(0, noise_rms, NUMBER_OF_SAMPLES)
+
+def test_waveform():
+	signal = multisine.waveform(HARMONICS)
+	assert len(signal) == multisine.ARBITRARY_WAVEFORM_POINTS and np.abs(signal).max() == 1
+	spectrum = np.abs(np.fft.rfft(signal))
+	np.testing.assert_array_equal(np.sort(np.argsort(spectrum)[-len(HARMONICS):]), HARMONICS)
+	np.testing.assert_allclose(spectrum[HARMONICS], spectrum[HARMONICS[0]]) # Equal amplitudes.
+	with pytest.raises(ValueError):
+		multisine.waveform([1, 1024], n_points=2048)
+
+def test_schroeder_phases_lower_the_crest_factor():
+	harmonics = np.arange(1, 21) # Schroeder phases are meant for consecutive harmonics.
+	zero_phases = multisine.waveform(harmonics, phases=np.zeros(len(harmonics)))
+	schroeder = multisine.waveform(harmonics)
+	crest_factor = lambda signal: np.abs(signal).max()/np.sqrt(np.mean(signal**2))
+	assert crest_factor(schroeder) < 2 < crest_factor(zero_phases)
+
+def test_tone_bins():
+	bins, folded = multisine.tone_bins([1, 200], 13, 4096)
+	np.testing.assert_array_equal(bins, [13, 4096 - 2600])
+	np.testing.assert_array_equal(folded, [False, True])
+	with pytest.raises(ValueError):
+		multisine.tone_bins([1, 2], 2, 4) # The second tone falls in the Nyquist bin.
+	with pytest.raises(ValueError):
+		multisine.tone_bins([1, 4097], 1, 4096) # The same bin.
+
+def test_transference_of_known_tones():
+	harmonics = HARMONICS + [200] # Folded from the upper half of the spectrum.
+	ratios = np.linspace(1, 0.5, len(harmonics))
+	phis = np.linspace(-0.1, -1, len(harmonics))
+	phases = multisine.schroeder_phases(len(harmonics))
+	S1 = burst(harmonics, np.ones(len(harmonics)), phases)
+	S2 = burst(harmonics, ratios, phases + phis)
+	ratio, ratio_std, phi, phi_std = multisine.transference(S1, S2, harmonics, PERIODS)
+	np.testing.assert_allclose(ratio, ratios, atol=1e-10)
+	np.testing.assert_allclose(phi, phis, atol=1e-10)
+	lag = 3 # S1[n] corresponds to S2[n+lag].
+	ratio, ratio_std, phi, phi_std = multisine.transference(S1, np.roll(S2, lag), harmonics, PERIODS, lag=lag)
+	np.testing.assert_allclose(ratio, ratios, atol=1e-10)
+	np.testing.assert_allclose(phi, phis, atol=1e-10)
+
+def test_uncertainties_follow_the_noise():
+	ratios, phis = np.linspace(1, 0.5, len(HARMONICS)), np.linspace(-0.1, -1, len(HARMONICS))
+	phases = multisine.schroeder_phases(len(HARMONICS))
+	results = []
+	for seed in range(200):
+		S1 = burst(HARMONICS, np.ones(len(HARMONICS)), phases, noise_rms=1e-2, seed=2*seed)
+		S2 = burst(HARMONICS, ratios, phases + phis, noise_rms=1e-2, seed=2*seed+1)
+		results.append(multisine.transference(S1, S2, HARMONICS, PERIODS))
+	ratio, ratio_std, phi, phi_std = np.moveaxis(np.array(results), 1, 0)
+	np.testing.assert_allclose(ratio.mean(axis=0), ratios, atol=4*ratio_std.mean()/np.sqrt(len(results)))
+	np.testing.assert_allclose(phi.mean(axis=0), phis, atol=4*phi_std.mean()/np.sqrt(len(results)))
+	np.testing.assert_allclose(ratio_std.mean(axis=0), ratio.std(axis=0), rtol=0.25)
+	np.testing.assert_allclose(phi_std.mean(axis=0), phi.std(axis=0), rtol=0.25)
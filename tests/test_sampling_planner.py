@@ -0,0 +1,58 @@
+import math
+import numpy as np
+import pytest
+
+from utils.sampling_planner import plan_burst, plan_sweep, TIMER_RESOLUTION, MAXIMUM_SAMPLES
+from utils.HP3458A import MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE
+
+def assert_coherent(plan):
+	assert math.gcd(plan.periods, plan.number_of_samples) == 1
+	assert plan.number_of_samples <= MAXIMUM_SAMPLES
+	sampling_period = 1/plan.sampling_frequency
+	assert abs(sampling_period/TIMER_RESOLUTION - round(sampling_period/TIMER_RESOLUTION)) < 1e-6
+	assert plan.sampling_frequency <= MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE*(1 + 1e-9)
+	assert abs(plan.generator_frequency*plan.number_of_samples/plan.sampling_frequency - plan.periods) < 1e-6
+
+@pytest.mark.parametrize('generator_frequency', [40, 123.4, 1000, 4321])
+def test_direct_sampling(generator_frequency):
+	plan = plan_burst(generator_frequency, generator_frequency*10, 10200)
+	assert_coherent(plan)
+	assert not plan.subsampling
+	assert abs(plan.generator_frequency/generator_frequency - 1) <= 1e-4
+	assert plan.number_of_samples >= 0.9*10200
+
+def test_subsampling():
+	plan = plan_burst(100000, 1000000, 10200)
+	assert_coherent(plan)
+	assert plan.subsampling
+	assert abs(plan.generator_frequency/100000 - 1) <= 1e-4
+	assert plan.periods > plan.number_of_samples # More than one period between samples.
+
+def test_samples_cover_the_period():
+	# A sine sampled with the plan has one sample at each of N equally spaced phases.
+	for generator_frequency, sampling_frequency in [(1000, 10000), (100000, 1000000)]:
+		plan = plan_burst(generator_frequency, sampling_frequency, 10200)
+		phases = np.sort(np.arange(plan.number_of_samples)*plan.periods % plan.number_of_samples)
+		np.testing.assert_array_equal(phases, np.arange(plan.number_of_samples))
+		n = np.arange(plan.number_of_samples)
+		spectrum = np.abs(np.fft.rfft(np.sin(2*np.pi*plan.generator_frequency/plan.sampling_frequency*n)))
+		alias = plan.periods % plan.number_of_samples
+		assert np.argmax(spectrum) == min(alias, plan.number_of_samples - alias)
+		assert np.sort(spectrum)[-2] < 1e-6*spectrum.max() # No leakage.
+
+def test_number_of_samples_is_limited_by_the_memory():
+	plan = plan_burst(1000, 10000, 10*MAXIMUM_SAMPLES)
+	assert_coherent(plan)
+	assert plan.number_of_samples <= MAXIMUM_SAMPLES
+
+def test_sweep():
+	frequencies = [100000, 1000, 40]
+	plans = plan_sweep(frequencies, [f*10 for f in frequencies], 10200)
+	assert len(plans) == 3
+	for plan, frequency in zip(plans, frequencies):
+		assert_coherent(plan)
+		assert abs(plan.generator_frequency/frequency - 1) <= 1e-4
+
+def test_impossible_plan():
+	with pytest.raises(ValueError):
+		plan_burst(1e-3, 10, 3)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils.sine_fit import sine_fit, running_sine_fit
+
+OMEGA = 2*np.pi*0.0123 # Radians per sample.
+
+def noisy_sine(n_samples, V_p=1.3, phi=-2.8, V_os=0.2, noise_rms=1e-3, seed=0):
+	x = np.arange(n_samples)
+	y = V_p*np.sin(OMEGA*x + phi) + V_os + np.random.default_rng(seed).normal(0, noise_rms, n_samples)
+	return x, y
+
+def test_recovers_known_sine():
+	x, y = noisy_sine(10000)
+	pfit, pcov = sine_fit(x, y, OMEGA)
+	np.testing.assert_allclose(pfit, [1.3, -2.8, 0.2], atol=1e-4)
+	np.testing.assert_allclose(np.sqrt(np.diag(pcov)), [np.sqrt(2/10000)*1e-3, np.sqrt(2/10000)*1e-3/1.3, np.sqrt(1/10000)*1e-3], rtol=0.05)
+
+def test_amplitude_is_positive():
+	x, y = noisy_sine(1000, V_p=-0.5) # The same as V_p=0.5 with phi shifted by pi.
+	pfit, _ = sine_fit(x, y, OMEGA)
+	assert pfit[0] > 0
+	assert abs(pfit[0] - 0.5) < 1e-3
+	assert abs(np.angle(np.exp(1j*(pfit[1] - (-2.8 + np.pi))))) < 1e-2
+
+def test_without_offset():
+	x, y = noisy_sine(1000, V_os=0)
+	pfit, pcov = sine_fit(x, y, OMEGA, offset=False)
+	assert len(pfit) == 2 and pcov.shape == (2, 2)
+	np.testing.assert_allclose(pfit, [1.3, -2.8], atol=1e-3)
+
+def test_chunks_give_the_same_fit():
+	x, y = noisy_sine(10000)
+	fit = running_sine_fit(OMEGA)
+	for k in range(0, len(x), 4096):
+		fit.update(x[k:k+4096], y[k:k+4096])
+	pfit, pcov = fit.result()
+	pfit_single, pcov_single = sine_fit(x, y, OMEGA)
+	np.testing.assert_allclose(pfit, pfit_single, rtol=1e-9, atol=1e-12)
+	np.testing.assert_allclose(pcov, pcov_single, rtol=1e-6, atol=1e-20)
+
+def test_residuals_of_a_large_sine():
+	# The residual sigma must not be lost in the cancellation of the squared 10 V signal.
+	x, y = noisy_sine(100000, V_p=10, noise_rms=3e-7)
+	fit = running_sine_fit(OMEGA)
+	for k in range(0, len(x), 4096):
+		fit.update(x[k:k+4096], y[k:k+4096])
+	_, pcov = fit.result()
+	assert abs(np.sqrt(pcov[2,2]*len(x)) - 3e-7) < 0.1*3e-7
+
+def test_systematic_error_is_added_in_quadrature():
+	x, y = noisy_sine(10000)
+	_, pcov = sine_fit(x, y, OMEGA)
+	_, pcov_systematic = sine_fit(x, y, OMEGA, yerr_systematic=1e-3)
+	np.testing.assert_allclose(pcov_systematic, 2*pcov, rtol=0.05, atol=1e-20)
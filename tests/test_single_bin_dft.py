@@ -0,0 +1,32 @@
+import numpy as np
+
+from utils.single_bin_dft import single_bin_dft, transference
+
+FREQUENCY = 0.01234 # Cycles per sample, not a whole number of cycles in the bursts.
+
+def cosine(n_samples, amplitude, phase, offset=0, noise_rms=0, seed=0):
+	n = np.arange(n_samples)
+	return amplitude*np.cos(2*np.pi*FREQUENCY*n + phase) + offset + np.random.default_rng(seed).normal(0, noise_rms, n_samples)
+
+def test_phasor_of_a_known_cosine():
+	# 12.34 cycles, the leakage from the image and the offset is removed.
+	C, covariance = single_bin_dft(cosine(1000, 1.7, -2.1, offset=0.4), FREQUENCY)
+	assert abs(C - 1.7*np.exp(-2.1j)) < 1e-10
+	assert np.all(np.abs(covariance) < 1e-20)
+
+def test_covariance_follows_the_noise():
+	phasors = []
+	for seed in range(300):
+		C, covariance = single_bin_dft(cosine(1000, 1.7, -2.1, offset=0.4, noise_rms=1e-2, seed=seed), FREQUENCY)
+		phasors.append([C.real, C.imag])
+	phasors = np.array(phasors)
+	np.testing.assert_allclose(phasors.mean(axis=0), [1.7*np.cos(-2.1), 1.7*np.sin(-2.1)], atol=3*np.sqrt(np.max(np.diag(covariance))/len(phasors)))
+	np.testing.assert_allclose(np.diag(np.cov(phasors.T)), np.diag(covariance), rtol=0.25)
+
+def test_transference_of_known_signals():
+	ratio, ratio_std, phi, phi_std = transference(cosine(1000, 2, 0.5, offset=-0.1), cosine(1000, 1.48, 0.8, offset=0.3), FREQUENCY)
+	assert abs(ratio - 0.74) < 1e-10
+	assert abs(phi - 0.3) < 1e-10
+	ratio, ratio_std, phi, phi_std = transference(cosine(1000, 2, 0.5, noise_rms=1e-3), cosine(1000, 1.48, 0.8, noise_rms=1e-3, seed=1), FREQUENCY)
+	assert abs(ratio - 0.74) < 4*ratio_std and 0 < ratio_std < 1e-3
+	assert abs(phi - 0.3) < 4*phi_std and 0 < phi_std < 1e-3
@@ -0,0 +1,101 @@
+import numpy as np
+
+from utils.transference_aggregator import transference_aggregator
+
+def synthetic_results(n_bursts=60, seed=0):
+	# Three frequencies with a known ratio and phase each plus noise.
+	rng = np.random.default_rng(seed)
+	frequencies = rng.choice([10., 100., 1000.], n_bursts)
+	values = np.stack((1 - frequencies*1e-4, -frequencies*1e-3), axis=-1) + rng.normal(0, 1e-3, (n_bursts, 2))
+	std_devs = rng.uniform(1e-4, 1e-3, (n_bursts, 2))
+	timestamps = ['{:04d}'.format(k) for k in range(n_bursts)]
+	return frequencies, values, std_devs, timestamps
+
+def assert_same_result(aggregator_a, aggregator_b):
+	frequencies_a, T_abs_a, T_phi_a, count_a = aggregator_a.result()
+	frequencies_b, T_abs_b, T_phi_b, count_b = aggregator_b.result()
+	np.testing.assert_array_equal(frequencies_a, frequencies_b)
+	np.testing.assert_array_equal(count_a, count_b)
+	for a, b in [(T_abs_a, T_abs_b), (T_phi_a, T_phi_b)]:
+		np.testing.assert_allclose(a.n, b.n, rtol=1e-12)
+		np.testing.assert_allclose(a.s, b.s, rtol=1e-9)
+
+def test_result_of_known_bursts():
+	frequencies, values, std_devs, _ = synthetic_results()
+	aggregator = transference_aggregator()
+	aggregator.add(frequencies, values, std_devs)
+	result_frequencies, T_abs, T_phi, count = aggregator.result()
+	np.testing.assert_array_equal(result_frequencies, [10, 100, 1000])
+	for k, frequency in enumerate(result_frequencies):
+		x, s = values[frequencies == frequency], std_devs[frequencies == frequency]
+		N = len(x)
+		std = x.std(axis=0, ddof=1)
+		std_s = np.sqrt(np.sum((x - x.mean(axis=0))**2*s**2, axis=0))/(N - 1)/std
+		assert count[k] == N
+		np.testing.assert_allclose([T_abs.n[k], T_phi.n[k]], x.mean(axis=0), rtol=1e-12)
+		np.testing.assert_allclose([T_abs.s[k], T_phi.s[k]], np.sqrt(np.sum(s**2, axis=0))/N + std + std_s, rtol=1e-9)
+	np.testing.assert_allclose(T_abs.n, 1 - result_frequencies*1e-4, atol=1e-3)
+	np.testing.assert_allclose(T_phi.n, -result_frequencies*1e-3, atol=1e-3)
+
+def test_incremental_is_the_same_as_all_at_once():
+	frequencies, values, std_devs, timestamps = synthetic_results()
+	all_at_once = transference_aggregator()
+	all_at_once.add(frequencies, values, std_devs, timestamps)
+	incremental = transference_aggregator()
+	for k in range(0, len(frequencies), 7):
+		incremental.add(frequencies[k:k+7], values[k:k+7], std_devs[k:k+7], timestamps[k:k+7])
+	assert_same_result(incremental, all_at_once)
+
+def test_results_already_added_are_skipped():
+	frequencies, values, std_devs, timestamps = synthetic_results()
+	aggregator = transference_aggregator()
+	assert aggregator.add(frequencies[:40], values[:40], std_devs[:40], timestamps[:40]) == 40
+	assert aggregator.add(frequencies, values, std_devs, timestamps) == 20
+	reference = transference_aggregator()
+	reference.add(frequencies, values, std_devs)
+	assert_same_result(aggregator, reference)
+
+def test_reprocessed_burst_replaces_its_result():
+	frequencies, values, std_devs, timestamps = synthetic_results()
+	aggregator = transference_aggregator()
+	aggregator.add(frequencies, values, std_devs, timestamps)
+	reprocessed_values, reprocessed_std_devs = values.copy(), std_devs.copy()
+	reprocessed_values[[3,17]] += 0.5
+	reprocessed_std_devs[[3,17]] *= 2
+	assert aggregator.add(frequencies, reprocessed_values, reprocessed_std_devs, timestamps) == 2
+	reference = transference_aggregator()
+	reference.add(frequencies, reprocessed_values, reprocessed_std_devs)
+	assert_same_result(aggregator, reference)
+
+def test_multisine_burst_has_one_result_per_frequency():
+	aggregator = transference_aggregator()
+	assert aggregator.add([10, 100], [[1, 0], [.9, -.1]], [[1e-3, 1e-3], [1e-3, 1e-3]], ['0000', '0000']) == 2
+	assert aggregator.add([10, 100], [[1, 0], [.8, -.2]], [[1e-3, 1e-3], [1e-3, 1e-3]], ['0000', '0000']) == 1
+	frequencies, T_abs, T_phi, count = aggregator.result()
+	np.testing.assert_array_equal(count, [1, 1])
+	np.testing.assert_allclose(T_abs.n, [1, .8])
+	np.testing.assert_allclose(T_phi.n, [0, -.2])
+
+def test_frequency_left_without_bursts_is_dropped():
+	aggregator = transference_aggregator()
+	aggregator.add([10, 100], [[1, 0], [.9, -.1]], [[1e-3, 1e-3], [1e-3, 1e-3]], ['0000', '0001'])
+	aggregator._merge(*aggregator._batch(np.array([100.]), np.array([[.9, -.1]]), np.array([[1e-3, 1e-3]])), sign=-1)
+	frequencies, _, _, count = aggregator.result()
+	np.testing.assert_array_equal(frequencies, [10])
+	np.testing.assert_array_equal(count, [1])
+
+def test_save_and_load(tmp_path):
+	frequencies, values, std_devs, timestamps = synthetic_results()
+	aggregator = transference_aggregator()
+	aggregator.add(frequencies[:40], values[:40], std_devs[:40], timestamps[:40])
+	file_name = str(tmp_path/'aggregate.npz')
+	aggregator.save(file_name)
+	loaded = transference_aggregator.load(file_name)
+	assert_same_result(loaded, aggregator)
+	values = values.copy()
+	values[5] += 0.1 # Reprocessed after saving.
+	assert loaded.add(frequencies, values, std_devs, timestamps) == 21
+	reference = transference_aggregator()
+	reference.add(frequencies, values, std_devs)
+	assert_same_result(loaded, reference)
+	assert len(transference_aggregator.load(str(tmp_path/'missing.npz')).frequencies) == 0
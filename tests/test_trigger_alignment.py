@@ -0,0 +1,50 @@
+import numpy as np
+
+import utils.trigger_alignment as trigger_alignment
+
+def shifted(signal, lag, length, start=20):
+	"""Returns "a" and "b" taken from "signal" so that a[n] corresponds
+	to b[n+lag]."""
+	return signal[start:start+length], signal[start-lag:start-lag+length]
+
+def test_estimate_lag_of_noise():
+	noise = np.random.default_rng(0).normal(size=1100)
+	for lag in [-7, -1, 0, 3, 12]:
+		a, b = shifted(noise, lag, 1000)
+		assert trigger_alignment.estimate_lag(a, b) == lag
+
+def test_estimate_lag_subsample():
+	n = np.arange(2000)
+	frequency = 0.0123
+	a = np.sin(2*np.pi*frequency*n)
+	b = np.sin(2*np.pi*frequency*(n - 2.3))
+	assert abs(trigger_alignment.estimate_lag(a, b, trigger_alignment.half_period(frequency), subsample=True) - 2.3) < 0.05
+
+def test_sine_lag_does_not_jump_a_period():
+	# With a phase between the channels, the peak one period away (at -8) matches better than the true lag unless the search is limited to half a period.
+	frequency = 0.1013
+	phase = 0.05
+	n = np.arange(-20, 10020)
+	a, _ = shifted(np.sin(2*np.pi*frequency*n), 2, 10000)
+	_, b = shifted(0.7*np.sin(2*np.pi*frequency*n + phase), 2, 10000)
+	lag = trigger_alignment.estimate_lag(a, b, trigger_alignment.half_period(frequency))
+	assert lag == 2
+	m = np.arange(10000)
+	phase_a, phase_b = (np.angle(np.sum(x*np.exp(-2j*np.pi*frequency*m))) for x in (a, b))
+	assert abs(np.angle(np.exp(1j*(phase_b + 2*np.pi*frequency*lag - phase_a))) - phase) < 1e-3 # As corrected by "measure_many_frequencies.quick_look_transference".
+
+def test_half_period():
+	assert trigger_alignment.half_period(0.1) == 4 # A lag of 5 is a sign flip, not a peak.
+	assert trigger_alignment.half_period(0.1013) == 4
+	assert trigger_alignment.half_period(1/9) == 4
+	assert trigger_alignment.half_period(1.1) == 4 # Subsampled, its alias is 0.1.
+	assert trigger_alignment.half_period(0.9) == 4
+	assert trigger_alignment.half_period(0.01) == 49
+	assert trigger_alignment.half_period(2.0) is None
+
+def test_align():
+	signal = np.arange(100)
+	for lag in [-3, 0, 4]:
+		a, b = trigger_alignment.align(*shifted(signal, lag, 50), lag)
+		assert len(a) == len(b) > 0
+		np.testing.assert_array_equal(a, b)
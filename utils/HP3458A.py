@@ -1,65 +1,247 @@
 import numpy as np
-import struct # This is used in parsing bynary data.
+import time
+import weakref
+import warnings
 
 reading_memory_bytes = 20480 # This number is returned by command 'MSIZE?'.
 read_termination = '\r'
 MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE = 50000 # Samples per second.
+MEMORY_FORMAT_DTYPES = { # Numpy types of the readings in memory for each "MFORMAT?" answer.
+	2: np.dtype('>i2'), # SINT
+	3: np.dtype('>i4'), # DINT
+}
+
+VERIFY_STATE_CACHE = False # If True every cached query is also sent to the instrument to check the cache.
+FUNCTION_CODES = { # Numbers returned by "FUNC?" for each function.
+	'DCV': 1, 'ACV': 2, 'ACDCV': 3, 'OHM': 4, 'OHMF': 5, 'DCI': 6, 'ACI': 7, 
+	'ACDCI': 8, 'FREQ': 9, 'PER': 10, 'DSAC': 11, 'DSDC': 12, 'SSAC': 13, 'SSDC': 14,
+}
+CACHED_QUERIES = { # Queries answered by the state cache and the settings their answers depend on.
+	'FUNC?': ('FUNC',),
+	'RANGE?': ('FUNC',),
+	'APER?': ('FUNC', 'APER'),
+	'MFORMAT?': ('MFORMAT',),
+	'ISCALE?': ('FUNC', 'MFORMAT'),
+}
+
+# State cache ----------------------------------------------------------
+# For each instrument we keep a mirror of the settings written through 
+# "write" and the answers to the "CACHED_QUERIES" obtained for each 
+# combination of those settings. Thus, once a query has been answered by
+# the instrument for a given configuration, it is answered locally every
+# time the instrument is configured the same way (e.g. in every burst).
+_state_cache = weakref.WeakKeyDictionary()
+
+def _get_state(HP3458A):
+	if HP3458A not in _state_cache:
+		_state_cache[HP3458A] = {'settings': {}, 'answers': {}}
+	return _state_cache[HP3458A]
+
+def _record_command(settings, command):
+	for subcommand in command.split(';'):
+		subcommand = subcommand.strip().upper()
+		if subcommand == '':
+			continue
+		keyword, _, args = subcommand.partition(' ')
+		args = args.replace(' ', '')
+		if keyword == 'FUNC':
+			keyword, _, args = args.partition(',')
+		if keyword in FUNCTION_CODES:
+			settings['FUNC'] = (keyword, args)
+		elif keyword == 'RANGE':
+			if 'FUNC' in settings:
+				settings['FUNC'] = (settings['FUNC'][0], args)
+		elif keyword in ['MFORMAT', 'APER']:
+			settings[keyword] = args
+		elif keyword == 'NPLC':
+			settings.pop('APER', None)
+		elif keyword in ['PRESET', 'RESET']:
+			settings.clear()
+
+def write(HP3458A, command):
+	"""
+	Writes "command" to the instrument and records the settings it 
+	changes in the state cache. Several commands can be separated by ";".
+	All configuration commands must be sent through this function (or 
+	"invalidate_state" must be called) for the cache to be valid.
+	"""
+	HP3458A.write(command)
+	_record_command(_get_state(HP3458A)['settings'], command)
+
+def query(HP3458A, command, verify=None):
+	"""
+	Same as "HP3458A.query(command)" but the "CACHED_QUERIES" are 
+	answered from the state cache when possible. If "verify" is True (or
+	it is None and "VERIFY_STATE_CACHE" is True) the instrument is always
+	queried and a warning is issued if the cached answer was different.
+	"""
+	if verify is None:
+		verify = VERIFY_STATE_CACHE
+	state = _get_state(HP3458A)
+	if command not in CACHED_QUERIES or not all(setting in state['settings'] for setting in CACHED_QUERIES[command]):
+		return HP3458A.query(command)
+	key = (command,) + tuple(state['settings'][setting] for setting in CACHED_QUERIES[command])
+	if key in state['answers'] and verify is False:
+		return state['answers'][key]
+	answer = HP3458A.query(command)
+	if key in state['answers'] and state['answers'][key] != answer:
+		warnings.warn('State cache of "' + str(HP3458A) + '" answered "' + state['answers'][key] + '" to "' + command + '" but the instrument answered "' + answer + '"')
+	state['answers'][key] = answer
+	return answer
+
+def verify_state(HP3458A):
+	"""
+	Sends to the instrument every cached query that applies to its 
+	current settings and returns the list of those whose cached answer
+	was wrong (the cache is corrected).
+	"""
+	state = _get_state(HP3458A)
+	wrong_queries = []
+	for command in CACHED_QUERIES:
+		if not all(setting in state['settings'] for setting in CACHED_QUERIES[command]):
+			continue
+		key = (command,) + tuple(state['settings'][setting] for setting in CACHED_QUERIES[command])
+		cached_answer = state['answers'].get(key)
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore')
+			if cached_answer is not None and query(HP3458A, command, verify=True) != cached_answer:
+				wrong_queries.append(command)
+	return wrong_queries
+
+def invalidate_state(HP3458A):
+	"""
+	Forgets everything known about the instrument. Must be called if it 
+	is configured without using "write" (e.g. from the front panel).
+	"""
+	_state_cache.pop(HP3458A, None)
 
 def configure_sub_sampling(HP3458A, samples_per_burst, effective_sampling_frequency, max_input=1000):
-	HP3458A.write('PRESET FAST') # Configures the multimeter for fast readings, fast transfer to memory, and fast GPIB (see [1], page 218).
-	HP3458A.write('MEM FIFO') # ENABLE READING MEMORY, FIFO MODE.
-	HP3458A.write('MFORMAT SINT') # SINT READING MEMORY FORMAT.
-	HP3458A.write('OFORMAT SINT') # Set the output format when reading the samples in memory.
-	HP3458A.write('SSDC 1') # Sub-sampling mode, 10 V range.
-	HP3458A.write('SWEEP {},{}'.format(1/effective_sampling_frequency, samples_per_burst)) # Specifies to take "N" samples with an effective spacing of "T" micro seconds.
-	HP3458A.write('SSRC EXT') # Set external trigger.
-	HP3458A.write('TARM HOLD')
+	write(HP3458A, 'PRESET FAST') # Configures the multimeter for fast readings, fast transfer to memory, and fast GPIB (see [1], page 218).
+	write(HP3458A, 'MEM FIFO') # ENABLE READING MEMORY, FIFO MODE.
+	write(HP3458A, 'MFORMAT SINT') # SINT READING MEMORY FORMAT.
+	write(HP3458A, 'OFORMAT SINT') # Set the output format when reading the samples in memory.
+	write(HP3458A, 'SSDC 1') # Sub-sampling mode, 10 V range.
+	write(HP3458A, 'SWEEP {},{}'.format(1/effective_sampling_frequency, samples_per_burst)) # Specifies to take "N" samples with an effective spacing of "T" micro seconds.
+	write(HP3458A, 'SSRC EXT') # Set external trigger.
+	write(HP3458A, 'TARM HOLD')
 
 def configure_direct_digitalizing(HP3458A, samples_per_burst, effective_sampling_frequency, t_aper, max_input=1000):
-	HP3458A.write('PRESET DIG')
-	HP3458A.write('DSDC ' + str(np.abs(max_input)))
-	HP3458A.write('MEM LIFO') # ENABLE READING MEMORY, FIFO MODE.
-	HP3458A.write('MFORMAT SINT') # SINT READING MEMORY FORMAT.
-	HP3458A.write('OFORMAT SINT') # Set the output format when reading the samples in memory.
-	HP3458A.write('TIMER ' + str(1/effective_sampling_frequency)) # Specifies sampling frequency.
-	HP3458A.write('NRDGS ' + str(samples_per_burst) + ', TIMER') # Specifies the number of samples to be recorded and the event in which to sample (6 is for "timer").
-	HP3458A.write('TRIG EXT')
-	HP3458A.write('TARM AUTO')
+	write(HP3458A, 'PRESET DIG')
+	write(HP3458A, 'DSDC ' + str(np.abs(max_input)))
+	write(HP3458A, 'MEM LIFO') # ENABLE READING MEMORY, FIFO MODE.
+	write(HP3458A, 'MFORMAT SINT') # SINT READING MEMORY FORMAT.
+	write(HP3458A, 'OFORMAT SINT') # Set the output format when reading the samples in memory.
+	write(HP3458A, 'TIMER ' + str(1/effective_sampling_frequency)) # Specifies sampling frequency.
+	write(HP3458A, 'NRDGS ' + str(samples_per_burst) + ', TIMER') # Specifies the number of samples to be recorded and the event in which to sample (6 is for "timer").
+	write(HP3458A, 'TRIG EXT')
+	write(HP3458A, 'TARM AUTO')
 
 def configure_DCV_digitalizing(HP3458A, samples_per_burst, sampling_frequency, aper_time, max_input=1000):
-	HP3458A.write('PRESET DIG')
-	HP3458A.write('MEM LIFO')
+	write(HP3458A, 'PRESET DIG')
+	write(HP3458A, 'MEM LIFO')
 	if aper_time > 1.4e-6: # See 'DCV remarks' in http://literature.cdn.keysight.com/litweb/pdf/03458-90014.pdf
 		memory_format = 'DINT'
 	else:
 		memory_format = 'SINT'
-	HP3458A.write('MFORMAT ' + memory_format)
-	HP3458A.write('OFORMAT ' + memory_format)
-	HP3458A.write('TIMER ' + str(1/sampling_frequency)) # Specifies sampling frequency.
-	HP3458A.write('APER ' + str(aper_time)) # Set aper time (see http://literature.cdn.keysight.com/litweb/pdf/03458-90014.pdf table 5-2).
-	HP3458A.write('NRDGS ' + str(samples_per_burst) + ', TIMER') # Specifies the number of samples to be recorded and the event in which to sample (6 is for "timer").
-	HP3458A.write('TRIG EXT')
-	HP3458A.write('DCV ' + str(np.abs(max_input)))
-	HP3458A.write('TARM AUTO')
+	write(HP3458A, 'MFORMAT ' + memory_format)
+	write(HP3458A, 'OFORMAT ' + memory_format)
+	write(HP3458A, 'TIMER ' + str(1/sampling_frequency)) # Specifies sampling frequency.
+	write(HP3458A, 'APER ' + str(aper_time)) # Set aper time (see http://literature.cdn.keysight.com/litweb/pdf/03458-90014.pdf table 5-2).
+	write(HP3458A, 'NRDGS ' + str(samples_per_burst) + ', TIMER') # Specifies the number of samples to be recorded and the event in which to sample (6 is for "timer").
+	write(HP3458A, 'TRIG EXT')
+	write(HP3458A, 'DCV ' + str(np.abs(max_input)))
+	write(HP3458A, 'TARM AUTO')
 
-def read_binary_mem(HP3458A, N_SAMPLES):
+def read_binary_mem(HP3458A, N_SAMPLES, raw=False, fifo=False):
 	"""
 		Returns a numpy array containing the samples. Automatically
-		handles DINT and SINT memory formats.
-	"""
-	if int(HP3458A.query('MFORMAT?')) == 3:
-		conversion_format = 'i'
-		bytes_per_sample = 4
-	elif int(HP3458A.query('MFORMAT?')) == 2:
-		conversion_format = 'h'
-		bytes_per_sample = 2
-	else:
+		handles DINT and SINT memory formats. If "raw" is True returns
+		the integer codes and the scale factor instead, such that 
+		"samples = codes*scale". The codes are a read only view of the
+		received bytes, no copy is done.
+		Set "fifo" to True if the memory is in FIFO mode ("MEM FIFO"), 
+		then the oldest "N_SAMPLES" readings are returned and removed 
+		from the memory. They are read as normal output, i.e. addressing
+		the instrument to talk, since "RMEM" does not remove readings.
+	"""
+	memory_format = int(query(HP3458A, 'MFORMAT?'))
+	if memory_format not in MEMORY_FORMAT_DTYPES:
 		raise ValueError('I don\'t know hot to read that memory format!')
-	HP3458A.write('RMEM 1,' + str(N_SAMPLES))
-	samples = np.asarray(struct.unpack('>'+conversion_format*N_SAMPLES, HP3458A.read_bytes(bytes_per_sample*N_SAMPLES))) 
-	samples = samples*float(HP3458A.query('ISCALE?'))
-	samples = np.array(samples)
-	return np.flipud(samples) # Samples come reversed in time.
+	dtype = MEMORY_FORMAT_DTYPES[memory_format]
+	if not fifo:
+		HP3458A.write('RMEM 1,' + str(N_SAMPLES))
+	codes = np.frombuffer(HP3458A.read_bytes(dtype.itemsize*N_SAMPLES), dtype=dtype)
+	if not fifo:
+		codes = codes[::-1] # Samples come reversed in time.
+	scale = float(query(HP3458A, 'ISCALE?'))
+	if raw is True:
+		return codes, scale
+	return np.multiply(codes, scale, dtype=float) # Scaling and conversion in a single allocation.
+
+def wait_for_readings(HP3458A, number_of_readings, deadline, readings_per_second=None, poll_interval=.05, progress_callback=None):
+	"""
+	Polls "MCOUNT?" until the reading memory holds at least 
+	"number_of_readings" readings and returns the number of readings.
+	
+	Parameters
+	----------
+	deadline : float
+		Time (as returned by "time.time()") after which "TimeoutError" is
+		raised if the readings are not yet complete.
+	readings_per_second : float
+		Expected reading rate. If given the polling sleeps until the 
+		readings are expected to be complete instead of querying every
+		"poll_interval" seconds.
+	progress_callback : function
+		If given it is called as "progress_callback(count, number_of_readings)"
+		after each poll.
+	"""
+	while True:
+		count = int(HP3458A.query('MCOUNT?'))
+		if progress_callback is not None:
+			progress_callback(count, number_of_readings)
+		if count >= number_of_readings:
+			return count
+		if time.time() > deadline:
+			raise TimeoutError('Only ' + str(count) + ' of ' + str(number_of_readings) + ' readings were taken before the deadline.')
+		sleep_time = poll_interval
+		if readings_per_second is not None:
+			sleep_time = max(sleep_time, (number_of_readings - count)/readings_per_second)
+		time.sleep(min(sleep_time, max(deadline - time.time(), 0) + poll_interval))
+
+def read_fifo_chunks(HP3458A, number_of_readings, deadline, readings_per_second, chunk_size=4096, poll_interval=.05):
+	"""
+	Generator that reads "number_of_readings" readings in chunks while
+	the instrument keeps sampling, so the number of readings is not 
+	limited by the size of the reading memory. The memory must be in 
+	FIFO mode ("MEM FIFO") and the readings are removed as they are read
+	(as normal output, see "read_binary_mem").
+	Yields "(first_reading, codes, scale)" for each chunk, see 
+	"read_binary_mem", with "first_reading" the number of readings 
+	before the chunk.
+	"chunk_size" readings are read at a time (fewer in the last chunk),
+	it must leave enough free memory for the readings taken while a 
+	chunk is being transferred. "TimeoutError" is raised after "deadline"
+	(as "time.time()") and "RuntimeError" if the memory becomes full, 
+	since readings may have been lost.
+	"""
+	memory_capacity = reading_memory_bytes//MEMORY_FORMAT_DTYPES[int(query(HP3458A, 'MFORMAT?'))].itemsize
+	if chunk_size >= memory_capacity:
+		raise ValueError('"chunk_size" must be less than the ' + str(memory_capacity) + ' readings that fit in memory')
+	first_reading = 0
+	while first_reading < number_of_readings:
+		wanted = min(chunk_size, number_of_readings - first_reading)
+		count = int(HP3458A.query('MCOUNT?'))
+		if count >= memory_capacity:
+			raise RuntimeError('The reading memory became full after ' + str(first_reading + count) + ' readings, it was not read fast enough.')
+		if count < wanted:
+			if time.time() > deadline:
+				raise TimeoutError('Only ' + str(first_reading + count) + ' of ' + str(number_of_readings) + ' readings were taken before the deadline.')
+			time.sleep(max(poll_interval, (wanted - count)/readings_per_second))
+			continue
+		codes, scale = read_binary_mem(HP3458A, wanted, raw=True, fifo=True)
+		yield first_reading, codes, scale
+		first_reading += wanted
 
 def T_aper_check(T_aper):
 	if T_aper<500e-9 or T_aper>1: # See http://literature.cdn.keysight.com/litweb/pdf/03458-90014.pdf page 203.
@@ -74,7 +256,7 @@ def get_uncertainty_DCV_sampling(HP3458A):
 		"V0*uncertainty[0] + uncertainty[1]" is its error.
 	"""
 	uncertainty = [0,0]
-	T_aper = float(HP3458A.query('APER?'))
+	T_aper = float(query(HP3458A, 'APER?'))
 	if T_aper < 1e-6: # See table 5-2 from http://literature.cdn.keysight.com/litweb/pdf/03458-90014.pdf
 		cutoff_3dB = 400e3
 		bits = 15
@@ -90,7 +272,7 @@ def get_uncertainty_DCV_sampling(HP3458A):
 	else:
 		bits = 21
 		cutoff_3dB = 2e3
-	DMM_range = float(HP3458A.query('RANGE?'))
+	DMM_range = float(query(HP3458A, 'RANGE?'))
 	uncertainty = [14e-6, 3e-6+DMM_range/2**bits]
 	return uncertainty
 
@@ -100,10 +282,10 @@ def get_uncertainty_direct_sampling(HP3458A):
 	
 		"V0*uncertainty[0] + uncertainty[1]" is its error.
 	"""
-	return [0.02/100, float(HP3458A.query('RANGE?'))/2**16]
+	return [0.02/100, float(query(HP3458A, 'RANGE?'))/2**16]
 
 def get_uncertainty(HP3458A):
-	current_mode = HP3458A.query('FUNC?')
+	current_mode = query(HP3458A, 'FUNC?')
 	current_mode = int(current_mode[:(current_mode).find(',')])
 	if current_mode == 1:
 		return get_uncertainty_DCV_sampling(HP3458A)
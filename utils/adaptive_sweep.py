@@ -0,0 +1,128 @@
+"""
+Chooses the frequencies of a transference sweep as it is measured, so
+the points are concentrated where the transference changes and not
+spread evenly over flat regions. The sweep starts with a coarse grid
+(logarithmic) and then, in rounds, new points are inserted in the
+middle (in logarithmic scale) of the intervals between measured points
+where the ratio or the phase change the most, or where they are less
+certain, until every interval is within tolerance or the time budget is
+spent.
+"""
+import time
+import numpy as np
+
+class adaptive_sweep:
+	"""
+	Example
+	-------
+	>>> sweep = adaptive_sweep(40, 100e3, time_budget=600)
+	>>> frequencies = sweep.next_frequencies()
+	>>> while len(frequencies) > 0:
+	... 	for f in frequencies:
+	... 		sweep.add(f, *quick_look_transference(f)) # ratio, ratio_std, phi, phi_std
+	... 	frequencies = sweep.next_frequencies()
+	"""
+	def __init__(self, minimum_frequency, maximum_frequency, time_budget, initial_points=6, points_per_round=4, ratio_tolerance=100e-6, phase_tolerance=100e-6, minimum_spacing=1.1):
+		"""
+		Parameters
+		----------
+		time_budget : float
+			Seconds since the creation of the sweep. No points are
+			proposed that would not be measured within it, estimating
+			the time of a round from the previous rounds (each round goes
+			from one call to "next_frequencies" to the next) as a fixed
+			time plus a time per point.
+		initial_points : int
+			Points of the coarse grid between the minimum and maximum
+			frequencies (both included).
+		points_per_round : int
+			Maximum number of points proposed each time, so they can be
+			measured as one sweep (see "measure_many_frequencies.py").
+		ratio_tolerance, phase_tolerance : float
+			Change of the amplitude ratio (relative) and of the phase
+			(radians) between neighbouring points, plus their
+			uncertainty, below which an interval is not refined.
+		minimum_spacing : float
+			Intervals whose frequencies are in a smaller ratio than this
+			are not refined.
+		"""
+		if not 0 < minimum_frequency < maximum_frequency:
+			raise ValueError('The frequencies must satisfy 0 < minimum_frequency < maximum_frequency')
+		if initial_points < 2:
+			raise ValueError('At least 2 initial points are needed')
+		self.time_budget = time_budget
+		self.points_per_round = points_per_round
+		self.ratio_tolerance = ratio_tolerance
+		self.phase_tolerance = phase_tolerance
+		self.minimum_spacing = minimum_spacing
+		self._pending = list(np.logspace(np.log10(minimum_frequency), np.log10(maximum_frequency), initial_points))
+		self._points = {} # frequency: (ratio, ratio_std, phi, phi_std)
+		self._start_time = time.time()
+		self._round_start_time = None # Of the round being measured.
+		self._round_points = 0 # Added in the round being measured.
+		self._rounds = [] # (points, seconds) of each finished round.
+
+	def add(self, frequency, ratio, ratio_std, phi=None, phi_std=None):
+		"""
+		Adds the quick look transference measured at "frequency", which
+		need not be the proposed one exactly (e.g. after coherent
+		sampling planning). The phase is optional, e.g. for the AC mode.
+		"""
+		self._round_points += 1
+		self._points[float(frequency)] = (ratio, ratio_std, phi, phi_std)
+
+	def frequencies(self):
+		"""Measured frequencies, sorted."""
+		return np.array(sorted(self._points))
+
+	def _round_duration(self, n_points):
+		# Estimated seconds to measure a round of "n_points", as a fixed time plus a time per point if the rounds had different sizes.
+		if len(self._rounds) == 0:
+			return 0
+		points, seconds = np.array(self._rounds, dtype=float).T
+		if len(np.unique(points)) > 1:
+			point_time, round_time = np.polyfit(points, seconds, 1)
+			if point_time > 0 and round_time >= 0:
+				return round_time + n_points*point_time
+		return seconds.sum()/points.sum()*max(n_points, points.max()) # A smaller round is assumed to take as long as the largest, since part of the time may be fixed.
+
+	def _interval_scores(self):
+		# Change plus uncertainty of each interval between neighbouring points, in units of the tolerances.
+		frequencies = self.frequencies()
+		ratio, ratio_std, phi, phi_std = (np.array(quantity, dtype=float) for quantity in zip(*(self._points[f] for f in frequencies))) # None becomes nan.
+		ratio_score = (np.abs(np.diff(ratio)) + np.maximum(ratio_std[1:], ratio_std[:-1]))/np.abs(ratio[1:] + ratio[:-1])*2/self.ratio_tolerance
+		phase_score = (np.abs(np.angle(np.exp(1j*np.diff(phi)))) + np.maximum(phi_std[1:], phi_std[:-1]))/self.phase_tolerance
+		scores = np.fmax(ratio_score, phase_score)
+		scores[frequencies[1:]/frequencies[:-1] < self.minimum_spacing] = 0
+		return frequencies, scores
+
+	def next_frequencies(self):
+		"""
+		Returns the frequencies to be measured next: the coarse grid the
+		first time and then the middle points of the intervals with the
+		highest scores above tolerance. Returns an empty list when the
+		sweep is finished.
+		"""
+		if self._round_start_time is not None: # The previous round has finished.
+			if self._round_points > 0:
+				self._rounds.append((self._round_points, time.time() - self._round_start_time))
+			self._round_start_time = None
+			self._round_points = 0
+		if len(self._pending) > 0:
+			frequencies, self._pending = self._pending, []
+		else:
+			frequencies = self._refinement_frequencies()
+		if len(frequencies) > 0:
+			self._round_start_time = time.time()
+		return frequencies
+
+	def _refinement_frequencies(self):
+		if len(self._points) < 2:
+			return []
+		remaining_time = self.time_budget - (time.time() - self._start_time)
+		n_points = self.points_per_round
+		while n_points > 0 and self._round_duration(n_points) > remaining_time:
+			n_points -= 1
+		frequencies, scores = self._interval_scores()
+		worst = [k for k in np.argsort(scores)[::-1][:n_points] if scores[k] > 1]
+		return [float(np.sqrt(frequencies[k]*frequencies[k+1])) for k in sorted(worst)]
@@ -0,0 +1,61 @@
+import queue
+import threading
+
+class background_writer:
+	"""
+	Runs functions that save data (e.g. write files) in a background
+	thread, one after the other in the order in which they were submitted,
+	so the caller can go on measuring. Errors raised by these functions
+	are raised again by the next call to "submit" or "close".
+
+	Example
+	-------
+	>>> with background_writer() as writer:
+	...     writer.submit(save_samples, file_name, samples)
+	"""
+	def __init__(self, max_pending=8):
+		"""
+		max_pending: Maximum number of functions waiting to be run. If
+			there are more, "submit" blocks until one of them is done, so
+			the data waiting to be saved does not grow without limit.
+		"""
+		self._queue = queue.Queue(maxsize=max_pending)
+		self._errors = []
+		self._thread = threading.Thread(target=self._work, name='background writer', daemon=True)
+		self._thread.start()
+
+	def _work(self):
+		while True:
+			job = self._queue.get()
+			if job is None:
+				return
+			function, args, kwargs = job
+			try:
+				function(*args, **kwargs)
+			except Exception as e:
+				self._errors.append(e)
+
+	def _raise_errors(self):
+		if len(self._errors) > 0:
+			raise self._errors.pop(0)
+
+	def submit(self, function, *args, **kwargs):
+		"""
+		Queues the call "function(*args, **kwargs)".
+		"""
+		self._raise_errors()
+		self._queue.put((function, args, kwargs))
+
+	def close(self):
+		"""
+		Waits until all the submitted functions have been run.
+		"""
+		self._queue.put(None)
+		self._thread.join()
+		self._raise_errors()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
@@ -0,0 +1,142 @@
+"""
+Binary file holding one burst: the integer codes read from each voltmeter
+and everything needed to interpret them. The layout is
+
+	MAGIC (8 bytes)
+	Size of the header block in bytes (uint32, little endian)
+	Header block: JSON text padded with spaces
+	Codes: array of shape (channels, samples) in C order
+
+The header block has room to spare, so entries can be added or changed
+in place (see "update_header") without rewriting the codes, which are
+read with memory mapping. Header entries:
+
+	'dtype', 'shape': Of the codes array.
+	'scales': Per channel, "samples = codes*scale".
+	'uncertainties': Per channel, the coefficients "[u0, u1]" of the
+		error of each sample "abs(sample)*u0 + u1".
+	'config': Dictionary with the measurement configuration.
+	'trigger_lag': Optional, samples of channel 0 correspond to samples
+		of channel 1 shifted by this lag (see "utils.trigger_alignment").
+"""
+import json
+import os
+import struct
+import numpy as np
+
+from . import trigger_alignment
+from .uncertain_array import uncertain_array
+
+MAGIC = b'RVDBURST'
+HEADER_BLOCK_BYTES = 4084 # The codes start at 4096 bytes.
+
+def _header_block(header, minimum_bytes=HEADER_BLOCK_BYTES):
+	text = json.dumps(header).encode()
+	block_bytes = minimum_bytes
+	while block_bytes < len(text) + 1:
+		block_bytes += 4096
+	return text + b' '*(block_bytes - len(text))
+
+def _read_header(ifile):
+	if ifile.read(len(MAGIC)) != MAGIC:
+		raise ValueError('"' + ifile.name + '" is not a burst file')
+	block_bytes = struct.unpack('<I', ifile.read(4))[0]
+	return json.loads(ifile.read(block_bytes).decode()), len(MAGIC) + 4 + block_bytes
+
+def write(file_name, codes, scales, uncertainties=None, config=None, **header_entries):
+	"""
+	Writes a burst file. "codes" is a list with the integer codes of each
+	channel (all of the same length and dtype, e.g. as returned by
+	"HP3458A.read_binary_mem(..., raw=True)") and "scales" the scale
+	factor of each channel. Additional header entries can be given as
+	keyword arguments.
+	"""
+	codes = np.asarray(codes)
+	if codes.ndim != 2 or len(scales) != len(codes):
+		raise ValueError('One scale factor and one array of codes per channel are required')
+	header = {
+		'dtype': codes.dtype.str,
+		'shape': list(codes.shape),
+		'scales': [float(scale) for scale in scales],
+		'uncertainties': None if uncertainties is None else [[float(u) for u in uncertainty] for uncertainty in uncertainties],
+		'config': {} if config is None else config,
+	}
+	header.update(header_entries)
+	block = _header_block(header)
+	with open(file_name, 'wb') as ofile:
+		ofile.write(MAGIC)
+		ofile.write(struct.pack('<I', len(block)))
+		ofile.write(block)
+		ofile.write(np.ascontiguousarray(codes).tobytes())
+
+def update_header(file_name, **entries):
+	"""
+	Adds or replaces entries of the header of a burst file. The codes are
+	only rewritten if the header no longer fits in its block.
+	"""
+	with open(file_name, 'r+b') as iofile:
+		header, codes_offset = _read_header(iofile)
+		header.update(entries)
+		block = _header_block(header, codes_offset - len(MAGIC) - 4)
+		if len(MAGIC) + 4 + len(block) == codes_offset:
+			iofile.seek(len(MAGIC) + 4)
+			iofile.write(block)
+			return
+		iofile.seek(codes_offset)
+		codes = iofile.read()
+	temporary_file_name = file_name + '.tmp'
+	with open(temporary_file_name, 'wb') as ofile:
+		ofile.write(MAGIC)
+		ofile.write(struct.pack('<I', len(block)))
+		ofile.write(block)
+		ofile.write(codes)
+	os.replace(temporary_file_name, file_name)
+
+def read_header(file_name):
+	"""
+	Returns the header of a burst file without mapping the codes.
+	"""
+	with open(file_name, 'rb') as ifile:
+		return _read_header(ifile)[0]
+
+class burst:
+	"""
+	Burst file opened for reading. The codes are memory mapped, so only
+	the parts that are used are read from disk.
+
+	Example
+	-------
+	>>> data = burst('20180626115601_burst.bin')
+	>>> data.config['generator_frequency']
+	>>> V_in, V_out = data.samples()
+	"""
+	def __init__(self, file_name):
+		self.file_name = file_name
+		with open(file_name, 'rb') as ifile:
+			self.header, codes_offset = _read_header(ifile)
+		self.codes = np.memmap(file_name, dtype=np.dtype(self.header['dtype']), mode='r', offset=codes_offset, shape=tuple(self.header['shape']))
+
+	@property
+	def config(self):
+		return self.header['config']
+
+	def samples(self, aligned=True):
+		"""
+		Returns a list with the samples of each channel in volts. If
+		"aligned" is True and the header has a 'trigger_lag', the first two
+		channels are aligned according to it.
+		"""
+		samples = [np.multiply(self.codes[k], self.header['scales'][k], dtype=float) for k in range(len(self.codes))]
+		if aligned and self.header.get('trigger_lag') is not None:
+			samples[0], samples[1] = trigger_alignment.align(samples[0], samples[1], self.header['trigger_lag'])
+		return samples
+
+	def uncertain_samples(self, aligned=True):
+		"""
+		Same as "samples" but returns "uncertain_array"s with the error of
+		each sample given by the 'uncertainties' of the header.
+		"""
+		samples = self.samples(aligned)
+		if self.header['uncertainties'] is None:
+			return [uncertain_array(s) for s in samples]
+		return [uncertain_array(s, np.abs(s)*u[0] + u[1]) for s,u in zip(samples, self.header['uncertainties'])]
@@ -1,38 +1,176 @@
 import uncertainties as unc
 from uncertainties import unumpy as unp
 import scipy.optimize as opt # This is used for fiting models and data.
+from scipy.special import erf
+from scipy.stats import norm
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import nicenquickplotlib as nq
 from . import my_uncertainties_utils as munc
+from .sine_fit import sine_fit
+from .plot_decimation import min_max_indices
+from .uncertain_array import uncertain_array
 
-def fit_bootstrap(p0, datax, datay, function, yerr_systematic=0.0):
-	# This function was taken from here: https://stackoverflow.com/questions/14581358/getting-standard-errors-on-fitted-parameters-using-the-optimize-leastsq-method-i
-    errfunc = lambda p, x, y: function(x,p) - y
-    # Fit first time
-    pfit, perr = opt.leastsq(errfunc, p0, args=(datax, datay), full_output=0)
-    # Get the stdev of the residuals
-    residuals = errfunc(pfit, datax, datay)
-    sigma_res = np.std(residuals)
-    sigma_err_total = np.sqrt(sigma_res**2 + yerr_systematic**2)
-    # 100 random data sets are generated and fitted
-    ps = []
-    for i in range(100):
-        randomDelta = np.random.normal(0., sigma_err_total, len(datay))
-        randomdataY = datay + randomDelta
-        randomfit, randomcov = opt.leastsq(errfunc, p0, args=(datax, randomdataY), full_output=0)
-        ps.append(randomfit) 
-    ps = np.array(ps)
-    mean_pfit = np.mean(ps,0)
-    # You can choose the confidence interval that you want for your
-    # parameter estimates: 
-    Nsigma = 1. # 1sigma gets approximately the same as methods above
-                # 1sigma corresponds to 68.3% confidence interval
-                # 2sigma corresponds to 95.44% confidence interval
-    err_pfit = Nsigma * np.std(ps,0) 
+ONE_SIGMA_CONFIDENCE_LEVEL = erf(1/np.sqrt(2)) # 68.3 %
 
-    pfit_bootstrap = mean_pfit
-    perr_bootstrap = err_pfit
-    return pfit_bootstrap, perr_bootstrap
+def _jacobian_dfun(jacobian):
+	"""
+	Converts "jacobian(x, p)" (derivatives of the model respect to the
+	params, one column per param) into the "Dfun" expected by "leastsq".
+	Returns None if "jacobian" is None, so "leastsq" falls back to 
+	finite differences.
+	"""
+	if jacobian is None:
+		return None
+	return lambda p, x, y: jacobian(x, p)
+
+def _fit_resamples(function, p0, datax, resampled_datay, jacobian=None, linear=False):
+	"""
+	Fits "function" to each row of "resampled_datay" and returns the
+	fitted params, one row per resample. It lives at module level so it
+	can be sent to the workers of a process pool. If "linear" the model
+	is "jacobian(datax, p0) @ p", so all the resamples are solved at once
+	with a single "lstsq"; otherwise each one needs its own "leastsq".
+	"""
+	if linear:
+		return np.linalg.lstsq(jacobian(datax, p0), resampled_datay.T, rcond=None)[0].T
+	errfunc = lambda p, x, y: function(x,p) - y
+	Dfun = _jacobian_dfun(jacobian)
+	return np.array([opt.leastsq(errfunc, p0, args=(datax, datay), Dfun=Dfun, full_output=0)[0] for datay in resampled_datay])
+
+def fit_bootstrap(p0, datax, datay, function, yerr_systematic=0.0, jacobian=None, n_resamples=100, confidence_level=ONE_SIGMA_CONFIDENCE_LEVEL, rng=None, batch_size=50, n_processes=1, convergence_tolerance=None, linear=False):
+	"""
+	Fits "function" to (datax, datay) and estimates the errors of the
+	params by fitting "n_resamples" random data sets generated by adding
+	noise to "datay" (the original idea was taken from here: 
+	https://stackoverflow.com/questions/14581358/getting-standard-errors-on-fitted-parameters-using-the-optimize-leastsq-method-i).
+	
+	The random data sets are generated as 2D arrays of "batch_size" rows
+	and the batches are fitted either in this process or, if 
+	"n_processes" > 1, in a pool of processes. In the latter case 
+	"function" must be picklable (e.g. defined at module level).
+	
+	Parameters
+	----------
+	jacobian : function
+		Optional analytic Jacobian of "function", of the form 
+		"jacobian(x, p)" returning an array with one column per param.
+		If not given "leastsq" estimates it by finite differences.
+	n_resamples : int
+		Maximum number of random data sets to be fitted.
+	confidence_level : float
+		Confidence level of the returned errors, e.g. 0.683 (the 
+		default) gives 1 sigma and 0.9544 gives 2 sigma.
+	rng : numpy.random.Generator or int
+		Random generator (or seed for a new one) used to generate the 
+		random data sets. If None a fresh unseeded generator is used.
+	convergence_tolerance : float
+		If given, the resampling stops as soon as the standard deviation
+		of every param changes relatively less than this between two 
+		consecutive rounds of batches.
+	linear : bool
+		Whether "function" is linear in its params, i.e. equal to
+		"jacobian(x, p) @ p" with a Jacobian that does not depend on "p"
+		(e.g. a polynomial). Then each batch of resamples is fitted with
+		a single "numpy.linalg.lstsq" instead of a "leastsq" per resample,
+		which is otherwise the cost of the bootstrap. Requires "jacobian".
+	
+	Returns
+	-------
+	pfit_bootstrap, perr_bootstrap : numpy arrays
+		Mean values and errors of the params.
+	"""
+	if linear and jacobian is None:
+		raise ValueError('A linear model needs its "jacobian"')
+	errfunc = lambda p, x, y: function(x,p) - y
+	datax = np.asarray(datax)
+	datay = np.asarray(datay, dtype=float)
+	# Fit first time
+	pfit, perr = opt.leastsq(errfunc, p0, args=(datax, datay), Dfun=_jacobian_dfun(jacobian), full_output=0)
+	# Get the stdev of the residuals
+	residuals = errfunc(pfit, datax, datay)
+	sigma_res = np.std(residuals)
+	sigma_err_total = np.sqrt(sigma_res**2 + np.asarray(yerr_systematic)**2)
+	# Random data sets are generated and fitted in rounds of batches
+	rng = np.random.default_rng(rng)
+	batch_sizes = [batch_size]*(n_resamples//batch_size)
+	if n_resamples%batch_size != 0:
+		batch_sizes.append(n_resamples%batch_size)
+	batches_per_round = max(n_processes, 1)
+	ps = []
+	previous_std = None
+	executor = ProcessPoolExecutor(n_processes) if n_processes > 1 else None
+	try:
+		for k in range(0, len(batch_sizes), batches_per_round):
+			round_sizes = batch_sizes[k:k+batches_per_round]
+			randomDelta = rng.normal(0., 1., (sum(round_sizes), len(datay)))*sigma_err_total
+			randomDelta += datay
+			round_batches = np.split(randomDelta, np.cumsum(round_sizes)[:-1])
+			if executor is None:
+				ps += [_fit_resamples(function, pfit, datax, batch, jacobian, linear) for batch in round_batches]
+			else:
+				ps += list(executor.map(_fit_resamples, [function]*len(round_batches), [pfit]*len(round_batches), [datax]*len(round_batches), round_batches, [jacobian]*len(round_batches), [linear]*len(round_batches)))
+			if convergence_tolerance is not None:
+				current_std = np.std(np.concatenate(ps), 0)
+				if previous_std is not None and np.all(np.abs(current_std - previous_std) <= convergence_tolerance*np.abs(current_std)):
+					break
+				previous_std = current_std
+	finally:
+		if executor is not None:
+			executor.shutdown()
+	ps = np.concatenate(ps)
+	mean_pfit = np.mean(ps,0)
+	Nsigma = norm.ppf((1 + confidence_level)/2) # 1sigma corresponds to 68.3% confidence interval, 2sigma to 95.44%, ...
+	err_pfit = Nsigma * np.std(ps,0) 
+	
+	pfit_bootstrap = mean_pfit
+	perr_bootstrap = err_pfit
+	return pfit_bootstrap, perr_bootstrap
+
+def fit_covariance(p0, datax, datay, function, yerr_systematic=0.0, jacobian=None):
+	"""
+	Fits "function" to (datax, datay) once and estimates the covariance
+	matrix of the params from the Jacobian at the optimum (the "cov_x"
+	returned by "leastsq") scaled by the variance of the residuals plus 
+	"yerr_systematic" squared. "jacobian" is the same as in 
+	"fit_bootstrap".
+	
+	Returns
+	-------
+	pfit : numpy array
+		Fitted params.
+	pcov : numpy array
+		Covariance matrix of the params.
+	"""
+	errfunc = lambda p, x, y: function(x,p) - y
+	datay = np.asarray(datay, dtype=float)
+	pfit, cov_x, infodict, mesg, ier = opt.leastsq(errfunc, p0, args=(datax, datay), Dfun=_jacobian_dfun(jacobian), full_output=1)
+	if ier not in [1,2,3,4]:
+		raise RuntimeError('Fit did not converge: ' + mesg)
+	if cov_x is None:
+		raise RuntimeError('Cannot estimate covariance, the Jacobian is singular at the optimum.')
+	residuals = infodict['fvec']
+	sigma_res_squared = residuals @ residuals/(len(datay) - len(pfit))
+	pcov = cov_x*(sigma_res_squared + np.mean(np.asarray(yerr_systematic)**2))
+	return pfit, pcov
+
+def _as_uncertain_array(data):
+	if isinstance(data, uncertain_array):
+		return data
+	if isinstance(data[0], unc.UFloat):
+		return uncertain_array.from_uarray(data)
+	return uncertain_array(data)
+
+class _nominal_values_func:
+	"""
+	Float version of a model function that may return ufloats. It is a
+	class instead of a closure so it can be pickled into a process pool.
+	"""
+	def __init__(self, func):
+		self.func = func
+	
+	def __call__(self, x, p):
+		return unp.nominal_values(self.func(x, p))
 
 
 class fitmodel:
@@ -54,8 +192,17 @@ class fitmodel:
 		self.str_params: Es una lista de cadenas que dice cómo se llama cada uno de los parámetros
 					en 'self._params'. Cuando haya que imprimir el nombre de un parámetro, se usará
 					el dato almacenado en 'str_params'.
-		self._xdata/_ydata: Acá se cargan los datos que se usarán para el ajuste. Cada vez que se
-					cargan datos nuevos, se borran los parámetros ajustados previamente (si los hubiere).
+		self.numpy_func: Versión opcional de 'self.func' que trabaja sólo con arrays de numpy
+					(sin ufloats). Si está definida es la que se usa durante el ajuste, evitando
+					el costo de 'uncertainties' en cada evaluación.
+		self.jacobian: Jacobiano analítico opcional de 'self.numpy_func', de la forma 
+					'jacobian(x, p)' devolviendo un array con una columna por parámetro. Si
+					está definido se le pasa a 'leastsq' como 'Dfun'.
+		self.linear: Indica si el modelo es lineal en sus parámetros (requiere 'self.jacobian'),
+					en cuyo caso el bootstrap resuelve todos los datos aleatorios de una vez.
+		self._xdata/_ydata: Acá se cargan los datos que se usarán para el ajuste, como objetos 
+					'uncertain_array'. Cada vez que se cargan datos nuevos, se borran los parámetros 
+					ajustados previamente (si los hubiere).
 		self.name: Una cadena con un nombre de pila (opcional) para el modelo.
 	
 	Los pasos para usar un objeto de esta clase en forma exitosa son los siguientes:
@@ -65,36 +212,43 @@ class fitmodel:
 		4) Graficar el ajuste llamando al método "plot_model_vs_data".
 	
 	"""
-	def __init__(self, func, str_formula, str_params, name=None):
+	def __init__(self, func, str_formula, str_params, name=None, numpy_func=None, jacobian=None, linear=False):
 		self.func = func # func must be of the form "func(x, p)" with p[0], p[1], ... the params.
+		self.numpy_func = numpy_func # Same as "func" but only for floats, used while fitting.
+		self.jacobian = jacobian # Must be of the form "jacobian(x, p)" returning one column per param.
+		self.linear = linear # If True "func(x, p)" is "jacobian(x, p) @ p" for every "p".
 		self.str_formula = str_formula # Formula to be printed for this model.
 		self.str_params = str_params # Params as they should be printed.
 		self._params = [None]*len(str_params) # Here will be stored the values of the fitted params.
-		self._xdata = [None]
-		self._ydata = [None]
+		self._xdata = None
+		self._ydata = None
 		self.name = name
 	
 	def set_data(self, xdata, ydata):
 		"""
-		xdata and ydata must be numpy arrays or ufloat arrays.
+		xdata and ydata must be numpy arrays, ufloat arrays or uncertain_array.
 		"""
 		if len(xdata) != len(ydata):
 			raise ValueError('Length of xdata and ydata does not match')
 		self._params = [None]*len(self.str_params)
-		if not isinstance(xdata[0], unc.UFloat):
-			xdata = unp.uarray(xdata, xdata*0)
-		if not isinstance(ydata[0], unc.UFloat):
-			ydata = unp.uarray(ydata, ydata*0)
-		self._xdata = xdata
-		self._ydata = ydata
+		self._xdata = _as_uncertain_array(xdata)
+		self._ydata = _as_uncertain_array(ydata)
 		
-	def fit(self, p0=[None]):
+	def fit(self, p0=[None], method='bootstrap', **bootstrap_kwargs):
 		"""
 		Ajusta el modelo a los datos provistos. Los parámetros estimados con el ajuste
-		se almacenan en 'self._params'.
+		se almacenan en 'self._params'. 'method' indica cómo se estima la incerteza:
+			'bootstrap': Ajustando datos aleatorios (ver 'fit_bootstrap'). Los 
+						'bootstrap_kwargs' (n_resamples, confidence_level, rng, ...)
+						se pasan a 'fit_bootstrap' (con otro método dan TypeError).
+			'covariance': Con la matriz de covarianza obtenida del Jacobiano en el
+						óptimo (ver 'fit_covariance'). Los parámetros quedan como 
+						ufloats correlacionados.
 		"""
-		if self._xdata[0] == None or self._ydata[0] == None:
-			raise ValueError('No data provided for fitting!')
+		if method not in ['bootstrap', 'covariance']:
+			raise ValueError('Unknown fitting method "' + str(method) + '"')
+		if method != 'bootstrap' and len(bootstrap_kwargs) > 0:
+			raise TypeError('The method "' + str(method) + '" does not take the arguments ' + ', '.join(bootstrap_kwargs))
 		if p0[0] == None:
 			p0 = [0.0]*len(self._params)
 		else:
@@ -102,23 +256,34 @@ class fitmodel:
 				raise ValueError('len(p0) != number of params required by this model')
 		if isinstance(p0[0], unc.UFloat):
 			p0 = unp.nominal_values(p0)
-		if isinstance(self._xdata[0], unc.UFloat):
-			xdata = unp.nominal_values(self._xdata)
-		else:
-			xdata = self._xdata
-		if isinstance(self._ydata[0], unc.UFloat):
-			ydata = unp.nominal_values(self._ydata)
-			yerr = unp.std_devs(self._ydata)
+		xdata, ydata, yerr = self._fitting_data()
+		if self.numpy_func is not None:
+			function = self.numpy_func
 		else:
-			ydata = self._ydata
-			yerr = np.zeros(len(ydata))
-		
-		def float_func(x, p):
-			return unp.nominal_values(self.func(x, p))
-		pfit, perr = fit_bootstrap(p0, xdata, ydata, float_func, yerr)
+			function = _nominal_values_func(self.func)
+		if method == 'covariance':
+			pfit, pcov = fit_covariance(p0, xdata, ydata, function, yerr, self.jacobian)
+			self._params = list(unc.correlated_values(pfit, pcov))
+			return
+		pfit, perr = fit_bootstrap(p0, xdata, ydata, function, yerr, self.jacobian, linear=self.linear, **bootstrap_kwargs)
 		for k in range(len(p0)):
 			self._params[k] = unc.ufloat(pfit[k], perr[k])
 	
+	def _fitting_data(self):
+		"""
+		Returns the nominal values of xdata and ydata and the errors of
+		ydata as float arrays, ready to be used by the fitting routines.
+		"""
+		if self._xdata is None or self._ydata is None:
+			raise ValueError('No data provided for fitting!')
+		return self._xdata.n, self._ydata.n, self._ydata.s
+	
+	def _ydata_to_plot(self):
+		# Data are converted to ufloats only if they have errors, for the error bars.
+		if np.any(self._ydata.s != 0):
+			return self._ydata.to_uarray()
+		return self._ydata.n
+	
 	def __str__(self):
 		string = 'Fitmodel object\n'
 		if not self.name == None:
@@ -135,6 +300,19 @@ class fitmodel:
 	def param_val(self, key):
 		return self._params[key]
 	
+	def set_params(self, params, covariance=None):
+		"""
+		Sets the params without fitting, e.g. to plot a fit done before.
+		They are stored as ufloats, correlated if "covariance" is given.
+		Must be called after "set_data", which clears the params.
+		"""
+		if len(params) != len(self.str_params):
+			raise ValueError('len(params) != number of params required by this model')
+		if covariance is None:
+			self._params = [unc.ufloat(param, 0) for param in params]
+		else:
+			self._params = list(unc.correlated_values(params, covariance))
+	
 	def print_nice_box(self, axes, x_pos=0.1, y_pos=0.95, BBOX=dict(boxstyle='round', facecolor='white', edgecolor=(.7,.7,.7), alpha=0.8)):
 		"""
 		Imprime información concerniente al modelo (fórmula, parámetros y valores estimados) de una
@@ -148,19 +326,23 @@ class fitmodel:
 			data_str += self.str_params[k] + r'$=$' + munc.ufloat_nice_str(self._params[k]) + '\n'
 		axes.text(x_pos, y_pos, data_str, transform=axes.transAxes, verticalalignment='top', bbox=BBOX)
 	
-	def plot_model_vs_data(self, nicebox=False, *args, **kwargs):
+	def plot_model_vs_data(self, nicebox=False, *args, max_points=None, **kwargs):
 		"""
 		Plotea en un gráfico los datos (x,y) cargados en el modelo, superpuestos con el
 		modelo (previamente ajustado) evaluado en los valores de xdata cargados.
+		Si se da 'max_points' se grafican a lo sumo esa cantidad de puntos, elegidos con
+		'plot_decimation.min_max_indices', para que graficar registros largos no tarde.
 		"""
 		if self._params[0] == None:
 			raise ValueError('Impossible to eval model: params has not yet ben estimated! (no data fitted)')
 		else:
-			if isinstance(self._xdata[0], unc.UFloat):
-				xdata = unp.nominal_values(self._xdata)
-			else:
-				xdata = self._xdata
-		fig = nq.plot(xdata, [self._ydata, self.eval(xdata)], legend=['Data', 'Fit'], linestyle=['-','--'], title=self.name, *args, **kwargs)
+			xdata = self._xdata.n
+		ydata = self._ydata_to_plot()
+		if max_points is not None:
+			indices = min_max_indices(self._ydata.n, max_points)
+			xdata = xdata[indices]
+			ydata = ydata[indices]
+		fig = nq.plot(xdata, [ydata, self.eval(xdata)], legend=['Data', 'Fit'], linestyle=['-','--'], title=self.name, *args, **kwargs)
 		if nicebox is True:
 			self.print_nice_box(fig.axes[0])
 		return fig
@@ -172,11 +354,8 @@ class fitmodel:
 		if self._params[0] == None:
 			raise ValueError('Impossible to eval model: params has not yet ben estimated! (no data fitted)')
 		else:
-			if isinstance(self._xdata[0], unc.UFloat):
-				xdata = unp.nominal_values(self._xdata)
-			else:
-				xdata = self._xdata
-			nq.plot(xdata, self._ydata - self.eval(xdata), *args, **kwargs)
+			xdata = self._xdata.n
+			nq.plot(xdata, self._ydata_to_plot() - self.eval(xdata), *args, **kwargs)
 	
 	def eval(self, x_data):
 		"""
@@ -186,3 +365,73 @@ class fitmodel:
 			raise ValueError('Impossible to eval model: params has not yet ben estimated! (no data fitted)')
 		else:
 			return self.func(x_data, self._params)
+
+class sine_fitmodel(fitmodel):
+	"""
+	Model "V_p*sin(omega*x + phi) + V_os" (or "V_p*sin(omega*x + phi)" 
+	if "offset" is False) with a known angular frequency "omega". Since
+	the frequency is known the model is linear in its in-phase, 
+	quadrature and offset terms, so "fit" solves it in closed form (see
+	"sine_fit.sine_fit") instead of running "leastsq" and bootstrapping.
+	The fitted params are correlated ufloats that carry the analytic
+	covariance matrix. The model also provides its float version and
+	analytic Jacobian, which are used by the other fitting methods.
+	"""
+	def __init__(self, omega, name=None, str_formula=None, offset=True):
+		self.omega = omega # Angular frequency in units of "1/x".
+		self.offset = offset
+		str_params = [r'$V_p$', r'$\phi$']
+		if offset:
+			str_params.append(r'$V_{os}$')
+		if str_formula is None:
+			str_formula = r'$V_p \sin \left(\omega x + \phi \right)' + (r' + V_{os}$' if offset else '$')
+		super().__init__(self._sine, str_formula, str_params, name, self._numpy_sine, self._sine_jacobian)
+	
+	def _sine(self, x, p):
+		return p[0]*unp.sin(self.omega*x + p[1]) + (p[2] if self.offset else 0)
+	
+	def _numpy_sine(self, x, p):
+		return p[0]*np.sin(self.omega*x + p[1]) + (p[2] if self.offset else 0)
+	
+	def _sine_jacobian(self, x, p):
+		J = np.empty((len(x), len(p)))
+		J[:,0] = np.sin(self.omega*x + p[1])
+		J[:,1] = p[0]*np.cos(self.omega*x + p[1])
+		if self.offset:
+			J[:,2] = 1
+		return J
+	
+	def fit(self, p0=[None], method='closed_form', **kwargs):
+		"""
+		Fits the model to the data. With the default 'closed_form' method
+		"p0" is not needed (the fit is not iterative). Any other method is
+		handled by "fitmodel.fit".
+		"""
+		if method != 'closed_form':
+			return super().fit(p0, method, **kwargs)
+		if len(kwargs) > 0:
+			raise TypeError('The method "closed_form" does not take the arguments ' + ', '.join(kwargs))
+		xdata, ydata, yerr = self._fitting_data()
+		pfit, pcov = sine_fit(xdata, ydata, self.omega, yerr, self.offset)
+		self._params = list(unc.correlated_values(pfit, pcov))
+
+class polynomial_fitmodel(fitmodel):
+	"""
+	Model "p[0] + p[1]*x + ... + p[degree]*x**degree". It provides its
+	float version and analytic Jacobian so fits run without the 
+	"uncertainties" package inside the optimizer loop, and since it is
+	linear the bootstrap resamples are solved all at once.
+	"""
+	def __init__(self, degree, name=None):
+		self.degree = degree
+		str_formula = '$' + ' + '.join(['a_{' + str(k) + '}' + ('x^{' + str(k) + '}' if k > 0 else '') for k in range(degree+1)]) + '$'
+		super().__init__(self._polynomial, str_formula, ['$a_{' + str(k) + '}$' for k in range(degree+1)], name, self._polynomial, self._polynomial_jacobian, linear=True)
+	
+	def _polynomial(self, x, p):
+		result = p[-1]
+		for k in range(len(p)-2, -1, -1): # Horner's method.
+			result = result*x + p[k]
+		return result
+	
+	def _polynomial_jacobian(self, x, p):
+		return np.vander(x, len(p), increasing=True)
@@ -0,0 +1,149 @@
+import weakref
+
+from . import HP3458A
+
+# Description of the commands of each instrument. For each one:
+# 	'context': Command that selects to what the following settings apply
+# 		(e.g. the channel in the HP3245A), or None.
+# 	'settings': Commands whose effect only depends on their arguments, so
+# 		sending them again with the same arguments is redundant. Each one
+# 		is mapped to the name of the setting it changes.
+# 	'invalidates': Commands after which the listed settings are no
+# 		longer known (None means all of them). These commands are never
+# 		skipped.
+HP3245A_COMMANDS = {
+	'context': 'USE',
+	'settings': {
+		'IMP': 'IMP', 'ARANGE': 'ARANGE', 'APPLY': 'APPLY', 'FREQ': 'FREQ',
+		'DCOFF': 'DCOFF', 'TERM': 'TERM', 'SYNCOUT': 'SYNCOUT',
+	},
+	'invalidates': {
+		'RESET': None,
+		'APPLY': ['FREQ', 'DCOFF'], # To be safe, we assume that APPLY may change them.
+	},
+}
+HP3458A_COMMANDS = { # "MEM" is not a setting because it also clears the reading memory.
+	'context': None,
+	'settings': dict(
+		[(function, 'FUNC') for function in HP3458A.FUNCTION_CODES] +
+		[(command, command) for command in ['FUNC', 'RANGE', 'MFORMAT', 'OFORMAT', 'NRDGS', 'TRIG', 'SLOPE', 'LEVEL', 'TIMER', 'APER', 'NPLC', 'SETACV', 'ACBAND', 'SWEEP', 'SSRC', 'PRESET']]
+	),
+	'invalidates': dict(
+		[(function, ['RANGE']) for function in HP3458A.FUNCTION_CODES] +
+		[('FUNC', ['RANGE']), ('RANGE', ['FUNC']), ('APER', ['NPLC']), ('NPLC', ['APER']), ('PRESET', None), ('RESET', None)]
+	),
+}
+INSTRUMENT_COMMANDS = {
+	'HP3245A': HP3245A_COMMANDS,
+	'HP3458A': HP3458A_COMMANDS,
+}
+
+_known_state = weakref.WeakKeyDictionary() # For each instrument, the last value written to each setting.
+
+def _get_known_state(instrument):
+	if instrument not in _known_state:
+		_known_state[instrument] = {'context': None, 'settings': {}}
+	return _known_state[instrument]
+
+def known_setting(instrument, setting, context=None):
+	"""
+	Returns the last command sent through a "command_batch" that changed
+	"setting" (e.g. 'PRESET DIG' for 'PRESET'), or None if it is not
+	known. "context" is the argument of the context command, e.g. 'CHANA'.
+	"""
+	return _get_known_state(instrument)['settings'].get((context, setting))
+
+def forget(instrument):
+	"""
+	Forgets the known settings of the instrument. Must be called if it is
+	configured without using a "command_batch".
+	"""
+	_known_state.pop(instrument, None)
+
+class command_batch:
+	"""
+	Collects commands for an instrument and sends them in a single GPIB
+	transaction, separated by ";", when "flush" is called or at the end
+	of a "with" block. Commands that set a value equal to the last one
+	sent to the same instrument through a "command_batch" are skipped.
+	
+	Example
+	-------
+	>>> with command_batch(FunGen, 'HP3245A') as fungen:
+	...     fungen.write('USE CHANA')
+	...     fungen.write('FREQ 1000')
+	"""
+	def __init__(self, instrument, instrument_type, write=None, skip_redundant=True):
+		"""
+		instrument_type: 'HP3245A' or 'HP3458A'.
+		write: Function of the form "write(instrument, command)" used to
+			send the commands. By default "HP3458A.write" (which keeps the
+			state cache of "utils.HP3458A" up to date) for the HP3458A and
+			"instrument.write" for the others.
+		"""
+		if instrument_type not in INSTRUMENT_COMMANDS:
+			raise ValueError('Unknown instrument type "' + str(instrument_type) + '"')
+		self.instrument = instrument
+		self.commands = INSTRUMENT_COMMANDS[instrument_type]
+		if write is None:
+			write = HP3458A.write if instrument_type == 'HP3458A' else (lambda instrument, command: instrument.write(command))
+		self._write = write
+		self.skip_redundant = skip_redundant
+		self.skipped_commands = 0 # Number of commands that were not sent because they were redundant.
+		self._pending_commands = []
+	
+	def write(self, command):
+		"""
+		Queues "command" (it may contain several commands separated by
+		";") unless it is redundant.
+		"""
+		state = _get_known_state(self.instrument)
+		for subcommand in command.split(';'):
+			subcommand = ' '.join(subcommand.split()).upper()
+			if subcommand == '':
+				continue
+			keyword, _, args = subcommand.partition(' ')
+			if keyword == self.commands['context']:
+				if self.skip_redundant and state['context'] == args:
+					self.skipped_commands += 1
+					continue
+				state['context'] = args
+				self._pending_commands.append(subcommand)
+				continue
+			setting = self.commands['settings'].get(keyword)
+			invalidated = self.commands['invalidates'].get(keyword, [])
+			if self.skip_redundant and setting is not None and invalidated is not None and state['settings'].get((state['context'], setting)) == subcommand:
+				self.skipped_commands += 1
+				continue
+			self._pending_commands.append(subcommand)
+			if invalidated is None:
+				state['settings'].clear()
+				state['context'] = None
+			else:
+				for invalidated_setting in invalidated:
+					state['settings'].pop((state['context'], invalidated_setting), None)
+			if setting is not None:
+				state['settings'][(state['context'], setting)] = subcommand
+	
+	def flush(self):
+		"""
+		Sends all the queued commands in a single transaction.
+		"""
+		if len(self._pending_commands) == 0:
+			return
+		commands = ';'.join(self._pending_commands)
+		self._pending_commands = []
+		try:
+			self._write(self.instrument, commands)
+		except:
+			forget(self.instrument) # We don't know which commands were received.
+			raise
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.flush()
+		else:
+			forget(self.instrument)
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+VISA_METHODS = ['write', 'query', 'read', 'read_raw', 'read_bytes'] # Timed as I/O of the instruments.
+
+class instrument_session:
+	"""
+	Runs operations on several instruments at the same time, each one in
+	its own thread, and accumulates for each instrument the time spent in
+	its VISA calls ("io_time") and in its operations ("busy_time", which 
+	also counts the waits for readings and the processing done inside 
+	the operations). Operations on the same instrument are always 
+	serialized. Operations on
+	different instruments overlap: the VISA library serializes the bus
+	transactions themselves, while the time the instruments spend
+	processing commands or preparing data is overlapped. If
+	"serialize_bus" is True, operations on instruments connected to the
+	same GPIB board are also serialized.
+
+	Example
+	-------
+	>>> session = instrument_session(DMM)
+	>>> samples = session.map(HP3458A.read_binary_mem, [N_SAMPLES]*len(DMM))
+	>>> print(session.io_time_report())
+	"""
+	def __init__(self, instruments, serialize_bus=False):
+		self.instruments = list(instruments)
+		self.serialize_bus = serialize_bus
+		self.names = [self._name(instrument, k) for k,instrument in enumerate(self.instruments)]
+		self.io_time = dict([(name, 0.) for name in self.names]) # Seconds spent in VISA calls of each instrument.
+		self.busy_time = dict([(name, 0.) for name in self.names]) # Seconds spent in operations of each instrument.
+		self._in_visa_call = threading.local() # So calls made by other VISA calls (e.g. "query" calls "write") are not counted twice.
+		self._timed_methods = []
+		for name, instrument in zip(self.names, self.instruments):
+			for method in VISA_METHODS:
+				if hasattr(instrument, method):
+					self._timed_methods.append((instrument, method, method in vars(instrument), getattr(instrument, method)))
+					setattr(instrument, method, self._timed_visa_call(name, getattr(instrument, method)))
+		self._instrument_locks = dict([(name, threading.Lock()) for name in self.names])
+		self._bus_locks = dict([(self._board(name), threading.Lock()) for name in self.names])
+		self._executor = ThreadPoolExecutor(max_workers=max(len(self.instruments), 1))
+
+	@staticmethod
+	def _name(instrument, index):
+		return getattr(instrument, 'resource_name', 'instrument ' + str(index))
+
+	@staticmethod
+	def _board(name):
+		return name.split('::')[0] # E.g. 'GPIB0' for 'GPIB0::22::INSTR'.
+
+	def _timed_visa_call(self, name, method):
+		def timed_method(*args, **kwargs):
+			if getattr(self._in_visa_call, 'value', False):
+				return method(*args, **kwargs)
+			self._in_visa_call.value = True
+			start_time = time.time()
+			try:
+				return method(*args, **kwargs)
+			finally:
+				self.io_time[name] += time.time() - start_time
+				self._in_visa_call.value = False
+		return timed_method
+
+	def _run(self, index, function, args):
+		name = self.names[index]
+		bus_lock = self._bus_locks[self._board(name)] if self.serialize_bus else None
+		with self._instrument_locks[name]:
+			if bus_lock is not None:
+				bus_lock.acquire()
+			try:
+				start_time = time.time()
+				result = function(self.instruments[index], *args)
+				self.busy_time[name] += time.time() - start_time
+			finally:
+				if bus_lock is not None:
+					bus_lock.release()
+		return result
+
+	def submit(self, index, function, *args):
+		"""
+		Calls "function(instrument, *args)" in the background for the
+		instrument number "index" and returns a "concurrent.futures.Future".
+		"""
+		return self._executor.submit(self._run, index, function, args)
+
+	def map(self, function, *iterables):
+		"""
+		Calls "function(instrument, *args)" for all the instruments at the
+		same time, taking the k-th "args" from the k-th element of each one
+		of "iterables", and returns the list of results once all of them
+		have finished.
+		"""
+		args = list(zip(*iterables)) if len(iterables) > 0 else [()]*len(self.instruments)
+		if len(args) != len(self.instruments):
+			raise ValueError('One argument per instrument is required')
+		futures = [self.submit(k, function, *args[k]) for k in range(len(self.instruments))]
+		return [future.result() for future in futures]
+
+	def io_time_report(self):
+		return '\n'.join(['Time spent in ' + name + ': {:.3f} seconds of I/O in {:.3f} seconds of operations'.format(self.io_time[name], self.busy_time[name]) for name in self.names])
+
+	def close(self):
+		"""
+		Waits for the pending operations and stops timing the VISA calls
+		of the instruments.
+		"""
+		self._executor.shutdown()
+		for instrument, method, had_attribute, original in reversed(self._timed_methods):
+			if had_attribute:
+				setattr(instrument, method, original)
+			else:
+				delattr(instrument, method)
+		self._timed_methods = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
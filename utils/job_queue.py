@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import time
+
+STAGES = ['fix_trigger', 'process'] # In the order in which they are done to each burst.
+
+class job_queue:
+	"""
+	Queue of the bursts to be processed, stored in an SQLite database so
+	it can be shared by several processes and survives a crash. Each
+	burst (identified by its timestamp) is in one of the STAGES and in
+	one of the states
+
+		'pending': Waiting for a worker.
+		'claimed': A worker is doing this stage.
+		'done': All the stages are done.
+		'failed': The last attempt raised an error. It is claimed again
+			until "max_attempts" is reached.
+
+	"claim" is atomic, so a burst is never given to two workers.
+
+	Example
+	-------
+	>>> jobs = job_queue('current_measurement/jobs.sqlite')
+	>>> jobs.add(timestamp)
+	>>> timestamp, stage = jobs.claim()
+	>>> jobs.advance(timestamp) # Or "jobs.failed(timestamp, error)".
+	"""
+	def __init__(self, database_file_name, max_attempts=3, timeout=30):
+		self.max_attempts = max_attempts
+		self._connection = sqlite3.connect(database_file_name, timeout=timeout, isolation_level=None) # Transactions are handled explicitly.
+		self._connection.execute('PRAGMA journal_mode=WAL') # Readers do not block the writer.
+		self._connection.execute(
+			'CREATE TABLE IF NOT EXISTS jobs ('
+			'timestamp TEXT PRIMARY KEY, stage TEXT, state TEXT, attempts INTEGER, error TEXT, updated REAL)'
+		)
+
+	def _execute(self, sql, parameters=()):
+		return self._connection.execute(sql, parameters)
+
+	def add(self, timestamp, stage=STAGES[0]):
+		"""
+		Adds a burst as pending in "stage". Bursts already in the queue are
+		not changed.
+		"""
+		self._execute(
+			'INSERT OR IGNORE INTO jobs VALUES (?, ?, \'pending\', 0, NULL, ?)',
+			(timestamp, stage, time.time())
+		)
+
+	def sync_with_directory(self, path, stage, suffix):
+		"""
+		Adds as pending in "stage" the bursts that have a file ending with
+		"suffix" in "path" and are not in the queue, e.g. bursts left by a
+		previous run.
+		"""
+		for file_name in os.listdir(path):
+			if file_name[-len(suffix):] == suffix:
+				self.add(file_name[:-len(suffix)], stage)
+
+	def requeue_claimed(self):
+		"""
+		Makes pending again the bursts that were claimed by workers that no
+		longer exist. Must be called only when no worker is running.
+		"""
+		self._execute('UPDATE jobs SET state = \'pending\', updated = ? WHERE state = \'claimed\'', (time.time(),))
+
+	def claim(self, stage=None):
+		"""
+		Marks as claimed the oldest burst that is pending (or failed, with
+		attempts left) in "stage", or in any stage if it is None, and
+		returns "(timestamp, stage)". Returns None if there is none.
+		"""
+		stages = STAGES if stage is None else [stage]
+		self._execute('BEGIN IMMEDIATE') # Locks the database for writing until the commit.
+		try:
+			row = self._execute(
+				'SELECT timestamp, stage FROM jobs WHERE stage IN (' + ','.join('?'*len(stages)) + ') '
+				'AND (state = \'pending\' OR (state = \'failed\' AND attempts < ?)) ORDER BY timestamp LIMIT 1',
+				stages + [self.max_attempts]
+			).fetchone()
+			if row is not None:
+				self._execute(
+					'UPDATE jobs SET state = \'claimed\', attempts = attempts + 1, updated = ? WHERE timestamp = ?',
+					(time.time(), row[0])
+				)
+			self._execute('COMMIT')
+		except:
+			self._execute('ROLLBACK')
+			raise
+		return None if row is None else tuple(row)
+
+	def advance(self, timestamp, keep_claimed=False):
+		"""
+		Moves a claimed burst to the next stage, as pending or, if
+		"keep_claimed" is True, still claimed by the same worker. After the
+		last stage it is marked as done.
+		"""
+		stage = self._execute('SELECT stage FROM jobs WHERE timestamp = ?', (timestamp,)).fetchone()[0]
+		if stage == STAGES[-1]:
+			self._execute('UPDATE jobs SET state = \'done\', error = NULL, updated = ? WHERE timestamp = ?', (time.time(), timestamp))
+			return
+		self._execute(
+			'UPDATE jobs SET stage = ?, state = ?, attempts = ?, error = NULL, updated = ? WHERE timestamp = ?',
+			(STAGES[STAGES.index(stage)+1], 'claimed' if keep_claimed else 'pending', 1 if keep_claimed else 0, time.time(), timestamp)
+		)
+
+	def failed(self, timestamp, error):
+		self._execute('UPDATE jobs SET state = \'failed\', error = ?, updated = ? WHERE timestamp = ?', (str(error), time.time(), timestamp))
+
+	def count(self, state=None):
+		"""
+		Number of bursts in "state" or, if it is None, that still have to
+		be processed (pending, claimed or failed with attempts left).
+		"""
+		if state is not None:
+			return self._execute('SELECT COUNT(*) FROM jobs WHERE state = ?', (state,)).fetchone()[0]
+		return self._execute(
+			'SELECT COUNT(*) FROM jobs WHERE state IN (\'pending\', \'claimed\') OR (state = \'failed\' AND attempts < ?)',
+			(self.max_attempts,)
+		).fetchone()[0]
+
+	def failures(self):
+		"""
+		Returns a list of "(timestamp, stage, error)" of the bursts that
+		failed in all their attempts.
+		"""
+		return self._execute(
+			'SELECT timestamp, stage, error FROM jobs WHERE state = \'failed\' AND attempts >= ? ORDER BY timestamp',
+			(self.max_attempts,)
+		).fetchall()
+
+	def close(self):
+		self._connection.close()
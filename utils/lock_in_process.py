@@ -13,3 +13,63 @@ def lock_in_process(S1, S2):
 	Sdc = np.dot(Squad, S2)
 	phi = np.arctan(Sdc/Sdf)
 	return phi
+
+def lock_in_process_batch(S1, S2, n_blocks=10):
+	"""
+	Lock-in of many bursts at once. "S1" (reference) and "S2" are arrays
+	of shape (bursts, samples), or 1D arrays for a single burst. As in
+	"lock_in_process" S2 is compared with S1 and its Hilbert transform
+	(computed with a real FFT of the length of the burst, zero padding
+	would make it wrong at the edges of coherent bursts), but the mean of
+	the signals is removed first and the Hilbert transform of S2 is also
+	used.
+
+	The uncertainties are estimated with a block jackknife: each burst is
+	split into "n_blocks" contiguous blocks and the results are computed
+	leaving out one block at a time. Use a number of blocks that divides
+	the burst in whole periods if possible.
+
+	Returns
+	-------
+	ratio, ratio_std, phi, phi_std : numpy arrays (floats for 1D input)
+		Amplitude ratio S2/S1 and phase of S2 respect to S1 (positive if
+		S2 leads) with their standard deviations, for each burst.
+	"""
+	S1 = np.asarray(S1, dtype=float)
+	S2 = np.asarray(S2, dtype=float)
+	if S1.shape != S2.shape:
+		raise ValueError('Data sets shapes mismatch!')
+	single_burst = S1.ndim == 1
+	S1 = np.atleast_2d(S1)
+	S2 = np.atleast_2d(S2)
+	N = S1.shape[-1]
+	if N < 100:
+		raise ValueError('Miminum number of points is 100')
+	if n_blocks < 2 or n_blocks > N:
+		raise ValueError('"n_blocks" must be between 2 and the number of samples')
+	S1 = S1 - S1.mean(axis=-1, keepdims=True)
+	S2 = S2 - S2.mean(axis=-1, keepdims=True)
+	# Analytic signals "Squad + j*S", with the same convention as 
+	# "fftpack.hilbert" (i.e. sin --> cos). Their product has no 
+	# component at twice the frequency, so it can be summed by blocks.
+	spectrum = np.fft.rfft(np.stack((S1, S2)), axis=-1)
+	spectrum[...,0] = 0
+	if N%2 == 0:
+		spectrum[...,-1] = 0
+	analytic = np.fft.irfft(1j*spectrum, N, axis=-1) + 1j*np.stack((S1, S2))
+	# Sums over each block, the sums over the whole burst and leaving out each block are obtained from them.
+	block_edges = np.linspace(0, N, n_blocks+1).astype(int)[:-1]
+	product_blocks = np.add.reduceat(analytic[1]*np.conj(analytic[0]), block_edges, axis=-1)
+	reference_blocks = np.add.reduceat(np.abs(analytic[0])**2, block_edges, axis=-1)
+	product, reference = product_blocks.sum(axis=-1), reference_blocks.sum(axis=-1)
+	ratio = np.abs(product)/reference
+	phi = np.angle(product)
+	product_jk = product[:,None] - product_blocks # Leaving out one block at a time.
+	reference_jk = reference[:,None] - reference_blocks
+	ratio_jk = np.abs(product_jk)/reference_jk
+	phi_jk = phi[:,None] + np.angle(product_jk*np.conj(product[:,None])) # Avoids jumps of 2*pi.
+	ratio_std = np.sqrt((n_blocks-1)/n_blocks*np.sum((ratio_jk - ratio_jk.mean(axis=-1, keepdims=True))**2, axis=-1))
+	phi_std = np.sqrt((n_blocks-1)/n_blocks*np.sum((phi_jk - phi_jk.mean(axis=-1, keepdims=True))**2, axis=-1))
+	if single_burst:
+		return ratio[0], ratio_std[0], phi[0], phi_std[0]
+	return ratio, ratio_std, phi, phi_std
@@ -0,0 +1,90 @@
+"""
+Multisine excitation: a periodic waveform made of several tones at
+harmonics of a fundamental frequency, so the transference at all of them
+is measured with a single burst. The burst must be coherent with the
+fundamental (see "utils/sampling_planner.py"), i.e. it must contain
+exactly "periods" periods of it in "number_of_samples" samples. Then
+harmonic "h" falls exactly in bin "h*periods" of the DFT of the burst
+(folded into the first Nyquist zone if it is above it) and one FFT of
+each signal gives all the tones without leakage.
+"""
+import numpy as np
+
+ARBITRARY_WAVEFORM_POINTS = 2048 # Of the waveform loaded in the HP3245A.
+
+def schroeder_phases(n_tones):
+	"""
+	Phases of "n_tones" tones of equal amplitude that give a low crest
+	factor (Schroeder, 1970), so the waveform uses the range of the
+	generator and of the voltmeters efficiently.
+	"""
+	k = np.arange(1, n_tones+1)
+	return -np.pi*k*(k-1)/n_tones
+
+def waveform(harmonics, n_points=ARBITRARY_WAVEFORM_POINTS, amplitudes=None, phases=None):
+	"""
+	One period of the multisine with the given "harmonics" of the
+	fundamental, sampled in "n_points" points and normalized to a peak
+	value of 1. By default all tones have the same amplitude and
+	Schroeder phases.
+	"""
+	harmonics = np.asarray(harmonics)
+	if np.any(harmonics >= n_points/2):
+		raise ValueError('The harmonics must be less than ' + str(n_points//2) + ' to be represented with ' + str(n_points) + ' points')
+	amplitudes = np.ones(len(harmonics)) if amplitudes is None else np.asarray(amplitudes, dtype=float)
+	phases = schroeder_phases(len(harmonics)) if phases is None else np.asarray(phases, dtype=float)
+	n = np.arange(n_points)
+	signal = np.sum(amplitudes[:,None]*np.sin(2*np.pi*harmonics[:,None]*n/n_points + phases[:,None]), axis=0)
+	return signal/np.abs(signal).max()
+
+def tone_bins(harmonics, periods, number_of_samples):
+	"""
+	Returns the bins of the real FFT of a coherent burst in which each
+	harmonic falls and a boolean array that is True for the tones that
+	were folded from the upper half of the spectrum (their phase is
+	reversed). Raises "ValueError" if two tones fall in the same bin or
+	a tone falls in the DC or Nyquist bins.
+	"""
+	bins = np.asarray(harmonics)*periods % number_of_samples
+	folded = bins > number_of_samples/2
+	bins = np.where(folded, number_of_samples - bins, bins)
+	if len(np.unique(bins)) != len(bins) or np.any(bins == 0) or np.any(2*bins == number_of_samples):
+		raise ValueError('The tones cannot be separated with ' + str(periods) + ' periods in ' + str(number_of_samples) + ' samples')
+	return bins, folded
+
+def transference(S1, S2, harmonics, periods, lag=0):
+	"""
+	Transference S2/S1 at each of the "harmonics" from one FFT of each
+	coherent burst with "periods" periods of the fundamental. The
+	uncertainties are estimated from the noise in the bins without tones,
+	assumed white and independent in both signals.
+	If S1[n] corresponds to S2[n+lag] (see "utils/trigger_alignment.py")
+	the lag is corrected in the phase, since aligning the bursts would
+	make them no longer coherent.
+
+	Returns
+	-------
+	ratio, ratio_std, phi, phi_std : numpy arrays
+		Amplitude ratio and phase of S2 respect to S1 (positive if S2
+		leads) with their standard deviations, for each harmonic.
+	"""
+	S1 = np.asarray(S1, dtype=float)
+	S2 = np.asarray(S2, dtype=float)
+	if S1.shape != S2.shape:
+		raise ValueError('Data sets shapes mismatch!')
+	N = len(S1)
+	bins, folded = tone_bins(harmonics, periods, N)
+	spectra = np.fft.rfft(np.stack((S1, S2)), axis=-1)
+	tones = spectra[:,bins]
+	tones[:,folded] = np.conj(tones[:,folded])
+	noise_bins = np.ones(spectra.shape[-1], dtype=bool)
+	noise_bins[bins] = False
+	noise_bins[0] = False # Offset.
+	if N%2 == 0:
+		noise_bins[-1] = False
+	# Variance of the real and imaginary parts of each bin, the same for all the bins with white noise.
+	bin_variances = np.mean(np.abs(spectra[:,noise_bins])**2, axis=-1)/2
+	T = tones[1]/tones[0]*np.exp(2j*np.pi*np.asarray(harmonics)*periods/N*lag)
+	relative_variances = bin_variances[0]/np.abs(tones[0])**2 + bin_variances[1]/np.abs(tones[1])**2 # Both of the amplitude and of the phase.
+	ratio = np.abs(T)
+	return ratio, ratio*np.sqrt(relative_variances), np.angle(T), np.sqrt(relative_variances)
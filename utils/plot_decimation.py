@@ -0,0 +1,30 @@
+import numpy as np
+
+def min_max_indices(y, max_points):
+	"""
+	Indices of the points to plot "y" with about "max_points" points 
+	(never more): the record is split in "max_points//2" bins and the
+	minimum and the maximum of each bin are kept, in their original 
+	order. The plot looks like the plot of all the points (its envelope
+	is the same) but it takes the same time to draw for any length.
+	Returns all the indices if "y" is short.
+
+	Example
+	-------
+	>>> indices = min_max_indices(samples, 2000)
+	>>> plt.plot(time[indices], samples[indices])
+	"""
+	y = np.asarray(y)
+	N = len(y)
+	if N <= max_points:
+		return np.arange(N)
+	if max_points < 2:
+		raise ValueError('At least 2 points are needed')
+	bin_size = int(np.ceil(N/(max_points//2)))
+	n_full_bins = N//bin_size
+	bins = y[:n_full_bins*bin_size].reshape(n_full_bins, bin_size)
+	indices = np.stack((bins.argmin(axis=1), bins.argmax(axis=1)), axis=1) + bin_size*np.arange(n_full_bins)[:,None]
+	if n_full_bins*bin_size < N: # The last bin is shorter.
+		tail = y[n_full_bins*bin_size:]
+		indices = np.concatenate((indices, np.array([[tail.argmin(), tail.argmax()]]) + n_full_bins*bin_size))
+	return np.sort(indices, axis=1).ravel()
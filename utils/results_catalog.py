@@ -0,0 +1,117 @@
+import sqlite3
+import numpy as np
+
+from .transference_aggregator import transference_aggregator
+
+COLUMNS = [ # Of the "results" table, in order.
+	('timestamp', 'TEXT'), # Of the burst, or of the run in AC mode.
+	('campaign', 'TEXT'),
+	('mode', 'TEXT'), # 'sampling' (bursts or streaming) or 'AC'.
+	('generator_frequency', 'REAL'),
+	('sampling_frequency', 'REAL'),
+	('generator_amplitude', 'REAL'),
+	('number_of_samples', 'INTEGER'),
+	('T_abs', 'REAL'),
+	('T_abs_s', 'REAL'),
+	('T_phi', 'REAL'),
+	('T_phi_s', 'REAL'),
+	('raw_path', 'TEXT'), # File with the raw data, if any, relative to the directory of the campaign (e.g. "current_measurement" until it is archived).
+]
+
+class results_catalog:
+	"""
+	Catalog of the transference measured at each frequency, stored in an
+	SQLite database shared by all the campaigns, with one row per burst
+	(or per frequency of an AC mode run). The rows are indexed by
+	campaign and frequency, so the results of any set of campaigns are
+	obtained without reading the data directories.
+
+	Example
+	-------
+	>>> catalog = results_catalog('results_catalog.sqlite')
+	>>> catalog.add(timestamp, campaign, generator_frequency, T_abs, T_abs_s, T_phi, T_phi_s)
+	>>> frequencies, T_abs, T_phi, number_of_bursts = catalog.transference(campaign)
+	"""
+	def __init__(self, database_file_name, timeout=30):
+		self._connection = sqlite3.connect(database_file_name, timeout=timeout, isolation_level=None) # Every statement is committed.
+		self._connection.execute('PRAGMA journal_mode=WAL') # Readers do not block the writer.
+		self._connection.execute(
+			'CREATE TABLE IF NOT EXISTS results (' + ', '.join(name + ' ' + sql_type for name, sql_type in COLUMNS) + ', '
+			'PRIMARY KEY (timestamp, generator_frequency))'
+		)
+		self._connection.execute('CREATE INDEX IF NOT EXISTS results_by_campaign ON results (campaign, mode, generator_frequency, timestamp)')
+		self._connection.execute('CREATE INDEX IF NOT EXISTS results_by_frequency ON results (generator_frequency)')
+
+	def _execute(self, sql, parameters=()):
+		return self._connection.execute(sql, parameters)
+
+	def add(self, timestamp, campaign, generator_frequency, T_abs, T_abs_s, T_phi=None, T_phi_s=None, sampling_frequency=None, generator_amplitude=None, number_of_samples=None, mode='sampling', raw_path=None):
+		"""
+		Adds a result, replacing the previous one of the same timestamp
+		and frequency (e.g. if a burst is processed again).
+		"""
+		row = [timestamp, campaign, mode, generator_frequency, sampling_frequency, generator_amplitude, number_of_samples, T_abs, T_abs_s, T_phi, T_phi_s, raw_path] # As in COLUMNS.
+		row = [value.item() if isinstance(value, np.generic) else value for value in row] # sqlite3 does not know numpy types.
+		self._execute('INSERT OR REPLACE INTO results VALUES (' + ','.join('?'*len(COLUMNS)) + ')', row)
+
+	def add_many(self, rows):
+		"""
+		Adds several results in one transaction, so they are seen all at
+		once by the readers. "rows" is a list of dictionaries with the
+		arguments of "add".
+		"""
+		self._execute('BEGIN IMMEDIATE')
+		try:
+			for row in rows:
+				self.add(**row)
+			self._execute('COMMIT')
+		except:
+			self._execute('ROLLBACK')
+			raise
+
+	def campaigns(self):
+		"""
+		Returns a list of "(campaign, number of results, first timestamp,
+		last timestamp)" ordered by the first timestamp.
+		"""
+		return self._execute(
+			'SELECT campaign, COUNT(*), MIN(timestamp), MAX(timestamp) FROM results GROUP BY campaign ORDER BY MIN(timestamp)'
+		).fetchall()
+
+	def results(self, campaign=None, mode=None, minimum_frequency=None, maximum_frequency=None, columns=None):
+		"""
+		Returns a dictionary with a numpy array for each of the "columns"
+		(by default all the COLUMNS) with the results that match the given
+		conditions, ordered by frequency and timestamp.
+		"""
+		columns = [name for name, _ in COLUMNS] if columns is None else columns
+		conditions = []
+		parameters = []
+		for condition, parameter in [('campaign = ?', campaign), ('mode = ?', mode), ('generator_frequency >= ?', minimum_frequency), ('generator_frequency <= ?', maximum_frequency)]:
+			if parameter is not None:
+				conditions.append(condition)
+				parameters.append(parameter)
+		rows = self._execute(
+			'SELECT ' + ', '.join(columns) + ' FROM results' + (' WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else '') + ' ORDER BY generator_frequency, timestamp',
+			parameters
+		).fetchall()
+		types = dict(COLUMNS)
+		return {name: np.array([row[k] for row in rows], dtype=float if types[name] == 'REAL' else object) for k, name in enumerate(columns)}
+
+	def transference(self, campaign, mode='sampling'):
+		"""
+		Aggregates the results of a campaign by frequency as
+		"plot_transference.py" does, see "transference_aggregator.result".
+		A missing phase (AC mode) is returned as "nan".
+		"""
+		results = self.results(campaign, mode, columns=['timestamp', 'generator_frequency', 'T_abs', 'T_abs_s', 'T_phi', 'T_phi_s'])
+		aggregator = transference_aggregator()
+		aggregator.add(
+			results['generator_frequency'],
+			np.stack((results['T_abs'], results['T_phi']), axis=-1),
+			np.stack((results['T_abs_s'], results['T_phi_s']), axis=-1),
+		)
+		return aggregator.result()
+
+	def close(self):
+		self._connection.close()
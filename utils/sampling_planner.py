@@ -0,0 +1,81 @@
+"""
+Plans the sampling of each burst so that it is coherent, i.e. the burst
+of N samples contains exactly M periods of the signal with M and N
+coprime. Then every sample falls at a different phase of the signal,
+the FFT (or single bin DFT) of the burst has no leakage and there are no
+repeated quantization patterns. To achieve this exactly the generator
+frequency is slightly adjusted:
+
+	generator_frequency = M/(N*sampling_period)
+
+The sampling period is a multiple of the HP3458A timer resolution and
+the number of samples fits in its reading memory (SINT format).
+"""
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+from . import HP3458A
+
+TIMER_RESOLUTION = 100e-9 # Seconds, of the HP3458A "TIMER" command.
+MAXIMUM_SAMPLES = HP3458A.reading_memory_bytes//2 # SINT readings are 2 bytes.
+
+burst_plan = namedtuple('burst_plan', ['generator_frequency', 'sampling_frequency', 'number_of_samples', 'periods', 'subsampling'])
+
+@lru_cache(maxsize=None)
+def plan_burst(generator_frequency, sampling_frequency, number_of_samples, frequency_tolerance=1e-4, minimum_samples_fraction=.9):
+	"""
+	Returns a "burst_plan" close to the requested values.
+
+	Parameters
+	----------
+	generator_frequency : float
+		Desired frequency of the signal. The planned one differs from it
+		by less than "frequency_tolerance" (relative) if possible.
+	sampling_frequency : float
+		Desired sampling frequency. If it is higher than
+		"HP3458A.MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE" the
+		burst is subsampled: between samples the signal advances some
+		whole periods plus the fraction of a period it would advance at
+		"sampling_frequency", so the samples cover the period as densely.
+	number_of_samples : int
+		Maximum number of samples. Fewer samples (down to
+		"minimum_samples_fraction" of it) are used if needed to match
+		the frequency within tolerance.
+	"""
+	number_of_samples = min(int(number_of_samples), MAXIMUM_SAMPLES)
+	maximum_sampling_frequency = HP3458A.MAXIMUM_SAMPLING_FREQUENCY_IN_DIRECT_SAMPLING_MODE
+	subsampling = sampling_frequency > maximum_sampling_frequency
+	if subsampling:
+		fraction = generator_frequency/sampling_frequency % 1 # Fraction of a period between samples.
+		whole_periods = math.ceil(generator_frequency/maximum_sampling_frequency - fraction)
+		sampling_period = (whole_periods + fraction)/generator_frequency
+	else:
+		sampling_period = 1/sampling_frequency
+	sampling_period = max(round(sampling_period/TIMER_RESOLUTION), math.ceil(1/maximum_sampling_frequency/TIMER_RESOLUTION))*TIMER_RESOLUTION
+	best = None
+	for N in range(number_of_samples, max(int(number_of_samples*minimum_samples_fraction), 2) - 1, -1):
+		M = round(generator_frequency*N*sampling_period)
+		if M < 1 or math.gcd(M, N) != 1:
+			continue
+		error = abs(M/(N*sampling_period)/generator_frequency - 1)
+		if best is None or error < best[0]:
+			best = (error, M, N)
+		if error <= frequency_tolerance:
+			break
+	if best is None:
+		raise ValueError('Cannot plan a coherent burst for ' + str(generator_frequency) + ' Hz')
+	_, M, N = best
+	return burst_plan(
+		generator_frequency = M/(N*sampling_period),
+		sampling_frequency = 1/sampling_period,
+		number_of_samples = N,
+		periods = M,
+		subsampling = subsampling,
+	)
+
+def plan_sweep(generator_frequencies, sampling_frequencies, number_of_samples, **kwargs):
+	"""
+	Returns a list with the "plan_burst" of each frequency of a sweep.
+	"""
+	return [plan_burst(float(f), float(fs), int(number_of_samples), **kwargs) for f,fs in zip(generator_frequencies, sampling_frequencies)]
@@ -0,0 +1,329 @@
+"""
+Simulated HP3458A multimeters and HP3245A universal source behind a
+pyvisa-like interface, to run the acquisition scripts without the bench.
+Use it instead of "visa":
+
+	import utils.simulated_instruments as visa
+	rm = visa.ResourceManager()
+
+Only the subset of commands used by the scripts of this repository is
+understood. The simulated bench is:
+
+	HP3245A channel A --> divider --> DMM at "output_dmm_address"
+	                  \\-------------> DMM at "input_dmm_address"
+	HP3245A channel B --> sample clock (EXTSYN) of both DMMs, enabled
+	                      with "SYNCOUT TB0".
+
+GPIB latencies are emulated with "time.sleep", so the time taken by the
+scripts is representative of the time taken with the real instruments.
+"""
+import re
+import time
+import numpy as np
+
+from . import HP3458A
+
+AC_READINGS_PER_SECOND = 10
+
+class simulated_bench:
+	"""
+	Configuration and shared state of the simulated instruments.
+	"""
+	def __init__(self,
+		divider_ratio = 7.4/10,
+		divider_phase = 1e-4, # Phase of the output respect to the input (rad).
+		noise_rms = 100e-6, # Noise added to each reading (V).
+		max_trigger_offset = 2, # Each DMM starts a random number of clock cycles late, up to this value.
+		write_latency = 2e-3, # Seconds per write.
+		query_latency = 5e-3, # Seconds per query.
+		bytes_per_second = 500e3, # GPIB transfer rate.
+		input_dmm_address = 'GPIB0::21::INSTR',
+		output_dmm_address = 'GPIB0::22::INSTR',
+		generator_address = 'GPIB0::9::INSTR',
+		seed = None,
+	):
+		self.divider_ratio = divider_ratio
+		self.divider_phase = divider_phase
+		self.noise_rms = noise_rms
+		self.max_trigger_offset = max_trigger_offset
+		self.write_latency = write_latency
+		self.query_latency = query_latency
+		self.bytes_per_second = bytes_per_second
+		self.input_dmm_address = input_dmm_address
+		self.output_dmm_address = output_dmm_address
+		self.generator_address = generator_address
+		self.rng = np.random.default_rng(seed)
+		self.generator = None # Set when the generator is opened.
+		self.epoch = time.time() # Times are measured from here, to keep the precision of the phases.
+	
+	def signal(self, t, gain=1, phase=0):
+		"""
+		Output of channel A of the generator at times "t" (seconds since
+		"epoch"), multiplied by "gain" and shifted by "phase".
+		"""
+		channel = self.generator.channels['CHANA']
+		if channel['TERM'] == 'OFF':
+			return np.zeros(len(t))
+		if channel['waveform'] is not None: # Sum of the harmonics of the arbitrary waveform, each one shifted by "phase".
+			harmonics, coefficients = channel['waveform']
+			waveform = np.sum(np.abs(coefficients)[:,None]*np.cos(2*np.pi*channel['FREQ']*harmonics[:,None]*t + np.angle(coefficients)[:,None] + phase), axis=0)
+			return gain*(channel['amplitude']*waveform + channel['DCOFF'])
+		return gain*(channel['amplitude']*np.sin(2*np.pi*channel['FREQ']*t + phase) + channel['DCOFF'])
+	
+	def clock_start_time(self):
+		"""
+		Time at which channel B started to send sample events to the DMMs,
+		None if it is not doing so.
+		"""
+		if self.generator is None:
+			return None
+		channel = self.generator.channels['CHANB']
+		if channel['SYNCOUT'] != 'TB0' or channel['TERM'] == 'OFF':
+			return None
+		return channel['sync_start_time']
+	
+	def clock_frequency(self):
+		return self.generator.channels['CHANB']['FREQ']
+	
+class _simulated_resource:
+	"""
+	GPIB transport shared by the simulated instruments. Each instrument
+	defines "_execute(keyword, args)" to run the commands it is sent.
+	"""
+	def __init__(self, bench, resource_name):
+		self.bench = bench
+		self.resource_name = resource_name
+		self.timeout = 2e3
+		self.read_termination = '\n'
+		self._output = b''
+	
+	def write(self, command):
+		time.sleep(self.bench.write_latency)
+		for subcommand in command.split(';'):
+			subcommand = ' '.join(subcommand.split()).upper()
+			if subcommand != '':
+				keyword, _, args = subcommand.partition(' ')
+				self._execute(keyword, args.replace(' ', ''))
+	
+	def query(self, command):
+		time.sleep(self.bench.query_latency)
+		self.write(command)
+		answer = self._output.decode()
+		self._output = b''
+		return answer
+	
+	def read_bytes(self, count):
+		time.sleep(count/self.bench.bytes_per_second)
+		data = self._output[:count]
+		self._output = self._output[count:]
+		return data
+	
+	def close(self):
+		pass
+	
+class simulated_HP3245A(_simulated_resource):
+	def __init__(self, bench, resource_name):
+		super().__init__(bench, resource_name)
+		self._reset()
+	
+	def _reset(self):
+		self.channels = {}
+		for channel in ['CHANA', 'CHANB']:
+			self.channels[channel] = {'TERM': 'OFF', 'SYNCOUT': 'OFF', 'FREQ': 1000, 'amplitude': 0, 'DCOFF': 0, 'sync_start_time': None, 'waveform': None}
+		self.current_channel = 'CHANA'
+		self.arrays = {} # Defined with "REAL name(max_index)" and filled with "FILL name values".
+	
+	def _execute(self, keyword, args):
+		channel = self.channels[self.current_channel]
+		if keyword == 'RESET':
+			self._reset()
+		elif keyword == 'USE':
+			self.current_channel = args
+		elif keyword == 'APPLY' and args.startswith('WFV'):
+			value, _, array_name = args[len('WFV'):].partition(',')
+			channel['amplitude'] = float(value)/2 # Peak to peak, as for ACV.
+			coefficients = np.fft.rfft(self.arrays[array_name])*2/len(self.arrays[array_name]) # The waveform is kept as its harmonics.
+			coefficients[0] = 0 # Offsets are given with "DCOFF".
+			harmonics = np.flatnonzero(np.abs(coefficients) > 1e-9)
+			channel['waveform'] = (harmonics, coefficients[harmonics])
+		elif keyword == 'APPLY':
+			function, _, value = args.partition('ACV')
+			channel['amplitude'] = float(value)/2 # ACV amplitude is given peak to peak.
+			channel['waveform'] = None
+		elif keyword == 'REAL':
+			name, _, max_index = args.partition('(')
+			self.arrays[name] = np.zeros(int(max_index.rstrip(')')) + 1)
+		elif keyword == 'FILL':
+			name, values = re.match('([A-Z_]+)(.*)', args).groups()
+			self.arrays[name] = np.array([float(value) for value in values.split(',')])
+		elif keyword in ['FREQ', 'DCOFF']:
+			channel[keyword] = float(args)
+		elif keyword == 'TERM':
+			channel['TERM'] = args
+		elif keyword == 'SYNCOUT':
+			if args == 'TB0' and channel['SYNCOUT'] != 'TB0':
+				channel['sync_start_time'] = time.time()
+			channel['SYNCOUT'] = args
+		# Other commands (IMP, ARANGE, PHSYNC, ...) do not change the simulation.
+	
+class simulated_HP3458A(_simulated_resource):
+	def __init__(self, bench, resource_name, gain, phase):
+		super().__init__(bench, resource_name)
+		self.gain = gain
+		self.phase = phase
+		self._preset()
+	
+	def _preset(self):
+		self.function = ('DCV', 10.)
+		self.mformat = 'SINT'
+		self.aper = 1e-6
+		self.memory = 'LIFO'
+		self.nrdgs = 1
+		self.armed = False
+		self._memory_cleared()
+	
+	def _memory_cleared(self):
+		self.readings = np.zeros(0) # Readings taken while armed, in volts.
+		self.arm_time = None
+		self.first_unread = 0 # For FIFO memory.
+	
+	def _range(self):
+		# The DMM selects the smallest range in which the value fits (with 20 % overrange).
+		value = self.function[1]
+		for DMM_range in [10e-3, 100e-3, 1, 10, 100, 1000]:
+			if np.abs(value) <= 1.2*DMM_range:
+				return DMM_range
+		return 1000
+	
+	def _iscale(self):
+		return 1.2*self._range()/(2**15 if self.mformat == 'SINT' else 2**31)
+	
+	def _update_readings(self):
+		"""
+		Synthesizes the readings taken since the DMM was armed.
+		"""
+		if self.armed and self.function[0] == 'ACV': # AC readings are internally triggered, with a fixed rate.
+			n_readings = min(int((time.time() - self._arm_request_time)*AC_READINGS_PER_SECOND), self.nrdgs)
+			if n_readings > len(self.readings):
+				channel = self.bench.generator.channels['CHANA']
+				rms = self.gain*channel['amplitude']/np.sqrt(2) if channel['TERM'] != 'OFF' else 0
+				self.readings = np.concatenate((self.readings, rms + self.bench.rng.normal(0, self.bench.noise_rms, n_readings - len(self.readings))))
+			return
+		clock_start = self.bench.clock_start_time()
+		if not self.armed or clock_start is None:
+			return
+		if self.arm_time is None:
+			self.arm_time = max(clock_start, self._arm_request_time)
+			self.trigger_offset = self.bench.rng.integers(0, self.bench.max_trigger_offset + 1)
+		sampling_period = 1/self.bench.clock_frequency()
+		n_readings = int((time.time() - self.arm_time)/sampling_period) - self.trigger_offset
+		n_readings = min(max(n_readings, 0), self.nrdgs)
+		if n_readings > len(self.readings):
+			t = (self.arm_time - self.bench.epoch) + (np.arange(len(self.readings), n_readings) + self.trigger_offset)*sampling_period # Relative to the epoch, absolute times do not have enough resolution.
+			new_readings = self.bench.signal(t, self.gain, self.phase) + self.bench.rng.normal(0, self.bench.noise_rms, len(t))
+			self.readings = np.concatenate((self.readings, new_readings))
+	
+	def _stored_readings(self):
+		capacity = HP3458A.reading_memory_bytes//(2 if self.mformat == 'SINT' else 4)
+		if self.memory == 'FIFO':
+			return self.readings[self.first_unread:][:capacity]
+		return self.readings[-capacity:]
+	
+	def _execute(self, keyword, args):
+		if keyword in ['PRESET', 'RESET']:
+			self._preset()
+		elif keyword in HP3458A.FUNCTION_CODES or keyword == 'FUNC':
+			if keyword == 'FUNC':
+				keyword, _, args = args.partition(',')
+			self.function = (keyword, float(args.split(',')[0]) if args != '' else self.function[1])
+		elif keyword == 'RANGE':
+			self.function = (self.function[0], float(args))
+		elif keyword == 'MFORMAT':
+			self.mformat = args
+		elif keyword == 'APER':
+			self.aper = float(args)
+		elif keyword == 'MEM':
+			self.memory = args
+			self._memory_cleared()
+		elif keyword == 'NRDGS':
+			self.nrdgs = int(args.split(',')[0])
+		elif keyword == 'TARM':
+			if args == 'AUTO' and not self.armed:
+				self._memory_cleared()
+				self.armed = True
+				self._arm_request_time = time.time()
+			elif args == 'HOLD':
+				self._update_readings()
+				self.armed = False
+		elif keyword == 'FUNC?':
+			self._output = (str(HP3458A.FUNCTION_CODES[self.function[0]]) + ',' + str(self._range())).encode()
+		elif keyword == 'RANGE?':
+			self._output = str(self._range()).encode()
+		elif keyword == 'APER?':
+			self._output = str(self.aper).encode()
+		elif keyword == 'MFORMAT?':
+			self._output = {'ASCII': b'1', 'SINT': b'2', 'DINT': b'3'}[self.mformat]
+		elif keyword == 'ISCALE?':
+			self._output = str(self._iscale()).encode()
+		elif keyword == 'MCOUNT?':
+			self._update_readings()
+			self._output = str(len(self._stored_readings())).encode()
+		elif keyword == 'RMEM':
+			self._read_memory(args)
+		# Other commands (OFORMAT, TRIG, LEVEL, DISP, ...) do not change the simulation.
+	
+	def read_bytes(self, count):
+		# With nothing in the output buffer the FIFO memory is read as normal output, removing the readings.
+		if self._output == b'' and self.memory == 'FIFO' and self.mformat != 'ASCII':
+			self._update_readings()
+			selected = self._stored_readings()[:count//self._dtype().itemsize]
+			self.first_unread += len(selected)
+			self._output = self._encode(selected)
+		return super().read_bytes(count)
+	
+	def _dtype(self):
+		return HP3458A.MEMORY_FORMAT_DTYPES[2 if self.mformat == 'SINT' else 3]
+	
+	def _encode(self, readings):
+		limit = np.iinfo(self._dtype()).max
+		return np.clip(np.round(readings/self._iscale()), -limit, limit).astype(self._dtype()).tobytes()
+	
+	def _read_memory(self, args):
+		"""
+		"RMEM first,count" in binary formats leaves "count" readings in the
+		output buffer, newest first for LIFO memory and oldest first for
+		FIFO memory. The readings are not removed from the memory. In
+		ASCII format it leaves the reading number "first".
+		"""
+		self._update_readings()
+		first, _, count = args.partition(',')
+		first = max(int(first), 1)
+		count = int(count) if count != '' else 1
+		stored = self._stored_readings()
+		if self.memory == 'LIFO':
+			selected = stored[::-1][first-1:first-1+count]
+		else:
+			selected = stored[first-1:first-1+count]
+		if self.mformat == 'ASCII':
+			self._output = str(selected[0] if len(selected) > 0 else 0.).encode()
+			return
+		self._output = self._encode(selected)
+	
+class ResourceManager:
+	"""
+	Replacement of "visa.ResourceManager" that opens simulated instruments.
+	"""
+	def __init__(self, bench=None):
+		if bench is None:
+			bench = simulated_bench()
+		self.bench = bench
+	
+	def open_resource(self, resource_name):
+		if resource_name == self.bench.generator_address:
+			self.bench.generator = simulated_HP3245A(self.bench, resource_name)
+			return self.bench.generator
+		if resource_name == self.bench.input_dmm_address:
+			return simulated_HP3458A(self.bench, resource_name, 1, 0)
+		if resource_name == self.bench.output_dmm_address:
+			return simulated_HP3458A(self.bench, resource_name, self.bench.divider_ratio, self.bench.divider_phase)
+		raise ValueError('There is no simulated instrument at "' + resource_name + '"')
@@ -0,0 +1,111 @@
+import numpy as np
+
+class running_sine_fit:
+	"""
+	Same fit as "sine_fit" but the data can be given in chunks with
+	"update", so arbitrarily long records are fitted in constant memory.
+	Only the normal equations of the linear least squares problem are
+	accumulated, for the residuals of a provisional fit of the first 
+	chunk. Otherwise the sum of the squared residuals would be obtained
+	as a difference of sums of the squared data, which loses all the
+	precision for signals much larger than the noise.
+
+	Example
+	-------
+	>>> fit = running_sine_fit(omega)
+	>>> for x, y in chunks:
+	...     fit.update(x, y)
+	>>> pfit, pcov = fit.result()
+	"""
+	def __init__(self, omega, offset=True):
+		self.omega = omega
+		self.offset = offset
+		self.n_params = 3 if offset else 2
+		self.DtD = np.zeros((self.n_params, self.n_params))
+		self.provisional_params = None # Fitted to the first chunk.
+		self.Dtr = np.zeros(self.n_params) # "r" are the residuals of the provisional fit.
+		self.rtr = 0.
+		self.n_points = 0
+
+	def _design_matrix(self, x):
+		D = np.empty((len(x), self.n_params))
+		D[:,0] = np.sin(self.omega*x)
+		D[:,1] = np.cos(self.omega*x)
+		if self.offset:
+			D[:,2] = 1
+		return D
+
+	def update(self, x, y):
+		x = np.asarray(x, dtype=float)
+		y = np.asarray(y, dtype=float)
+		if len(x) != len(y):
+			raise ValueError('Length of x and y does not match')
+		D = self._design_matrix(x)
+		if self.provisional_params is None:
+			self.provisional_params = np.linalg.lstsq(D, y, rcond=None)[0]
+		r = y - D @ self.provisional_params
+		self.DtD += D.T @ D
+		self.Dtr += D.T @ r
+		self.rtr += r @ r
+		self.n_points += len(y)
+
+	def result(self, yerr_systematic=0.0):
+		"""
+		Returns "pfit" and "pcov" as "sine_fit" does.
+		"""
+		if self.n_points <= self.n_params:
+			raise ValueError('At least ' + str(self.n_params+1) + ' points are needed to fit this sine')
+		DtD_inv = np.linalg.inv(self.DtD)
+		correction = DtD_inv @ self.Dtr
+		linear_params = self.provisional_params + correction # [A, B, V_os]
+		rss = max(self.rtr - correction @ self.Dtr, 0) # Sum of the squared residuals.
+		sigma_res_squared = rss/(self.n_points - self.n_params)
+		sigma_total_squared = sigma_res_squared + np.mean(np.asarray(yerr_systematic)**2)
+		linear_cov = DtD_inv*sigma_total_squared
+		A, B = linear_params[:2]
+		V_p = np.hypot(A, B)
+		phi = np.arctan2(B, A)
+		# Propagate the covariance from (A,B,V_os) to (V_p,phi,V_os) ---
+		J = np.eye(self.n_params)
+		J[:2,:2] = [
+			[A/V_p, B/V_p],
+			[-B/V_p**2, A/V_p**2],
+		]
+		pcov = J @ linear_cov @ J.T
+		return np.concatenate(([V_p, phi], linear_params[2:])), pcov
+
+def sine_fit(x, y, omega, yerr_systematic=0.0, offset=True):
+	"""
+	Fits "V_p*sin(omega*x + phi) + V_os" to the data (x,y) when the
+	angular frequency "omega" is known. In this case the model is linear
+	in the in-phase, quadrature and offset terms
+
+		y = A*sin(omega*x) + B*cos(omega*x) + V_os
+
+	so the fit is solved in closed form by linear least squares (the
+	three parameter sine fit from IEEE Std 1057) instead of iterating.
+
+	Parameters
+	----------
+	x, y : numpy arrays
+		Data to be fitted.
+	omega : float
+		Angular frequency in units of "1/x", e.g. radians per sample if
+		"x" is the sample number.
+	yerr_systematic : float or numpy array
+		Error of "y" not accounted by the dispersion of the residuals. It
+		is added in quadrature to the standard deviation of the residuals.
+	offset : bool
+		If False the model has no offset and only [V_p, phi] are fitted.
+
+	Returns
+	-------
+	pfit : numpy array
+		[V_p, phi, V_os] (or [V_p, phi] without offset). V_p is always
+		positive.
+	pcov : numpy array
+		Covariance matrix of pfit.
+	"""
+	fit = running_sine_fit(omega, offset)
+	fit.update(x, y) # A single chunk, the provisional fit is the fit and "rss" is the sum of its squared residuals.
+	return fit.result(yerr_systematic)
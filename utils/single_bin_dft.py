@@ -0,0 +1,71 @@
+import numpy as np
+
+def single_bin_dft(x, frequency):
+	"""
+	Phasor of the component of "x" at a known "frequency" (in cycles per
+	sample, i.e. f/f_s) using a Hann windowed DFT evaluated only at that
+	frequency, which is O(N).
+
+	When the burst does not contain an integer number of cycles the bin
+	also receives leakage from the negative frequency image and from the
+	offset. These are removed by modelling the signal as
+
+		x[n] = Re(C*exp(j*2*pi*frequency*n)) + V_os
+
+	and solving exactly for C and V_os from the bin and the windowed mean.
+
+	Returns
+	-------
+	C : complex
+		Phasor, i.e. "abs(C)" is the amplitude and "angle(C)" the phase of
+		the cosine.
+	covariance : 2x2 numpy array
+		Covariance of [C.real, C.imag], from the residuals of the model
+		assuming white noise.
+	"""
+	x = np.asarray(x, dtype=float)
+	N = len(x)
+	if N < 4:
+		raise ValueError('At least 4 samples are needed')
+	n = np.arange(N)
+	window = np.hanning(N)
+	rotation = np.exp(-2j*np.pi*frequency*n)
+	# Windowed projections of the data: [Re(bin), Im(bin), mean] = G @ x.
+	G = np.stack((window*rotation.real, window*rotation.imag, window))
+	projections = G @ x
+	# The same projections for the model with C = a + j*b, i.e. a*cos - b*sin + V_os.
+	model = np.stack((rotation.real, rotation.imag, np.ones(N))) # cos, -sin, 1
+	A = G @ model.T
+	A_inv = np.linalg.inv(A)
+	a, b, offset = A_inv @ projections
+	residuals = x - (a*model[0] + b*model[1] + offset)
+	noise_variance = residuals @ residuals/(N-3)
+	covariance = noise_variance*(A_inv @ (G @ G.T) @ A_inv.T)
+	return a + 1j*b, covariance[:2,:2]
+
+def _polar_variances(C, covariance):
+	# Variances of the amplitude and phase of C from the covariance of [Re(C), Im(C)].
+	radial = np.array([C.real, C.imag])/np.abs(C)
+	tangential = np.array([-C.imag, C.real])/np.abs(C)
+	return radial @ covariance @ radial, tangential @ covariance @ tangential/np.abs(C)**2
+
+def transference(S1, S2, frequency):
+	"""
+	Transference S2/S1 at "frequency" (cycles per sample) using
+	"single_bin_dft" on both signals, assumed independent.
+
+	Returns
+	-------
+	ratio, ratio_std, phi, phi_std : float
+		Amplitude ratio and phase of S2 respect to S1 (positive if S2
+		leads) with their standard deviations.
+	"""
+	C1, covariance1 = single_bin_dft(S1, frequency)
+	C2, covariance2 = single_bin_dft(S2, frequency)
+	T = C2/C1
+	amplitude_variance1, phase_variance1 = _polar_variances(C1, covariance1)
+	amplitude_variance2, phase_variance2 = _polar_variances(C2, covariance2)
+	ratio = np.abs(T)
+	ratio_std = ratio*np.sqrt(amplitude_variance1/np.abs(C1)**2 + amplitude_variance2/np.abs(C2)**2)
+	phi_std = np.sqrt(phase_variance1 + phase_variance2)
+	return ratio, ratio_std, np.angle(T), phi_std
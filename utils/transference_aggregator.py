@@ -0,0 +1,166 @@
+import os
+import numpy as np
+
+from .uncertain_array import uncertain_array
+
+QUANTITIES = ['T_abs', 'T_phi'] # Second axis of the arrays given to "add".
+ACCUMULATORS = ['mean', 'M2', 'W', 'S1', 'S2'] # See "transference_aggregator".
+
+class transference_aggregator:
+	"""
+	Statistics of the transference of many bursts grouped by frequency,
+	updated with each new set of bursts ("add") without going through
+	the previous ones. For each frequency and quantity it keeps the
+	number of bursts "N" and, with "x" the values, "s" their standard
+	deviations and "m" their mean, the accumulators
+
+		mean = m, M2 = sum((x-m)**2),
+		W = sum(s**2), S1 = sum((x-m)*s**2), S2 = sum((x-m)**2*s**2)
+
+	which are merged with the formulas of Welford and Chan et al. (the
+	sums are re-centered when the mean changes), so they are numerically
+	stable and adding the bursts one by one or all at once gives the
+	same result. "result" gives the same values as the mean and "std" of
+	an "uncertain_array" of all the bursts of each frequency. The results
+	added with a timestamp are kept too, so a burst processed again
+	replaces its previous contribution instead of being counted twice.
+
+	Example
+	-------
+	>>> aggregator = transference_aggregator.load('aggregate.npz')
+	>>> aggregator.add(frequencies, values, std_devs, timestamps)
+	>>> aggregator.save('aggregate.npz')
+	>>> frequencies, T_abs, T_phi, number_of_bursts = aggregator.result()
+	"""
+	def __init__(self):
+		self.frequencies = np.zeros(0)
+		self.count = np.zeros(0, dtype=int)
+		self.accumulators = np.zeros((len(ACCUMULATORS), 0, len(QUANTITIES)))
+		self.results = {} # (timestamp, frequency) --> (values, std_devs) of the bursts added with a timestamp.
+
+	@classmethod
+	def load(cls, file_name):
+		"""
+		Loads the state saved by "save", or returns an empty aggregator if
+		the file does not exist or was saved without the results of each
+		burst (then "add" rebuilds it from all the bursts).
+		"""
+		aggregator = cls()
+		if not os.path.isfile(file_name):
+			return aggregator
+		with np.load(file_name) as data:
+			if 'result_values' not in data:
+				return aggregator
+			aggregator.frequencies = data['frequencies']
+			aggregator.count = data['count']
+			aggregator.accumulators = data['accumulators']
+			for timestamp, frequency, values, std_devs in zip(data['result_timestamps'].tolist(), data['result_frequencies'].tolist(), data['result_values'], data['result_std_devs']):
+				aggregator.results[(timestamp, frequency)] = (values, std_devs)
+		return aggregator
+
+	def save(self, file_name):
+		keys = sorted(self.results)
+		results = [self.results[key] for key in keys]
+		temporary_file_name = file_name + '.tmp'
+		with open(temporary_file_name, 'wb') as ofile:
+			np.savez(ofile,
+				frequencies = self.frequencies,
+				count = self.count,
+				accumulators = self.accumulators,
+				result_timestamps = np.array([timestamp for timestamp, _ in keys], dtype=str),
+				result_frequencies = np.array([frequency for _, frequency in keys], dtype=float),
+				result_values = np.array([values for values, _ in results], dtype=float).reshape(len(keys), len(QUANTITIES)),
+				result_std_devs = np.array([std_devs for _, std_devs in results], dtype=float).reshape(len(keys), len(QUANTITIES)),
+			)
+		os.replace(temporary_file_name, file_name)
+
+	def _expanded(self, frequencies, count, accumulators):
+		# Places "count" and "accumulators" (given for "frequencies") in the positions of "self.frequencies".
+		positions = np.searchsorted(self.frequencies, frequencies)
+		expanded_count = np.zeros(len(self.frequencies), dtype=int)
+		expanded_count[positions] = count
+		expanded_accumulators = np.zeros((len(ACCUMULATORS), len(self.frequencies), len(QUANTITIES)))
+		expanded_accumulators[:,positions] = accumulators
+		return expanded_count, expanded_accumulators
+
+	def add(self, frequencies, values, std_devs, timestamps=None):
+		"""
+		Adds the results of some bursts. "frequencies" has one element per
+		result and "values" and "std_devs" one row per result with the
+		QUANTITIES. Results given with a timestamp are remembered by
+		timestamp and frequency: if they were already added they are
+		skipped, and if their values changed (the burst was processed
+		again) the previous contribution is removed and the new one added.
+		Returns the number of results added or replaced.
+		"""
+		frequencies = np.asarray(frequencies, dtype=float)
+		values = np.asarray(values, dtype=float).reshape(len(frequencies), len(QUANTITIES))
+		std_devs = np.asarray(std_devs, dtype=float).reshape(len(frequencies), len(QUANTITIES))
+		if timestamps is not None:
+			changed = np.zeros(len(frequencies), dtype=bool)
+			replaced = [] # (frequency, values, std_devs) of the previous results of the bursts processed again.
+			for k, key in enumerate(zip(timestamps, frequencies.tolist())):
+				previous = self.results.get(key)
+				if previous is not None and np.array_equal(previous[0], values[k], equal_nan=True) and np.array_equal(previous[1], std_devs[k], equal_nan=True):
+					continue
+				if previous is not None:
+					replaced.append((key[1],) + previous)
+				self.results[key] = (values[k].copy(), std_devs[k].copy())
+				changed[k] = True
+			if len(replaced) > 0:
+				replaced_frequencies, replaced_values, replaced_std_devs = zip(*replaced)
+				self._merge(*self._batch(np.array(replaced_frequencies), np.array(replaced_values), np.array(replaced_std_devs)), sign=-1)
+			frequencies, values, std_devs = frequencies[changed], values[changed], std_devs[changed]
+		if len(frequencies) == 0:
+			return 0
+		self._merge(*self._batch(frequencies, values, std_devs))
+		return len(frequencies)
+
+	def _batch(self, frequencies, values, std_devs):
+		# Accumulators of some bursts, all the groups in one pass.
+		group_frequencies, group = np.unique(frequencies, return_inverse=True)
+		count = np.bincount(group, minlength=len(group_frequencies))
+		batch = np.zeros((len(ACCUMULATORS), len(group_frequencies), len(QUANTITIES)))
+		np.add.at(batch[0], group, values)
+		batch[0] /= count[:,None]
+		deviations = values - batch[0][group]
+		variances = std_devs**2
+		for k, terms in enumerate([deviations**2, variances, deviations*variances, deviations**2*variances]):
+			np.add.at(batch[k+1], group, terms)
+		return group_frequencies, count, batch
+
+	def _merge(self, frequencies, count, batch, sign=1):
+		# Merges the accumulators of a batch with the state. With "sign=-1"
+		# the batch is removed: the same formulas hold with the count and
+		# the sums of the batch negated.
+		old_frequencies, old_count, old_accumulators = self.frequencies, self.count, self.accumulators
+		self.frequencies = np.union1d(old_frequencies, frequencies)
+		count_a, (mean_a, M2_a, W_a, S1_a, S2_a) = self._expanded(old_frequencies, old_count, old_accumulators)
+		count_b, (mean_b, M2_b, W_b, S1_b, S2_b) = self._expanded(frequencies, sign*count, batch*np.array([1,sign,sign,sign,sign])[:,None,None])
+		self.count = count_a + count_b
+		fraction_b = np.divide(count_b, self.count, out=np.zeros(len(self.count)), where=self.count != 0)[:,None]
+		delta = mean_b - mean_a
+		mean = mean_a + delta*fraction_b
+		M2 = M2_a + M2_b + delta**2*count_a[:,None]*fraction_b
+		shift_a, shift_b = mean - mean_a, mean - mean_b # Re-center the sums at the new mean.
+		S2 = S2_a - 2*shift_a*S1_a + shift_a**2*W_a + S2_b - 2*shift_b*S1_b + shift_b**2*W_b
+		S1 = S1_a - shift_a*W_a + S1_b - shift_b*W_b
+		self.accumulators = np.stack((mean, M2, W_a + W_b, S1, S2))
+		kept = self.count > 0 # Frequencies whose only bursts were removed.
+		self.frequencies, self.count, self.accumulators = self.frequencies[kept], self.count[kept], self.accumulators[:,kept]
+
+	def result(self):
+		"""
+		Returns the frequencies, the amplitude and phase of the
+		transference as "uncertain_array"s and the number of bursts of
+		each frequency. The uncertainty is the worst case sum of the
+		uncertainty of the mean (propagated from the bursts) and the
+		standard deviation of the bursts with its uncertainty.
+		"""
+		N = self.count[:,None]
+		mean, M2, W, S1, S2 = self.accumulators
+		N_minus_ddof = np.where(N > 1, N - 1, N)
+		std = np.sqrt(M2/N_minus_ddof)
+		std_s = np.divide(np.sqrt(np.maximum(S2, 0))/N_minus_ddof, std, out=np.zeros_like(std), where=std > 0)
+		s = np.sqrt(W)/N + std + std_s
+		return self.frequencies, uncertain_array(mean[:,0], s[:,0]), uncertain_array(mean[:,1], s[:,1]), self.count
@@ -0,0 +1,45 @@
+"""
+Writes the transference of a burst, to its transference file and to the
+results catalog (see "utils/results_catalog.py"). It is shared by the
+processing ("process_data.py") and by the measurement of already
+processed points ("measure_many_frequencies.py" when streaming).
+"""
+from .results_catalog import results_catalog
+
+def save_transference(file_name, T_abs, T_phi, T_phi_s, frequencies=None):
+	"""Writes the transference file "file_name", "T_abs" is a "ufloat".
+	For a multisine burst the arguments are arrays with one element per
+	tone of the given "frequencies", and a row is written for each one."""
+	with open(file_name, 'w') as ofile:
+		if frequencies is None:
+			print('T_abs.n\tT_abs.s\tT_phi.n\tT_phi.s', file=ofile)
+			print(str(T_abs.n) + '\t' + str(T_abs.s) + '\t' + str(T_phi) + '\t' + str(T_phi_s), file=ofile)
+		else:
+			print('frequency\tT_abs.n\tT_abs.s\tT_phi.n\tT_phi.s', file=ofile)
+			for k in range(len(frequencies)):
+				print(str(frequencies[k]) + '\t' + str(T_abs[k].n) + '\t' + str(T_abs[k].s) + '\t' + str(T_phi[k]) + '\t' + str(T_phi_s[k]), file=ofile)
+
+def catalog_transference(catalog_file_name, timestamp, campaign, config, T_abs, T_phi, T_phi_s, frequencies=None, raw_path=None):
+	"""Adds the transference of the burst "timestamp" of "campaign",
+	measured with "config" (see "utils/burst_file.py"), to the results
+	catalog. The arguments are as for "save_transference", all the tones
+	of a multisine burst are added at once."""
+	if frequencies is None:
+		frequencies, T_abs, T_phi, T_phi_s = [config['generator_frequency']], [T_abs], [T_phi], [T_phi_s]
+	catalog = results_catalog(catalog_file_name)
+	catalog.add_many([
+		dict(
+			timestamp = timestamp,
+			campaign = campaign,
+			generator_frequency = frequencies[k],
+			T_abs = T_abs[k].n,
+			T_abs_s = T_abs[k].s,
+			T_phi = T_phi[k],
+			T_phi_s = T_phi_s[k],
+			sampling_frequency = config['sampling_frequency'],
+			generator_amplitude = config.get('generator_amplitude'),
+			number_of_samples = config.get('number_of_samples'),
+			raw_path = raw_path,
+		) for k in range(len(frequencies))
+	])
+	catalog.close()
@@ -0,0 +1,75 @@
+import numpy as np
+from scipy import fftpack
+
+def estimate_lag(a, b, max_lag=None, subsample=False):
+	"""
+	Estimates the lag "L" (in samples) between the signals "a" and "b" so
+	that a[n] corresponds to b[n+L], as the position of the maximum of
+	their cross-correlation computed with FFT.
+
+	Parameters
+	----------
+	a, b : numpy arrays
+		The two signals, e.g. the samples of the two voltmeters.
+	max_lag : int
+		Only lags between -max_lag and max_lag are considered. By default
+		half the length of the signals. For periodic signals it must be
+		less than half the period (see "half_period"), otherwise a phase
+		difference between the signals can make a peak one period away
+		the highest one.
+	subsample : bool
+		If True the lag is refined to a fraction of a sample by fitting a
+		parabola to the correlation around its maximum, and a float is
+		returned.
+
+	Returns
+	-------
+	lag : int or float
+	"""
+	a = np.asarray(a, dtype=float)
+	b = np.asarray(b, dtype=float)
+	a = a - a.mean()
+	b = b - b.mean()
+	if max_lag is None:
+		max_lag = min(len(a), len(b))//2
+	max_lag = min(int(max_lag), len(a)-1, len(b)-1)
+	n_fft = fftpack.next_fast_len(len(a) + len(b) - 1) # Zero padding avoids the circular correlation.
+	correlation = np.fft.irfft(np.conj(np.fft.rfft(a, n_fft))*np.fft.rfft(b, n_fft), n_fft) # correlation[L] = sum(a[n]*b[n+L]), negative L wrap around.
+	lags = np.arange(-max_lag, max_lag+1)
+	correlation = correlation[lags]
+	peak = np.argmax(correlation)
+	lag = lags[peak]
+	if not subsample:
+		return int(lag)
+	if peak == 0 or peak == len(lags)-1:
+		return float(lag)
+	y_left, y_peak, y_right = correlation[peak-1:peak+2]
+	curvature = y_left - 2*y_peak + y_right
+	if curvature == 0:
+		return float(lag)
+	return lag + .5*(y_left - y_right)/curvature
+
+def half_period(frequency):
+	"""
+	Largest lag, in whole samples, shorter than half the period of a 
+	sine of "frequency" (in cycles per sample) or of its alias if it is
+	subsampled, to be used as the "max_lag" of "estimate_lag". Returns 
+	None for a frequency that is a multiple of the sampling frequency.
+	"""
+	alias = abs(frequency - np.round(frequency))
+	if alias == 0:
+		return None
+	return int(np.ceil(.5/alias - 1e-9)) - 1 # The tolerance keeps an exact half period out despite the rounding of "alias".
+
+def align(a, b, lag):
+	"""
+	Returns the parts of "a" and "b" that overlap when a[n] corresponds
+	to b[n+lag] (see "estimate_lag"), such that the returned arrays are
+	aligned sample by sample. "lag" is rounded to an integer. The
+	returned arrays are views, no data is copied.
+	"""
+	lag = int(np.round(lag))
+	length = min(len(a), len(b) - lag) if lag >= 0 else min(len(a) + lag, len(b))
+	if lag >= 0:
+		return a[:length], b[lag:lag+length]
+	return a[-lag:-lag+length], b[:length]
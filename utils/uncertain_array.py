@@ -0,0 +1,155 @@
+import numpy as np
+import uncertainties as unc
+from uncertainties import unumpy as unp
+
+class uncertain_array:
+	"""
+	Array of values with uncertainties stored as two float arrays (the
+	nominal values "n" and the standard deviations "s") instead of a
+	numpy array of "ufloat" objects. Arithmetic is vectorized and errors
+	are propagated to first order assuming the operands are independent.
+	
+	Optionally a covariance matrix (for 1D arrays) can be given. It is
+	kept by indexing and by operations with exact numbers (e.g. scaling
+	or adding an offset) and used by "mean". Any other operation keeps
+	only the standard deviations.
+	
+	Use "to_uarray" to convert to "ufloat"s when reporting results.
+	
+	Example
+	-------
+	>>> V = uncertain_array([1, 2, 3], [.1, .1, .2])
+	>>> (2*V + 1).n
+	array([3., 5., 7.])
+	>>> V.mean().to_uarray()
+	2.00+/-0.08
+	"""
+	__array_ufunc__ = None # Makes numpy arrays defer to the reflected operators below.
+	
+	def __init__(self, nominal_values, std_devs=0, covariance=None):
+		self.n = np.asarray(nominal_values, dtype=float)
+		if covariance is not None:
+			covariance = np.asarray(covariance, dtype=float)
+			if self.n.ndim != 1 or covariance.shape != (len(self.n), len(self.n)):
+				raise ValueError('The covariance matrix must be NxN for a 1D array of N elements')
+			std_devs = np.sqrt(np.diag(covariance))
+		self.s = np.array(np.broadcast_to(np.abs(std_devs), self.n.shape), dtype=float)
+		self.covariance = covariance
+	
+	@classmethod
+	def from_uarray(cls, uarray):
+		"""
+		Creates an "uncertain_array" from a "ufloat" or an array of them.
+		"""
+		return cls(unp.nominal_values(uarray), unp.std_devs(uarray))
+	
+	def to_uarray(self):
+		"""
+		Returns a "ufloat" (for 0 dimensional arrays) or an array of
+		"ufloat"s, correlated if there is a covariance matrix.
+		"""
+		if self.n.ndim == 0:
+			return unc.ufloat(self.n, self.s)
+		if self.covariance is not None:
+			return np.array(unc.correlated_values(self.n, self.covariance))
+		return unp.uarray(self.n, self.s)
+	
+	def __len__(self):
+		return len(self.n)
+	
+	@property
+	def shape(self):
+		return self.n.shape
+	
+	def __getitem__(self, key):
+		covariance = None
+		if self.covariance is not None:
+			indices = np.arange(len(self.n))[key]
+			if np.ndim(indices) == 1:
+				covariance = self.covariance[np.ix_(indices, indices)]
+		return uncertain_array(self.n[key], self.s[key], covariance)
+	
+	def __repr__(self):
+		return 'uncertain_array(' + repr(self.n) + ', ' + repr(self.s) + ')'
+	
+	# Arithmetic -------------------------------------------------------
+	def _scaled(self, n, factor):
+		# Result of a linear operation with an exact number, which keeps the covariance.
+		covariance = None
+		if self.covariance is not None and np.ndim(factor) == 0:
+			covariance = self.covariance*factor**2
+		return uncertain_array(n, self.s*np.abs(factor), covariance)
+	
+	def __neg__(self):
+		return self._scaled(-self.n, -1)
+	
+	def __abs__(self):
+		return uncertain_array(np.abs(self.n), self.s)
+	
+	def __add__(self, other):
+		if other is self:
+			return self*2
+		if isinstance(other, uncertain_array):
+			return uncertain_array(self.n + other.n, np.hypot(self.s, other.s))
+		return self._scaled(self.n + other, 1)
+	
+	def __radd__(self, other):
+		return self + other
+	
+	def __sub__(self, other):
+		if other is self:
+			return uncertain_array(np.zeros(self.shape))
+		if isinstance(other, uncertain_array):
+			return uncertain_array(self.n - other.n, np.hypot(self.s, other.s))
+		return self._scaled(self.n - other, 1)
+	
+	def __rsub__(self, other):
+		return -self + other
+	
+	def __mul__(self, other):
+		if other is self:
+			return self**2
+		if isinstance(other, uncertain_array):
+			return uncertain_array(self.n*other.n, np.hypot(self.s*other.n, other.s*self.n))
+		return self._scaled(self.n*other, other)
+	
+	def __rmul__(self, other):
+		return self*other
+	
+	def __truediv__(self, other):
+		if other is self:
+			return uncertain_array(np.ones(self.shape))
+		if isinstance(other, uncertain_array):
+			n = self.n/other.n
+			return uncertain_array(n, np.hypot(self.s/other.n, other.s*n/other.n))
+		return self._scaled(self.n/other, 1/np.asarray(other, dtype=float))
+	
+	def __rtruediv__(self, other):
+		return uncertain_array(other/self.n, np.abs(other)*self.s/self.n**2)
+	
+	def __pow__(self, exponent):
+		return uncertain_array(self.n**exponent, np.abs(exponent*self.n**(exponent-1))*self.s)
+	
+	def sqrt(self):
+		return self**.5
+	
+	# Reductions -------------------------------------------------------
+	def sum(self):
+		if self.covariance is not None:
+			return uncertain_array(self.n.sum(), np.sqrt(self.covariance.sum()))
+		return uncertain_array(self.n.sum(), np.sqrt(np.sum(self.s**2)))
+	
+	def mean(self):
+		return self.sum()/self.n.size
+	
+	def std(self, ddof=0):
+		"""
+		Standard deviation of the nominal values with its uncertainty
+		propagated from the uncertainties of each element.
+		"""
+		N = self.n.size
+		deviations = self.n - self.n.mean()
+		std = np.sqrt(np.sum(deviations**2)/(N-ddof))
+		if std == 0:
+			return uncertain_array(0)
+		return uncertain_array(std, np.sqrt(np.sum((deviations*self.s)**2))/(N-ddof)/std)